@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+import time
+from threading import Thread
+
+import torch
+from torch.multiprocessing import Process
+
+from damped import utils
+from damped import disturb
+
+import configargparse
+
+
+def get_parser(parser=None):
+    """Get default arguments."""
+    if parser is None:
+        parser = configargparse.ArgumentParser(
+            description="Latency and throughput of the transports (fork_detach -> fork_recv)"
+        )
+
+    parser.add(
+        "--transports",
+        help="The transports to compare",
+        default=["loopback", "gloo", "shm"],
+        type=str,
+        nargs="+",
+    )
+    parser.add(
+        "--shapes",
+        help="B x Tmax x D shapes of the forked features (eproj of the egs)",
+        default=["32x250x1024", "32x250x512"],
+        type=str,
+        nargs="+",
+    )
+    parser.add(
+        "--iterations", help="Number of forks per measure", default=50, type=int
+    )
+    parser.add(
+        "--links",
+        help="Measure the step overhead of the disturb-ed toolkit through simulated"
+        " links <bandwidth Mbit/s>:<latency ms>[:<jitter ms>] (eg: 1000:0.2 100:5:1)",
+        default=[],
+        type=str,
+        nargs="*",
+    )
+    parser.add(
+        "--fork-rate",
+        help="Forks per second of the disturb-ed toolkit (--links, one fork per step)",
+        default=10.0,
+        type=float,
+    )
+    parser.add(
+        "--backward",
+        help="Wait for the gradient of each fork (--links, fork_recv_grad)",
+        default=False,
+        action="store_true",
+    )
+    parser.add(
+        "--port",
+        help="First port used to exchange the tensors",
+        default=29600,
+        type=int,
+    )
+
+    return parser
+
+
+def run(rank, transport, shape, iterations, port):
+    utils.init_distributedenv(rank, port=port, transport=transport)
+    features = torch.rand(shape)
+    label = torch.zeros(shape[0])
+
+    if rank == 1:  # domain task
+        for _ in range(iterations + 1):
+            utils.fork_recv(rank=0)
+            utils.isend(0, torch.zeros(1)).wait()  # ack
+        return
+
+    latencies = []
+    for i in range(iterations + 1):  # the first exchange is a warmup
+        start = time.perf_counter()
+        utils.isend(1, features).wait()
+        utils.isend(1, label).wait()
+        utils.recv(rank=1)  # ack
+        if i > 0:
+            latencies.append(time.perf_counter() - start)
+
+    latencies = torch.tensor(latencies)
+    nbytes = features.numel() * 4
+    print(
+        "{:<6} {:>14} {:>10.3f} {:>10.3f} {:>10.1f}".format(
+            utils.get_transport(1).name,
+            "x".join(map(str, shape)),
+            latencies.median().item() * 1000,
+            latencies.max().item() * 1000,
+            nbytes / latencies.median().item() / 2 ** 20,
+        )
+    )
+
+
+def run_steps(rank, transport, shape, iterations, port, link, rate, backward):
+    utils.init_distributedenv(rank, port=port, transport=transport, throttle=link)
+    features = torch.rand(shape)
+    label = torch.zeros(shape[0])
+
+    if rank == 1:  # domain task
+        send_back_grad = False
+        forks = 0
+        while forks < iterations + 1:
+            recv_features, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            if is_meta_data:
+                send_back_grad = disturb.const.is_wait_backward(meta_data)
+                continue
+            if send_back_grad:
+                utils.isend(0, recv_features).wait()
+            forks += 1
+        return
+
+    # the rest of the step is simulated by a sleep, the overhead is the time
+    # spent forking (and waiting for the previous fork to be sent)
+    task = disturb.DomainTask(name="bench", to_rank=1)
+    req = None
+    overheads = []
+    for i in range(iterations + 1):  # the first step is a warmup
+        start = time.perf_counter()
+        if req is not None:
+            req.wait()
+        if backward:
+            task.fork_recv_grad(features, label)
+        else:
+            req = task.fork_detach(features, label)
+        if i > 0:
+            overheads.append(time.perf_counter() - start)
+        time.sleep(1 / rate)
+    if req is not None:
+        req.wait()
+
+    overheads = torch.tensor(overheads)
+    print(
+        "{:<6} {:>14} {:>16} {:>10.3f} {:>10.3f} {:>8.1f}".format(
+            transport,
+            "x".join(map(str, shape)),
+            link,
+            overheads.median().item() * 1000,
+            overheads.quantile(0.95).item() * 1000,
+            overheads.mean().item() * rate * 100,
+        )
+    )
+
+
+def main_links(args):
+    """Step overhead of the disturb-ed toolkit through simulated links"""
+    print(
+        "{:<6} {:>14} {:>16} {:>10} {:>10} {:>8}".format(
+            "trans", "shape", "link", "p50 (ms)", "p95 (ms)", "% step"
+        )
+    )
+    port = args.port
+    for shape in args.shapes:
+        shape = [int(s) for s in shape.split("x")]
+        for transport in args.transports:
+            for link in args.links:
+                worker = Thread if transport == "loopback" else Process
+                processes = []
+                for rank in range(2):
+                    p = worker(
+                        target=run_steps,
+                        args=(
+                            rank,
+                            transport,
+                            shape,
+                            args.iterations,
+                            port,
+                            link,
+                            args.fork_rate,
+                            args.backward,
+                        ),
+                    )
+                    p.start()
+                    processes.append(p)
+                for p in processes:
+                    p.join()
+                port += 1
+
+
+def main():
+    """Benchmark the transports in between two local processes."""
+    parser = get_parser()
+    args, _ = parser.parse_known_args()
+    if len(args.links) > 0:
+        main_links(args)
+        return
+
+    print(
+        "{:<6} {:>14} {:>10} {:>10} {:>10}".format(
+            "trans", "shape", "p50 (ms)", "max (ms)", "MB/s"
+        )
+    )
+    port = args.port
+    for shape in args.shapes:
+        shape = [int(s) for s in shape.split("x")]
+        for transport in args.transports:
+            # loopback: both nodes are threads of this process (baseline)
+            worker = Thread if transport == "loopback" else Process
+            processes = []
+            for rank in range(2):
+                p = worker(
+                    target=run, args=(rank, transport, shape, args.iterations, port)
+                )
+                p.start()
+                processes.append(p)
+            for p in processes:
+                p.join()
+            port += 1
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import torch
+from damped import utils
+from damped.utils.header import element_size
+
+from sklearn.metrics import accuracy_score
+import kaldiio
+
+import configargparse
+import importlib.util
+
+
+def get_parser(parser=None):
+    """Get default arguments."""
+    if parser is None:
+        parser = configargparse.ArgumentParser(
+            description="Accuracy vs bytes of the wire codecs on a domain branch"
+        )
+
+    parser.add("--config", type=str, help="config file path", required=True)
+    parser.add(
+        "--snapshot",
+        type=str,
+        help="The model parameters to use for eval",
+        required=True,
+    )
+    parser.add(
+        "--store",
+        type=str,
+        help="scp of the features stored by trainer.py (eval_store.scp)",
+        required=True,
+    )
+    parser.add(
+        "--codecs",
+        help="The wire codecs to compare",
+        default=["none", "fp16", "bf16", "int8"],
+        type=str,
+        nargs="+",
+    )
+    parser.add(
+        "--max-utts",
+        help="Number of utterances to evaluate (0: all)",
+        default=0,
+        type=int,
+    )
+    parser.add(
+        "--gpu-device",
+        help="If the node has GPU accelerator, select the GPU to use",
+        required=False,
+        type=int,
+        default=0,
+    )
+
+    return parser
+
+
+def main():
+    """Run the codecs on the stored features and display accuracy vs bytes."""
+    parser = get_parser()
+    args, _ = parser.parse_known_args()
+
+    device = torch.device(
+        f"cuda:{args.gpu_device}" if torch.cuda.is_available() else "cpu"
+    )
+
+    # load the conf
+    spec = importlib.util.spec_from_file_location("config", args.config)
+    config = importlib.util.module_from_spec(spec)
+    config.argsparser = (
+        parser  # Share the configargparse.ArgumentParser with the user defined module
+    )
+    spec.loader.exec_module(config)
+
+    net = config.net.to(device)
+    net.load_state_dict(torch.load(args.snapshot, map_location=device)["model"])
+    net.eval()
+
+    codecs = [utils.get_wire_codec(c) for c in args.codecs]
+    preds = {c.name: [] for c in codecs}
+    nbytes = {c.name: 0 for c in codecs}
+    max_error = {c.name: 0.0 for c in codecs}
+    labels = []
+    frames = 0
+
+    with torch.no_grad():
+        for i, (key, feats) in enumerate(kaldiio.load_scp_sequential(args.store)):
+            if args.max_utts > 0 and i >= args.max_utts:
+                break
+            # keys are saved by trainer.py as 'spk_id_{raw y_mapper label}'
+            y_mapper = torch.tensor(
+                [utils.str_int_encoder.encode(key[len("spk_id_"):])]
+            )
+            labels.append(config.mapper(y_mapper))
+
+            features = torch.tensor(feats, dtype=torch.float32).unsqueeze(0)
+            frames += features.size(1)
+            for codec in codecs:
+                parts, dtypes = codec.encode(features, torch.float32)
+                parts = [p.to(d) for p, d in zip(parts, dtypes)]
+                nbytes[codec.name] += sum(
+                    p.numel() * element_size(d) for p, d in zip(parts, dtypes)
+                )
+                decoded = codec.decode(parts, torch.float32)
+                max_error[codec.name] = max(
+                    max_error[codec.name], (decoded - features).abs().max().item()
+                )
+                y_pred = net(decoded.to(device))
+                preds[codec.name].append(torch.argmax(y_pred, dim=1).cpu())
+
+    labels = torch.cat(labels).numpy()
+    reference = nbytes[codecs[0].name]
+    print(
+        "{:<6} {:>12} {:>8} {:>10} {:>10}".format(
+            "codec", "bytes/frame", "ratio", "accuracy", "max_error"
+        )
+    )
+    for codec in codecs:
+        accuracy = accuracy_score(labels, torch.cat(preds[codec.name]).numpy()) * 100
+        print(
+            "{:<6} {:>12.1f} {:>8.2f} {:>10.3f} {:>10.5f}".format(
+                codec.name,
+                nbytes[codec.name] / max(frames, 1),
+                reference / max(nbytes[codec.name], 1),
+                accuracy,
+                max_error[codec.name],
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
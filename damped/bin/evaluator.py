@@ -2,13 +2,20 @@
 
 import torch
 from damped import utils
-from damped.disturb import const
 
 import configargparse
 import importlib.util
 import os
 
 
+def str_to_bool(value):
+    if value.lower() in {'false', 'f', '0', 'no', 'n'}:
+        return False
+    elif value.lower() in {'true', 't', '1', 'yes', 'y'}:
+        return True
+    raise ValueError(f'{value} is not a valid boolean value')
+
+
 def get_parser(parser=None):
     """Get default arguments."""
     if parser is None:
@@ -19,7 +26,8 @@ def get_parser(parser=None):
         "--task-rank",
         type=int,
         help="The rank of this task (torch.distributed)",
-        required=True,
+        required=False,
+        default=None,
     )
     parser.add(
         "--snapshot",
@@ -51,23 +59,61 @@ def get_parser(parser=None):
     parser.add(
         "--world-size",
         help="The number of expected TOTAL domain task (might be more than one)",
-        required=True,
+        required=False,
+        default=None,
         type=int,
     )
     parser.add(
         "--master-ip",
         help="The ipv4 or ipv6 address of the master node. (The one that was damped.disturb-ed)",
-        required=True,
+        required=False,
+        default="",
+        type=str,
+    )
+    parser.add(
+        "--replay",
+        help="Evaluate on a recording of the forks (see DomainTask.record)"
+        " instead of the master node",
+        default="",
+        required=False,
+        type=str,
+    )
+    parser.add(
+        "--transport",
+        help="Transport used to exchange with the master node [auto, gloo, shm, loopback]"
+        " (loopback: main() runs on a thread of the damped.disturb-ed process)",
+        default=os.getenv("DAMPED_TRANSPORT", "auto"),
+        required=False,
         type=str,
     )
+    parser.add(
+        "--prefetch",
+        help="Number of forks received ahead of their use (overlaps receive and compute)",
+        default=2,
+        required=False,
+        type=int,
+    )
+    parser.add(
+        "--recv-pool",
+        help="Recycle the receive buffers in between batches (reduce allocations)",
+        default=False,
+        const=True,
+        nargs="?",
+        required=False,
+        type=str_to_bool,
+    )
 
     return parser
 
 
-def main():
+def main(argv=None):
     """Run the main training function."""
     parser = get_parser()
-    args, _ = parser.parse_known_args()
+    args, _ = parser.parse_known_args(argv)
+    if not args.replay and (
+        args.task_rank is None or args.world_size is None or not args.master_ip
+    ):
+        parser.error("--task-rank, --world-size and --master-ip are required without --replay")
 
     device = torch.device(
         f"cuda:{args.gpu_device}" if torch.cuda.is_available() else "cpu"
@@ -91,28 +137,34 @@ def main():
     # load the snapshot
     net.load_state_dict(torch.load(args.snapshot, map_location=device)["model"])
 
-    # init the rank of this task
-    utils.init_distributedenv(
-        rank=args.task_rank, world_size=args.world_size, ip=args.master_ip
-    )
+    if args.replay:
+        receiver = utils.ForkReplay(args.replay, dtype=(torch.float32, torch.long))
+    else:
+        # init the rank of this task
+        utils.init_distributedenv(
+            rank=args.task_rank,
+            world_size=args.world_size,
+            ip=args.master_ip,
+            transport=args.transport,
+        )
+
+        recv_pool = utils.BufferPool() if args.recv_pool else None
+        # received in the background while the net is evaluated
+        receiver = utils.ForkReceiver(
+            [0], dtype=(torch.float32, torch.long), prefetch=args.prefetch, pool=recv_pool
+        )
 
     net.eval()
     total_labels = torch.LongTensor([])
     total_pred = torch.LongTensor([])
     with torch.no_grad():
-        while True:
-            features, y_mapper, is_meta_data = utils.fork_recv(
-                rank=0, dtype=(torch.float32, torch.long)
-            )
-
-            if is_meta_data:
-                meta_data = y_mapper
-
-                if const.should_stop(meta_data):
-                    break
+        for item in receiver:
+            if isinstance(item, utils.MetaData):
+                # the iteration ends with the stop signal
+                continue
 
-            target = config.mapper(y_mapper)
-            y_pred = net(features.to(device))
+            target = config.mapper(item.label)
+            y_pred = net(item.features.to(device))
 
             _, predicted = torch.max(y_pred.data, dim=1)
 
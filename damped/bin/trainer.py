@@ -3,7 +3,7 @@
 import torch
 import damped
 from damped import utils
-from damped.disturb import const
+from damped.disturb import const, Topology
 from sklearn.metrics import accuracy_score
 import kaldiio
 
@@ -44,8 +44,9 @@ def get_parser(parser=None):
     parser.add(
         "--task-rank",
         type=int,
-        help="The rank of this task (torch.distributed)",
-        required=True,
+        help="The rank of this task (torch.distributed), computed from --topology if set",
+        required=False,
+        default=None,
     )
     parser.add(
         "--n-checkpoint",
@@ -65,7 +66,8 @@ def get_parser(parser=None):
     )
     parser.add(
         "--resume",
-        help="Resume the training from a checkpoint",
+        help="Resume the training from a checkpoint"
+        " ('last': the last iteration checkpoint of --exp-path, if any)",
         default="",
         nargs="?",
         required=False,
@@ -73,14 +75,47 @@ def get_parser(parser=None):
     )
     parser.add(
         "--world-size",
-        help="The number of expected TOTAL domain task (might be more than one)",
-        required=True,
+        help="The number of expected TOTAL domain task (might be more than one),"
+        " computed from --topology if set",
+        required=False,
+        default=None,
+        type=int,
+    )
+    parser.add(
+        "--topology",
+        help="JSON topology file of the producers/consumers (see damped.disturb.topology)",
+        default=os.getenv("DAMPED_TOPOLOGY", ""),
+        required=False,
+        type=str,
+    )
+    parser.add(
+        "--node",
+        help="Name of the consumer of --topology trained by this task",
+        default="",
+        required=False,
+        type=str,
+    )
+    parser.add(
+        "--node-index",
+        help="Instance of the --node consumer (when the topology has several of them)",
+        default=0,
+        required=False,
         type=int,
     )
     parser.add(
         "--master-ip",
         help="The ipv4 or ipv6 address of the master node. (The one that was damped.disturb-ed)",
-        required=True,
+        required=False,
+        default="",
+        type=str,
+    )
+    parser.add(
+        "--transport",
+        help="Transport used to exchange with the master node [auto, gloo, shm, loopback, elastic]"
+        " (loopback: main() runs on a thread of the damped.disturb-ed process,"
+        " elastic: this trainer can be restarted while the master keeps running)",
+        default=os.getenv("DAMPED_TRANSPORT", "auto"),
+        required=False,
         type=str,
     )
     parser.add(
@@ -101,20 +136,98 @@ def get_parser(parser=None):
     )
     parser.add(
         "--train-mode",
-        help="train_mode [train, trainstore, finetune, ignore]",
+        help="train_mode [train, trainstore, finetune, ignore]"
+        " (finetune: train on a --replay recording, without the master node)",
         default="train",
         nargs="?",
         required=False,
         type=str,
     )
+    parser.add(
+        "--replay",
+        help="Recording of the forks replayed by --train-mode finetune (see DomainTask.record)",
+        default="",
+        required=False,
+        type=str,
+    )
+    parser.add(
+        "--replay-epochs",
+        help="Number of times the --replay recording is replayed",
+        default=1,
+        required=False,
+        type=int,
+    )
+    parser.add(
+        "--replay-shuffle",
+        help="Shuffle the forks of each train/eval phase of the --replay recording",
+        default=False,
+        nargs="?",
+        required=False,
+        type=str_to_bool,
+    )
+    parser.add(
+        "--credits",
+        help="Flow control: max number of forks the disturb-ed toolkit can send ahead (0: unlimited)",
+        default=0,
+        required=False,
+        type=int,
+    )
+    parser.add(
+        "--grad-encoding",
+        help="Encoding of the gradient sent back to the disturb-ed toolkit [none, fp16, bf16, topk, topk:<ratio>]",
+        default="none",
+        required=False,
+        type=str,
+    )
+    parser.add(
+        "--grad-chunk-bytes",
+        help="Send the gradient in chunks of this size, bounds the memory used by large batches (0: not chunked)",
+        default=0,
+        required=False,
+        type=int,
+    )
+    parser.add(
+        "--prefetch",
+        help="Number of forks received ahead of their use (overlaps receive and compute)",
+        default=2,
+        required=False,
+        type=int,
+    )
+    parser.add(
+        "--recv-pool",
+        help="Recycle the receive buffers in between batches (reduce allocations)",
+        default=False,
+        const=True,
+        nargs="?",
+        required=False,
+        type=str_to_bool,
+    )
 
     return parser
 
 
-def main():
+def main(argv=None):
     """Run the main training function."""
     parser = get_parser()
-    args, _ = parser.parse_known_args()
+    args, _ = parser.parse_known_args(argv)
+
+    # ranks of the disturb-ed toolkits sending their forks to this task
+    if args.train_mode == "finetune":
+        if not args.replay:
+            parser.error("--train-mode finetune requires a --replay recording")
+        world = []  # the ranks of the recording
+    elif args.topology:
+        topology = Topology.load(args.topology)
+        node = args.node if args.node else topology.consumers[0].name
+        args.task_rank = topology.rank(node, args.node_index)
+        args.world_size = topology.world_size
+        world = topology.sources(args.task_rank)
+    elif args.task_rank is None or args.world_size is None:
+        parser.error("--task-rank and --world-size are required without --topology")
+    else:
+        world = list(range(1, args.world_size)) if args.task_rank == 0 else [0]
+    if args.train_mode != "finetune" and not args.master_ip:
+        parser.error("--master-ip is required (except with --train-mode finetune)")
 
     print("Train mode:", args.train_mode, flush=True)
 
@@ -156,95 +269,91 @@ def main():
     monitor.set_optimizer(optimizer)
     monitor.save_model_summary()
 
+    if args.resume == "last":
+        # restarted trainer (elastic transport)
+        args.resume = monitor.last_checkpoint()
     if args.resume:
         print("resumed from %s" % args.resume, flush=True)
         # load last checkpoint
         monitor.load_checkpoint(args.resume, args.load_optimizer)
 
     # Eval related
-    eval_mode = False
     total_labels = torch.LongTensor([])
     total_pred = torch.LongTensor([])
     loss_batches = 0
     loss_batches_count = 0
 
-    # indicate if damped.disturb-ed toolkit wants the gradient form the DomainTask
-    send_backward_grad = False
+    recv_pool = utils.BufferPool() if args.recv_pool else None
+    grad_codec = utils.get_wire_codec(args.grad_encoding)  # fail early if unknown
 
     # init the rank of this task
     if args.train_mode != "finetune":
         utils.init_distributedenv(
-            rank=args.task_rank, world_size=args.world_size, ip=args.master_ip
+            rank=args.task_rank,
+            world_size=args.world_size,
+            ip=args.master_ip,
+            transport=args.transport,
+            credits=args.credits,
         )
 
     print("Training started on %s" % time.strftime("%d-%m-%Y %H:%M"), flush=True)
 
     # TODO(pchampio) refactor this training loop into sub-functions
-    i = 0
-    world = list(range(1, args.world_size))
     has_performd_backward = False
-    train_store = None
-    eval_store = None
     if args.train_mode == "finetune":
-        print("NOT IMPLEMENTED!", flush=True)
-        quit(1)
-        #  f = os.path.join(monitor.save_path, ("trainstore.pt"))
-        #  train_store = torch.load(f)
-        #  f = os.path.join(monitor.save_path, ("evalstore.pt"))
-        #  eval_store = torch.load(f)
-
-    while True:
-        i+=1
-
-        domain_task_id_index = i % len(world)
-        domain_task_id = world[domain_task_id_index]
-
-        if args.train_mode == "finetune":
-
-            is_meta_data = False
-            features = train_store["features"][(i-1) % len(train_store["features"])]
-            y_mapper = train_store["target"][(i-1) % len(train_store["target"])]
-
-        else:
-            if args.task_rank == 0:
-                features, y_mapper, is_meta_data = utils.fork_recv(
-                    rank=domain_task_id, dtype=(torch.float32, torch.long)
-                )
+        # the forks recorded by the disturb-ed toolkits, read at disk speed
+        receiver = utils.ForkReplay(
+            args.replay,
+            dtype=(torch.float32, torch.long),
+            shuffle=args.replay_shuffle,
+            epochs=args.replay_epochs,
+        )
+        world = receiver.ranks
+    else:
+        # received in the background while the net is trained
+        receiver = utils.ForkReceiver(
+            world,
+            dtype=(torch.float32, torch.long),
+            prefetch=args.prefetch,
+            pool=recv_pool,
+            credits=args.credits > 0,
+        )
 
-            else:
-                features, y_mapper, is_meta_data = utils.fork_recv(
-                    rank=0, dtype=(torch.float32, torch.long)
-                )
+    # eval/train mode of each disturb-ed toolkit
+    eval_modes = {rank: False for rank in world}
+    # indicate if damped.disturb-ed toolkit wants the gradient form the DomainTask
+    send_backward_grad = {rank: False for rank in world}
+    # data reduction applied by each disturb-ed toolkit (DomainTask.reducer)
+    reducers = {}
 
-        if is_meta_data:
-            meta_data = y_mapper
+    for item in receiver:
+        if isinstance(item, utils.MetaData):
+            meta_data = item.meta_data
 
             if const.should_stop(meta_data):
-                print(f"worker: {domain_task_id} stopped", flush=True)
-                world.pop(domain_task_id_index)
-                if len(world) == 0:
-                    monitor.save_models()
-                    break
+                print(f"worker: {item.rank} stopped", flush=True)
 
             if const.is_no_wait_backward(meta_data):
-                print("Switch to NOT sending backward gradient", flush=True)
-                send_backward_grad = False
+                print(f"worker: {item.rank} switch to NOT sending backward gradient", flush=True)
+                send_backward_grad[item.rank] = False
+                continue
 
             if const.is_wait_backward(meta_data):
-                print("Switch to sending backward gradient", flush=True)
-                send_backward_grad = True
+                print(f"worker: {item.rank} switch to sending backward gradient", flush=True)
+                send_backward_grad[item.rank] = True
+                continue
 
-            last_eval = eval_mode
-            eval_mode = const.is_eval(meta_data)
+            # the evaluation lasts as long as one of the workers evaluates
+            last_eval = any(eval_modes.values())
+            eval_modes[item.rank] = const.is_eval(meta_data)
+            eval_mode = any(eval_modes.values())
 
             # detect changes from train to eval
             if eval_mode and not last_eval:
                 print("Running evaluation on dev..", flush=True)
-                net.eval()
 
             # detect changes from eval to train
             if not eval_mode and last_eval:
-                net.train()
                 # display validation metics
                 accuracy = (
                     accuracy_score(
@@ -257,6 +366,8 @@ def main():
                 if loss_batches_count != 0:
                     loss = loss_batches / loss_batches_count
 
+                # the accuracy obtained on the (reduced) features of each worker
+                print(f"Validation reducers: {reducers}", flush=True)
                 monitor.update_dev_scores(
                     [
                         utils.Metric("acc", accuracy),
@@ -281,6 +392,19 @@ def main():
             # When meta_data is shared, no features/label are sent
             continue
 
+        features, y_mapper = item.features, item.label
+        eval_mode = eval_modes[item.rank]
+
+        if item.rank not in reducers:
+            reducers[item.rank] = (
+                utils.peer_reducer(item.rank) if args.train_mode != "finetune" else "none"
+            )
+            print(f"worker: {item.rank} reducer: {reducers[item.rank]}", flush=True)
+            monitor.tensorboard_writter.add_text(
+                f"/recv/worker_{item.rank}/reducer", reducers[item.rank], monitor.uctr
+            )
+        net.train(not eval_mode)
+
         if args.train_mode == "ignore":
             continue
 
@@ -291,20 +415,20 @@ def main():
         input.requires_grad = True
 
         if args.train_mode == "trainstore" and not eval_mode:
-            for f, t in zip(features.cpu().numpy(), config.mapper(y_mapper, raw=True)):
+            for f, t in zip(features.detach().cpu().numpy(), config.mapper(y_mapper, raw=True)):
                 kaldiio.save_ark(os.path.join(monitor.save_path, ("train_store.ark")), {f'spk_id_{t}': f}, append=True, compression_method=1, scp=os.path.join(monitor.save_path, ("train_store.scp")))
 
         # Eval
         if eval_mode:
-            for f, t in zip(features.cpu().numpy(), config.mapper(y_mapper, raw=True)):
+            for f, t in zip(features.detach().cpu().numpy(), config.mapper(y_mapper, raw=True)):
                 kaldiio.save_ark(os.path.join(monitor.save_path, ("eval_store.ark")), {f'spk_id_{t}': f}, append=True, compression_method=1, scp=os.path.join(monitor.save_path, ("eval_store.scp")))
 
             y_pred = net(input)
 
             # send back the gradient if needed
-            if send_backward_grad:
-                # backward will not be applied (eval), send 0 grad
-                damped.disturb.DomainTask._isend(0, torch.zeros(*input.size())).wait()
+            if send_backward_grad[item.rank]:
+                # backward will not be applied (eval), send 0 grad (header only)
+                utils.isend_zeros(item.rank, input.size()).wait()
 
             _, predicted = torch.max(y_pred.data, dim=1)
 
@@ -329,9 +453,14 @@ def main():
         loss.backward()
         has_performd_backward = True
 
-        # send back the gradient if asked
-        if send_backward_grad:
-            damped.disturb.DomainTask._isend(0, input.grad.data.cpu()).wait()
+        # send back the gradient if asked (to the worker that sent the fork)
+        if send_backward_grad[item.rank]:
+            utils.isend(
+                item.rank,
+                input.grad.data.cpu(),
+                codec=grad_codec,
+                chunk_bytes=args.grad_chunk_bytes,
+            ).wait()
 
         optimizer.step()
 
@@ -358,7 +487,20 @@ def main():
             )
             total_correct = 0
             total_target = 0
+            if recv_pool is not None:
+                print(recv_pool, flush=True)
+            for rank, (forks, mb) in receiver.throughput().items():
+                print(
+                    f"worker: {rank} throughput: {forks:.2f} forks/s {mb:.2f} MB/s"
+                    f" reducer: {reducers.get(rank, 'none')}",
+                    flush=True,
+                )
+                monitor.tensorboard_writter.add_scalar(
+                    f"/recv/worker_{rank}/forks_per_second", forks, monitor.uctr
+                )
 
+    # every disturb-ed toolkit has stopped
+    monitor.save_models()
     print("Training finished on %s" % time.strftime("%d-%m-%Y %H:%M"))
 
 
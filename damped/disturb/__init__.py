@@ -1,5 +1,9 @@
 from .domain_task import DomainTask
+from .domain_task_group import DomainTaskGroup
+from .domain_task_replicas import DomainTaskReplicas
 from .disturb import init, stop, eval, train
+from .topology import Topology, TopologyNode, get_topology
+from .reducer import Reducer, get_reducer
 from .domain_y_mapper import DomainLabelMapper
 from .metricsmonitor import MetricsMonitor
 
@@ -16,6 +20,13 @@ __all__ = [
     "eval",
     "train",
     "DomainTask",
+    "DomainTaskGroup",
+    "DomainTaskReplicas",
+    "Topology",
+    "TopologyNode",
+    "get_topology",
+    "Reducer",
+    "get_reducer",
     "DomainLabelMapper",
     "MetricsMonitor",
 ]
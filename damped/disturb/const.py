@@ -10,6 +10,9 @@ constants used to send meta-data about existing toolkit and domain-tasks
  # not used
  # not used
 ]
+
+Meta-data are sent with damped.utils.send_meta_data (carried by the header of
+the wire format, see damped.utils.header).
 """
 
 
@@ -1,13 +1,16 @@
 #!/usr/bin/env python
 
 import os
+from typing import List
+
 from damped import utils
+from damped.utils.context import get_context
+from damped.utils.control import wait_control_fetched
 from damped.utils import log_handler
 from .managed_service import ManagedMemory
 from .const import stop_signal, eval_signal, train_signal
-
-import torch
-import torch.distributed as dist
+from .domain_task import flush_domain_tasks, record_meta_data, set_dataset_mode
+from .topology import Topology, get_topology, set_topology
 
 import logging
 from damped.utils import log_handler
@@ -23,7 +26,11 @@ def init(
     #  rank=int(os.getenv("CUDA_VISIBLE_DEVICES", 0)) + 1,
     rank=0,
     all_to_one = False,
-    expected_domain_tasks=int(os.getenv("DAMPED_N_DOMAIN", 1)), port=29500
+    expected_domain_tasks=int(os.getenv("DAMPED_N_DOMAIN", 1)), port=29500,
+    transport=os.getenv("DAMPED_TRANSPORT", "auto"),
+    topology=os.getenv("DAMPED_TOPOLOGY"),
+    node=os.getenv("DAMPED_NODE"),
+    index=int(os.getenv("DAMPED_NODE_INDEX", 0)),
 ) -> None:
     """Initialize the damped distributed environment
 
@@ -43,11 +50,34 @@ def init(
     Args:
         expected_domain_tasks (int): The number of expected domain task.
         port (int): port on which the the tensor will be exchanged
+        transport (str): "auto" (shared memory with same-host domain tasks),
+            "gloo", "shm" or "elastic" (the domain task trainers can join
+            late and be restarted, see damped.utils.init_distributedenv)
+        topology (str or Topology, optional): JSON topology file (see
+            damped.disturb.topology), replaces rank/all_to_one/expected_domain_tasks:
+            the rank, the world size and the destinations of the
+            stop/eval/train signals are computed from the topology.
+        node (str, optional): name of the producer of the topology (default:
+            the first one)
+        index (int): instance of the producer (eg: rank of the process in a
+            data-parallel master)
     """
     logger.info("Waiting for domain-task trainer connection")
-    if all_to_one and rank == 0:
-        rank=int(os.getenv("CUDA_VISIBLE_DEVICES", 0)) + 1
-    utils.init_distributedenv(rank, world_size=expected_domain_tasks + 1, port=port)
+    if topology is not None:
+        topology = set_topology(topology)
+        if node is None:
+            node = topology.producers[0].name
+        rank = topology.rank(node, index)
+        world_size = topology.world_size
+    else:
+        world_size = expected_domain_tasks + 1
+        if all_to_one and rank == 0:
+            # one master per GPU
+            index = int(os.getenv("CUDA_VISIBLE_DEVICES", 0))
+            rank = Topology.all_to_one(expected_domain_tasks).rank("master", index)
+    utils.init_distributedenv(
+        rank, world_size=world_size, port=port, transport=transport
+    )
 
     # init ManagedMemory
     ManagedMemory()
@@ -58,23 +88,21 @@ def stop(domain_tasks=int(os.getenv("DAMPED_N_DOMAIN", 1)), all_to_one=False) ->
     Send a stop signal to all domain tasks
 
     Args:
-        domain_tasks (int): the number of domain_tasks used
+        domain_tasks (int): the number of domain_tasks used (ignored if
+            damped.disturb.init loaded a topology)
 
     """
     logger.info(f"Stop the domain tasks")
-    if all_to_one:
-        t=0
-        dist.send(
-            torch.tensor(-1, dtype=torch.int), dst=t
-        )  # indicate for meta-data exchange
-        dist.send(stop_signal(), dst=t)
-        return
-
-    for t in range(1, domain_tasks + 1):
-        dist.send(
-            torch.tensor(-1, dtype=torch.int), dst=t
-        )  # indicate for meta-data exchange
-        dist.send(stop_signal(), dst=t)
+    flush_domain_tasks()
+    ranks = _destinations(domain_tasks, all_to_one)
+    record_meta_data(stop_signal(), ranks)
+    # sent to all the domain tasks in parallel
+    utils.broadcast_meta_data(ranks, stop_signal())
+    if get_context().rank == 0:
+        # the stop signal is read from the store hosted by this node
+        for rank in ranks:
+            if utils.get_transport(rank).available and not wait_control_fetched(rank):
+                logger.warning(f"Domain task {rank} did not receive the stop signal")
 
 
 
@@ -84,22 +112,17 @@ def eval(domain_tasks=int(os.getenv("DAMPED_N_DOMAIN", 1)), all_to_one = False)
     Put the trainer into evaluation mode
 
     Args:
-        domain_tasks (int): the number of domain_tasks used
+        domain_tasks (int): the number of domain_tasks used (ignored if
+            damped.disturb.init loaded a topology)
     """
     logger.info(f"Evaluating on dev the domain tasks")
-    if all_to_one:
-        t=0
-        dist.send(
-            torch.tensor(-1, dtype=torch.int), dst=t
-        )  # indicate for meta-data exchange
-        dist.send(eval_signal(), dst=t)
-        return
-
-    for t in range(1, domain_tasks + 1):
-        dist.send(
-            torch.tensor(-1, dtype=torch.int), dst=t
-        )  # indicate for meta-data exchange
-        dist.send(eval_signal(), dst=t)
+    flush_domain_tasks()
+    set_dataset_mode(eval_signal())
+    ranks = _destinations(domain_tasks, all_to_one)
+    record_meta_data(eval_signal(), ranks)
+    # carried by the next message sent to each domain task
+    for rank in ranks:
+        utils.update_control(rank, eval_signal())
 
 
 def train(domain_tasks=int(os.getenv("DAMPED_N_DOMAIN", 1)), all_to_one = False) -> None:
@@ -107,19 +130,24 @@ def train(domain_tasks=int(os.getenv("DAMPED_N_DOMAIN", 1)), all_to_one = False)
     Put the trainer into training mode
 
     Args:
-        domain_tasks (int): the number of domain_tasks used
+        domain_tasks (int): the number of domain_tasks used (ignored if
+            damped.disturb.init loaded a topology)
     """
     logger.info(f"Train on the domain tasks")
+    flush_domain_tasks()
+    set_dataset_mode(train_signal())
+    ranks = _destinations(domain_tasks, all_to_one)
+    record_meta_data(train_signal(), ranks)
+    # carried by the next message sent to each domain task
+    for rank in ranks:
+        utils.update_control(rank, train_signal())
+
+
+def _destinations(domain_tasks: int, all_to_one: bool) -> List[int]:
+    """Ranks of the domain tasks fed by this node"""
+    topology = get_topology()
+    if topology is not None:
+        return topology.destinations(get_context().rank)
     if all_to_one:
-        t=0
-        dist.send(
-            torch.tensor(-1, dtype=torch.int), dst=t
-        )  # indicate for meta-data exchange
-        dist.send(train_signal(), dst=t)
-        return
-
-    for t in range(1, domain_tasks + 1):
-        dist.send(
-            torch.tensor(-1, dtype=torch.int), dst=t
-        )  # indicate for meta-data exchange
-        dist.send(train_signal(), dst=t)
+        return [0]
+    return list(range(1, domain_tasks + 1))
@@ -1,20 +1,30 @@
 from dataclasses import dataclass
-from typing import Tuple, Optional
+from collections import deque
+from typing import Callable, Deque, List, Tuple, Optional
+import asyncio
+import concurrent.futures
+import queue
 import time
-from threading import Lock
+from threading import Lock, Thread
 import os
+import weakref
 
 import torch
 import datetime
-import torch.distributed as dist
 
 import damped
 
 import logging
 from damped.utils import log_handler
 
-from .const import wait_backward, no_wait_backward
+from damped.utils.context import get_context, set_context
+from damped.utils.header import element_size
+from damped.utils.receiver import ASYNC_POLL_INTERVAL
+
+from .const import wait_backward, no_wait_backward, is_eval
 from .managed_service import ManagedMemory
+from .reducer import get_reducer
+from .topology import get_topology
 
 logger = logging.getLogger(__name__)
 logger.propagate = False
@@ -23,6 +33,67 @@ logger.addHandler(log_handler)
 
 INTERVAL_LOG_WAIT_TIME = 4000
 
+# DomainTask with a background sender (see DomainTask.queue_depth)
+_async_domain_tasks: List[weakref.ref] = []
+
+# DomainTask recording their forks (see DomainTask.record)
+_recording_domain_tasks: List[weakref.ref] = []
+
+# last train/eval signal sent to the domain tasks (replayed to the ones that
+# (re)join, see DomainTask.absent_forks)
+_dataset_mode: Optional[torch.Tensor] = None
+
+
+def set_dataset_mode(meta_data: torch.Tensor) -> None:
+    global _dataset_mode
+    _dataset_mode = meta_data
+
+
+def record_meta_data(meta_data: torch.Tensor, ranks: List[int]) -> None:
+    """Record a signal sent to the domain tasks in their recordings
+
+    Args:
+        meta_data (torch.Tensor): the damped.disturb.const signal
+        ranks (List[int]): the domain tasks the signal is sent to
+    """
+    recorders = []  # shared by the domain tasks recording to the same path
+    for ref in list(_recording_domain_tasks):
+        task = ref()
+        if task is None:
+            _recording_domain_tasks.remove(ref)
+            continue
+        if task.to_rank in ranks and task._recorder not in recorders:
+            recorders.append(task._recorder)
+            task._recorder.record_meta_data(meta_data)
+
+
+def is_routed(to_rank: int) -> bool:
+    """Whether this node feeds the domain task ``to_rank`` (forks to the other
+    domain tasks are ignored)"""
+    topology = get_topology()
+    if topology is not None:
+        return to_rank in topology.destinations(get_context().rank)
+    return int(os.getenv("DAMPED_N_DOMAIN", 1)) >= to_rank
+
+
+def flush_domain_tasks(rank: Optional[int] = None) -> None:
+    """Wait until the DomainTask background senders have sent their queued
+    forks
+
+    Must be called before sending anything else to a domain task rank, to
+    preserve the ordering of the messages.
+
+    Args:
+        rank (int, optional): only flush the DomainTask sending to this rank
+    """
+    for ref in list(_async_domain_tasks):
+        task = ref()
+        if task is None:
+            _async_domain_tasks.remove(ref)
+            continue
+        if rank is None or task.to_rank == rank:
+            task.flush()
+
 
 @dataclass
 class DomainTask(object):
@@ -39,15 +110,247 @@ class DomainTask(object):
         >>> disturb.init(expected_domain_tasks=1)  # one task ('speaker_identificaion')
         >>> task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
         >>> task.isend(torch.zeros((3,3)))
+
+    With ``fused=True``, ``fork_detach`` packs the label and the features into
+    a single contiguous buffer sent as one message (instead of two transfers
+    and a synchronous round trip).
+
+    With ``queue_depth > 0``, ``fork_detach`` enqueues the forks in a bounded
+    queue drained by a dedicated sender thread and returns at once.
+    When the queue is full, ``queue_policy`` selects whether the caller
+    blocks ("block") or the fork is dropped ("drop").
+    The forked tensors must not be modified in place until the returned
+    request is completed.
+
+    ``codec`` selects the encoding of the features on the wire ("fp16",
+    "bf16" or per-channel affine "int8", see damped.utils.codec), fork_recv
+    decodes them back to the requested dtype. Labels are always sent as is.
+
+    When the length of each sequence is given to ``fork_detach`` (or
+    ``fork_recv_grad``), only the valid frames are sent, the bytes that were
+    not sent are counted in ``padding_bytes_saved``.
+
+    When the domain task trainer grants credits (trainer.py ``--credits``),
+    each fork consumes a credit. Once there are none left, ``credit_policy``
+    selects whether ``fork_detach`` blocks until the trainer grants more
+    ("block"), drops the fork ("drop"), or only sends one fork every
+    ``credit_subsample`` forks and drops the others ("subsample").
+    Dropped and delayed forks are counted in ``dropped_forks`` and
+    ``delayed_forks`` (``credit_wait_time`` seconds spent waiting).
+
+    With the "elastic" transport (see damped.utils.init_distributedenv), the
+    forks are skipped while the domain task trainer is absent (counted in
+    ``absent_forks``), and ``fork_recv_grad`` returns a null gradient. A
+    trainer that (re)joins receives the next fork.
+
+    ``reducer`` reduces the hidden tensor before sending it ("subsample:k",
+    "meanpool:w" or "projection:d[:seed]", see damped.disturb.reducer), the
+    bytes that were not sent are counted in ``reduction_bytes_saved``, the
+    reduction is displayed by the domain task trainer. The gradients
+    received by ``fork_recv_grad`` are mapped back to the hidden tensor.
+
+    With ``chunk_bytes``, the features are sent in chunks of about
+    chunk_bytes bytes, converted and sent in a pipeline, and reassembled in
+    place by fork_recv: the memory used by very large batches is bounded by
+    the chunk size (see damped.utils.isend). The label is then sent on its
+    own (``fused`` is ignored).
+
+    The asyncio API (``fork_async`` and ``fork_recv_grad_async``) runs the
+    blocking part of the forks on a single thread per DomainTask, the
+    sending is then awaited without blocking the event loop (the futures of
+    the sender thread with ``queue_depth > 0``, or a polling of the request).
+
+    With ``grad_deadline`` (seconds, or the ``deadline`` of a call),
+    ``fork_recv_grad`` stops waiting for a stalled domain task trainer once
+    the deadline expires and returns the ``grad_fallback`` gradient: zeros
+    ("zero"), or the last gradient received scaled by s ("last" or
+    "last:<s>"). The late gradient is received in the background and
+    discarded, the next ones are still matched with their fork. The missed
+    deadlines are counted in ``grad_deadline_misses``, the late gradients
+    discarded in ``late_grads``.
+
+    With ``record``, the forks sent (and the stop/eval/train signals) are
+    also appended to a recording (see damped.utils.ForkRecorder), replayed
+    by trainer.py ``--train-mode finetune --replay``.
     """
 
     name: str
     to_rank: int
+    # send label and features in one message (fork_detach)
+    fused: bool = False
+    # max number of forks waiting for the sender thread (0: no sender thread)
+    queue_depth: int = 0
+    # "block" or "drop" when the queue is full
+    queue_policy: str = "block"
+    # wire encoding of the features ("none", "fp16", "bf16", "int8")
+    codec: str = "none"
+    # "block", "drop" or "subsample" when the trainer granted no credit
+    credit_policy: str = "block"
+    # with "subsample", one fork out of credit_subsample waits for a credit
+    credit_subsample: int = 4
+    # path of the recording of the forks ("": no recording)
+    record: str = ""
+    # reduction of the features ("none", "subsample:k", "meanpool:w", "projection:d")
+    reducer: str = "none"
+    # size of the chunks the features are sent in (0: not chunked)
+    chunk_bytes: int = 0
+    # seconds fork_recv_grad waits for the gradient (0: no deadline)
+    grad_deadline: float = 0.0
+    # gradient once the deadline expired ("zero", "last" or "last:<scale>")
+    grad_fallback: str = "zero"
 
     def __post_init__(self):
         self._mutex_fork = Lock()  # for fork_detach
         self._mutex_fork_backward = Lock()  # for fork_recv_grad
         self._send_back_grad = False
+        self._mutex_grad = Lock()  # for the gradients received
+        self._pending_grads: Deque[PendingGrad] = deque()
+        self._mutex_missed = Lock()  # for the gradients past their deadline
+        self._grad_jobs: queue.Queue = queue.Queue()
+        self._grad_receiver: Optional[Thread] = None
+        self._last_grad: Optional[torch.Tensor] = None
+        self._fallback_scale = _parse_grad_fallback(self.grad_fallback)
+        self.grad_deadline_misses = 0
+        self.late_grads = 0
+
+        assert self.queue_policy in ("block", "drop"), (
+            f"Unknown queue_policy '{self.queue_policy}'"
+        )
+        assert self.credit_policy in ("block", "drop", "subsample"), (
+            f"Unknown credit_policy '{self.credit_policy}'"
+        )
+        damped.utils.get_wire_codec(self.codec)  # fail early on unknown codec
+        self._reducer = get_reducer(self.reducer)
+        self._reducer_published = False
+        self.reduction_bytes_saved = 0
+        self.dropped_forks = 0
+        self.delayed_forks = 0
+        self.credit_wait_time = 0.0
+        self.padding_bytes_saved = 0
+        self.absent_forks = 0
+        self._generation = 0  # of the connection with the trainer
+        self._credits = damped.utils.CreditGate(self.to_rank)
+        self._skipped_forks = 0  # forks dropped since the last sent one
+        self._queue: Optional[queue.Queue] = None
+        self._sender: Optional[Thread] = None
+        if self.queue_depth > 0:
+            self._queue = queue.Queue(maxsize=self.queue_depth)
+            _async_domain_tasks.append(weakref.ref(self))
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._recorder: Optional[damped.utils.ForkRecorder] = None
+        if self.record:
+            self._recorder = damped.utils.get_recorder(self.record)
+            _recording_domain_tasks.append(weakref.ref(self))
+
+    @property
+    def queue_size(self) -> int:
+        """The number of forks waiting for the sender thread"""
+        if self._queue is None:
+            return 0
+        return self._queue.qsize()
+
+    def flush(self) -> None:
+        """Blocks until every queued fork has been sent"""
+        if self._queue is not None:
+            self._queue.join()
+
+    def _send_loop(self, context):
+        # sends on behalf of the node that started the thread
+        set_context(context, thread=True)
+        while True:
+            job, future = self._queue.get()
+            try:
+                req = job()
+                if req is not None:
+                    req.wait()
+                future.set_result(None)
+            except BaseException as e:
+                logger.error(f"DomainTask '{self.name}' failed to send a fork: {e}")
+                future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    def _enqueue(self, job: Callable, policy: str) -> Optional["_ForkFuture"]:
+        """Queue a job for the sender thread
+
+        Args:
+            job (Callable): the blocking part of the fork
+            policy (str): when the queue is full, "block" or "drop" the job
+
+        Returns:
+            the future of the job, None if the job was dropped
+        """
+        # started lazily (the DomainTask might be created before a fork())
+        if self._sender is None or not self._sender.is_alive():
+            self._sender = Thread(
+                target=self._send_loop,
+                args=(get_context(),),
+                name=f"damped-sender-{self.name}",
+                daemon=True,
+            )
+            self._sender.start()
+
+        future = _ForkFuture()
+        if policy == "drop":
+            try:
+                self._queue.put_nowait((job, future))
+            except queue.Full:
+                self.dropped_forks += 1
+                return None
+        else:
+            self._queue.put((job, future))
+        return future
+
+    def _run_async(self, call: Callable):
+        """Run a blocking call on the thread of the asyncio API"""
+        # started lazily (the DomainTask might be created before a fork())
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix=f"damped-async-{self.name}",
+                initializer=set_context,
+                initargs=(get_context(), True),
+            )
+        return asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    def _available(self) -> bool:
+        """Whether the domain task trainer is connected (elastic transport)"""
+        transport = damped.utils.get_transport(self.to_rank)
+        if not transport.available:
+            self.absent_forks += 1
+            return False
+        if transport.generation != self._generation:
+            # a new trainer joined: it does not expect gradients to send back
+            self._generation = transport.generation
+            self._send_back_grad = False
+            if _dataset_mode is not None and is_eval(_dataset_mode):
+                damped.utils.update_control(self.to_rank, _dataset_mode)
+        return True
+
+    def _acquire_credit(self, policy: str) -> bool:
+        """Consume a credit granted by the domain task trainer
+
+        Returns:
+            bool: False if the fork must be dropped
+        """
+        if self._credits.try_acquire():
+            self._skipped_forks = 0
+            return True
+
+        if policy == "drop" or (
+            policy == "subsample"
+            and (self._skipped_forks + 1) % self.credit_subsample != 0
+        ):
+            self._skipped_forks += 1
+            self.dropped_forks += 1
+            return False
+
+        start_time = time.time()
+        self._credits.acquire()
+        self.credit_wait_time += time.time() - start_time
+        self.delayed_forks += 1
+        self._skipped_forks = 0
+        return True
 
     def fork_recv_grad(
         self,
@@ -57,6 +360,8 @@ class DomainTask(object):
             torch.float32,
             torch.float32,
         ),
+        lengths: Optional[torch.Tensor] = None,
+        deadline: Optional[float] = None,
     ):
         """Sends a tensor for a DomainTask (the same way fork_detach works).
         But wait for the backward gradient from the DomainTask.
@@ -69,6 +374,10 @@ class DomainTask(object):
             dtype (Tuple(torch.dtype, torch.dtype), optional): the desired data
                 type of sent tensor. The first dtype if for the feature, the
                 second if for the label.
+            lengths (torch.Tensor, optional): length of each sequence of the
+                (B x Tmax x D) hidden_tensor, the padding is not sent.
+            deadline (float, optional): seconds to wait for the gradient
+                (default: grad_deadline)
 
         https://discuss.pytorch.org/t/distributed-model-parallelism/10377/2
 
@@ -76,25 +385,213 @@ class DomainTask(object):
             The hidden_tensor.grad.data processed by the DomainTask() trainer.py
         """
 
-        if int(os.getenv("DAMPED_N_DOMAIN", 1)) < self.to_rank:
+        if not is_routed(self.to_rank):
             return work(None)
+        return self.fork_recv_grad_deferred(
+            hidden_tensor, domain_label, dtype, lengths
+        ).wait(deadline)
 
+    def fork_recv_grad_deferred(
+        self,
+        hidden_tensor: torch.Tensor,
+        domain_label: torch.Tensor,
+        dtype: Optional[Tuple[torch.dtype, torch.dtype]] = (
+            torch.float32,
+            torch.float32,
+        ),
+        lengths: Optional[torch.Tensor] = None,
+    ) -> "PendingGrad":
+        """Sends a tensor for a DomainTask (the same way fork_recv_grad works),
+        the backward gradient is received later (see damped.nets.RemoteBranch).
+
+        The gradients are received in the order of the forks, several forks
+        can wait for their gradient.
+
+        Returns:
+            PendingGrad: call ``wait()`` to get the hidden_tensor.grad.data
+            processed by the DomainTask() trainer.py
+        """
+        if not is_routed(self.to_rank):
+            return PendingGrad(grad=torch.zeros_like(hidden_tensor))
         with self._mutex_fork_backward:
+            with self._mutex_fork:
+                available = self._available()
+            if not available:
+                return PendingGrad(grad=torch.zeros_like(hidden_tensor))
+            # the meta-data must be sent after the queued forks
+            self.flush()
             if not self._send_back_grad:
-                dist.send(
-                    torch.tensor(-1, dtype=torch.int), dst=self.to_rank
-                )  # indicate for meta-data exchange
-                dist.send(wait_backward(), dst=self.to_rank)
+                damped.utils.update_control(self.to_rank, wait_backward())
             self._send_back_grad = (
                 False  # for fork_detach don't notify meta-data (fake)
             )
-            req = self.fork_detach(hidden_tensor, domain_label, dtype=dtype)
+            pending = PendingGrad(
+                self, hidden_tensor.size(), hidden_tensor.dtype, self._generation
+            )
+            if self._reducer.name != "none":
+                # the gradient is mapped back through the reducer
+                x = hidden_tensor.detach().requires_grad_()
+                with torch.enable_grad():
+                    y, lengths = self._reduce(x, lengths, dtype)
+                pending.reduced = (x, y)
+                hidden_tensor = y.detach()
+            # the gradient is expected, never dropped
+            req = self._fork_detach(
+                hidden_tensor,
+                domain_label,
+                dtype,
+                lengths,
+                credit_policy="block",
+                queue_policy="block",
+                reduced=True,
+            )
             self._send_back_grad = True
+            self._pending_grads.append(pending)
             req.wait()
-
+            return pending
+
+    def _wait_grad(
+        self, pending: "PendingGrad", deadline: Optional[float] = None
+    ) -> torch.Tensor:
+        """Receive the gradients up to the one of ``pending``"""
+        if deadline is None:
+            deadline = self.grad_deadline
+        if deadline <= 0:
+            self._recv_grads(pending)
+            return pending.grad
+
+        # received on a background thread, that keeps draining the stream once
+        # the deadline expired (daemon: a stalled trainer does not block the exit)
+        if self._grad_receiver is None or not self._grad_receiver.is_alive():
+            self._grad_receiver = Thread(
+                target=self._recv_grad_loop,
+                args=(get_context(),),
+                name=f"damped-grad-{self.name}",
+                daemon=True,
+            )
+            self._grad_receiver.start()
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        self._grad_jobs.put((pending, future))
+        try:
+            future.result(timeout=deadline)
+        except concurrent.futures.TimeoutError:
+            with self._mutex_missed:
+                if pending.grad is None:
+                    pending.missed = True
+                    pending.grad = self._fallback_grad(pending)
+                    self.grad_deadline_misses += 1
+        return pending.grad
+
+    def _recv_grad_loop(self, context):
+        # receives on behalf of the node that started the thread
+        set_context(context, thread=True)
+        while True:
+            pending, future = self._grad_jobs.get()
+            try:
+                self._recv_grads(pending)
+                future.set_result(None)
+            except BaseException as e:
+                future.set_exception(e)
+
+    def _recv_grads(self, pending: "PendingGrad") -> None:
+        """Receive the gradients in the order of the forks, up to ``pending``"""
+        with self._mutex_grad:
+            while not pending.received:
+                first = self._pending_grads.popleft()
+                grad = self._recv_grad(first)
+                with self._mutex_missed:
+                    first.received = True
+                    if first.missed:
+                        self.late_grads += 1  # discarded
+                        continue
+                    first.grad = grad
+                    self._last_grad = grad
+
+    def _fallback_grad(self, pending: "PendingGrad") -> torch.Tensor:
+        last = self._last_grad
+        scale = self._fallback_scale
+        if scale is None or last is None or last.size() != pending.size:
+            return torch.zeros(pending.size, dtype=pending.dtype)
+        return last.to(pending.dtype) * scale
+
+    def _recv_grad(self, pending: "PendingGrad") -> torch.Tensor:
+        try:
+            transport = damped.utils.get_transport(self.to_rank)
+            if not transport.available or transport.generation != pending.generation:
+                raise ConnectionError(f"rank {self.to_rank} left")
             recv_buff, meta_data = damped.utils.recv(rank=self.to_rank)
-            assert not meta_data, "fork_recv_grad is not expected to receive meta_data"
-            return recv_buff
+        except ConnectionError as e:
+            logger.warning(f"DomainTask '{self.name}': no gradient received ({e})")
+            return torch.zeros(pending.size, dtype=pending.dtype)
+        assert not meta_data, "fork_recv_grad is not expected to receive meta_data"
+        if pending.missed:
+            pending.reduced = None
+            return recv_buff  # discarded
+        if pending.reduced is not None:
+            x, y = pending.reduced
+            pending.reduced = None
+            recv_buff = torch.autograd.grad(y, x, recv_buff.to(y.dtype))[0]
+        return recv_buff
+
+    def _reduce(
+        self,
+        hidden_tensor: torch.Tensor,
+        lengths: Optional[torch.Tensor],
+        dtype: Tuple[torch.dtype, torch.dtype],
+    ):
+        """Apply the reducer to the hidden tensor"""
+        reduced, lengths = self._reducer.reduce(hidden_tensor, lengths)
+        saved = hidden_tensor.numel() - reduced.numel()
+        self.reduction_bytes_saved += saved * element_size(dtype[0])
+        if not self._reducer_published:
+            ratio = reduced.numel() / max(hidden_tensor.numel(), 1)
+            damped.utils.publish_reducer(
+                self.to_rank, f"{self._reducer} ({ratio:.1%} of the features sent)"
+            )
+            self._reducer_published = True
+        return reduced, lengths
+
+    async def fork_recv_grad_async(
+        self,
+        hidden_tensor: torch.Tensor,
+        domain_label: torch.Tensor,
+        dtype: Optional[Tuple[torch.dtype, torch.dtype]] = (
+            torch.float32,
+            torch.float32,
+        ),
+        lengths: Optional[torch.Tensor] = None,
+        deadline: Optional[float] = None,
+    ):
+        """asyncio version of fork_recv_grad
+
+        Returns:
+            The hidden_tensor.grad.data processed by the DomainTask() trainer.py
+        """
+        return await self._run_async(
+            lambda: self.fork_recv_grad(
+                hidden_tensor, domain_label, dtype, lengths, deadline
+            )
+        )
+
+    async def fork_async(
+        self,
+        hidden_tensor: torch.Tensor,
+        domain_label: torch.Tensor,
+        dtype: Optional[Tuple[torch.dtype, torch.dtype]] = (
+            torch.float32,
+            torch.float32,
+        ),
+        lengths: Optional[torch.Tensor] = None,
+    ) -> None:
+        """asyncio version of fork_detach, returns once the fork is sent
+
+        Example::
+            >>> await asyncio.gather(*[task.fork_async(h, y) for h, y in batches])
+        """
+        req = await self._run_async(
+            lambda: self.fork_detach(hidden_tensor, domain_label, dtype, lengths)
+        )
+        await req.wait_async()
 
     def fork_detach(
         self,
@@ -104,6 +601,7 @@ class DomainTask(object):
             torch.float32,
             torch.float32,
         ),
+        lengths: Optional[torch.Tensor] = None,
     ):
         """Sends a tensor with a target label for a DomainTask trainer to learn
 
@@ -115,30 +613,108 @@ class DomainTask(object):
             dtype (Tuple(torch.dtype, torch.dtype), optional): the desired data
                 type of sent tensor. The first dtype if for the feature, the
                 second if for the label.
+            lengths (torch.Tensor, optional): length of each sequence of the
+                (B x Tmax x D) hidden_tensor, the padding is not sent.
 
         Returns:
             A distributed request object. (call ``wait()`` to block the process
             until the operation is finished)
         """
+        return self._fork_detach(
+            hidden_tensor, domain_label, dtype, lengths, self.credit_policy
+        )
+
+    def _fork_detach(
+        self,
+        hidden_tensor: torch.Tensor,
+        domain_label: torch.Tensor,
+        dtype: Tuple[torch.dtype, torch.dtype],
+        lengths: Optional[torch.Tensor],
+        credit_policy: str,
+        queue_policy: Optional[str] = None,
+        reduced: bool = False,
+    ):
         ManagedMemory().call_number.value += 1
         start_time = time.time()
 
-        if int(os.getenv("DAMPED_N_DOMAIN", 1)) < self.to_rank:
+        if not is_routed(self.to_rank):
             return work(None)
 
         with self._mutex_fork:
-            if self._send_back_grad:
-                dist.send(
-                    torch.tensor(-1, dtype=torch.int), dst=self.to_rank
-                )  # indicate for meta-data exchange
-                dist.send(no_wait_backward(), dst=self.to_rank)
-                self._send_back_grad = False
-            self.isend(domain_label, dtype=dtype[1]).wait()
-            req = self.isend(hidden_tensor, dtype=dtype[0])
+            if not self._available() or not self._acquire_credit(credit_policy):
+                ManagedMemory().wait_time.value += time.time() - start_time
+                return work(None)
+            notify_no_wait = self._send_back_grad
+            self._send_back_grad = False
+            if self._queue is not None:
+                future = self._enqueue(
+                    lambda: self._fork_send(
+                        hidden_tensor, domain_label, dtype, notify_no_wait, lengths, reduced
+                    ),
+                    queue_policy or self.queue_policy,
+                )
+                if future is None:
+                    # dropped, the meta-data will be sent with the next fork
+                    self._send_back_grad = notify_no_wait
+                ManagedMemory().wait_time.value += time.time() - start_time
+                return work(future)
+
+            req = self._fork_send(
+                hidden_tensor, domain_label, dtype, notify_no_wait, lengths, reduced
+            )
 
         ManagedMemory().wait_time.value += time.time() - start_time
         return work(req)
 
+    def _fork_send(
+        self,
+        hidden_tensor: torch.Tensor,
+        domain_label: torch.Tensor,
+        dtype: Tuple[torch.dtype, torch.dtype],
+        notify_no_wait: bool,
+        lengths: Optional[torch.Tensor] = None,
+        reduced: bool = False,
+    ):
+        """Sends a fork (the blocking part of fork_detach)"""
+        if not reduced and self._reducer.name != "none":
+            with torch.no_grad():
+                hidden_tensor, lengths = self._reduce(hidden_tensor, lengths, dtype)
+        if self._recorder is not None:
+            self._recorder.record_fork(hidden_tensor, domain_label, dtype, lengths)
+        if notify_no_wait:
+            damped.utils.update_control(self.to_rank, no_wait_backward())
+
+        if damped.utils.peer_wire_version(self.to_rank) == 1:
+            lengths = None  # not supported by legacy peers
+        if lengths is not None:
+            lengths = torch.as_tensor(lengths, dtype=torch.int64)
+            frame_numel = int(torch.tensor(hidden_tensor.size()[2:]).prod())
+            padding = hidden_tensor.numel() - frame_numel * int(lengths.sum())
+            self.padding_bytes_saved += padding * element_size(dtype[0])
+
+        if (
+            self.fused
+            and self.chunk_bytes <= 0
+            and damped.utils.peer_wire_version(self.to_rank) > 1
+        ):
+            return damped.utils.isend_fused(
+                self.to_rank,
+                domain_label,
+                hidden_tensor,
+                dtype=dtype,
+                codec=self.codec,
+                lengths=lengths,
+            )
+        self.isend(domain_label, dtype=dtype[1]).wait()
+        return damped.utils.isend(
+            self.to_rank,
+            hidden_tensor,
+            dtype=dtype[0],
+            codec=self.codec,
+            lengths=lengths,
+            chunk_bytes=self.chunk_bytes,
+        )
+
     def isend(self, tensor: torch.Tensor, dtype: torch.dtype = torch.float32):
         """Sends a tensor asynchronously.
 
@@ -169,14 +745,75 @@ class DomainTask(object):
         if tensor.is_cuda:
             logger.error("isend only support tensor that are allocated on the CPU!")
 
-        shape = tensor.size()
-        #  share the number of dimensions in the tensor (3 in B x Tmax x D)
-        dist.send(torch.tensor(len(shape), dtype=torch.int), dst=dst)
-        # send the tensor shape for correct a memory allocation on the worker side
-        # can be (B x Tmax x D)
-        dist.send(torch.tensor(shape, dtype=torch.int), dst=dst)
-        req = dist.isend(tensor.to(dtype), dst=dst)
-        return req
+        return damped.utils.isend(dst, tensor, dtype=dtype)
+
+
+def _parse_grad_fallback(fallback: str) -> Optional[float]:
+    """Scale of the last gradient of a grad_fallback (None: zeros)"""
+    name, *params = fallback.split(":")
+    try:
+        if name == "zero" and len(params) == 0:
+            return None
+        if name == "last" and len(params) <= 1:
+            return float(params[0]) if params else 1.0
+    except ValueError:
+        pass
+    raise ValueError(
+        f"Unknown grad_fallback '{fallback}' (available: zero, last, last:<scale>)"
+    )
+
+
+class PendingGrad(object):
+    """
+    Gradient of a fork sent with DomainTask.fork_recv_grad_deferred.
+    """
+
+    def __init__(
+        self,
+        task: Optional[DomainTask] = None,
+        size: torch.Size = torch.Size(),
+        dtype: torch.dtype = torch.float32,
+        generation: int = 0,
+        grad: Optional[torch.Tensor] = None,
+    ):
+        self.task = task
+        # (hidden tensor, reduced tensor) the gradient is mapped back through
+        self.reduced: Optional[Tuple[torch.Tensor, torch.Tensor]] = None
+        self.size = size
+        self.dtype = dtype
+        # of the connection with the trainer expected to send the gradient
+        self.generation = generation
+        self.grad = grad
+        # received from the trainer (or drained, once missed)
+        self.received = False
+        # the deadline expired, the gradient is the fallback one
+        self.missed = False
+
+    def wait(self, deadline: Optional[float] = None) -> torch.Tensor:
+        """
+        Waits until the gradient is received. Blocking operation.
+
+        Args:
+            deadline (float, optional): seconds to wait for the gradient
+                (default: DomainTask.grad_deadline)
+        """
+        if self.grad is None:
+            self.task._wait_grad(self, deadline)
+        return self.grad
+
+
+class _ForkFuture(concurrent.futures.Future):
+    """
+    Future of a fork queued for a DomainTask sender thread.
+    Exposes the same ``wait()`` as torch.distributed.Work.
+    """
+
+    def wait(self):
+        self.result()
+        return True
+
+    def is_completed(self):
+        return self.done()
 
 
 class work(object):
@@ -190,6 +827,25 @@ class work(object):
     def __init__(self, work: Optional[torch.distributed.Work]):
         self._work = work
 
+    def is_completed(self) -> bool:
+        """
+        Checks if the request is completed. Non-blocking operation.
+        """
+        return self._work is None or self._work.is_completed()
+
+    async def wait_async(self):
+        """
+        Waits until request completes without blocking the asyncio event loop.
+        """
+        if self._work is None:
+            return True
+        if isinstance(self._work, concurrent.futures.Future):
+            await asyncio.wrap_future(self._work)
+            return True
+        while not self._work.is_completed():
+            await asyncio.sleep(ASYNC_POLL_INTERVAL)
+        return self._work.wait()  # raises the failure of the request
+
     def wait(self):
         """
         Waits until request completes. Blocking operation.
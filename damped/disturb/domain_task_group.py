@@ -0,0 +1,234 @@
+from contextlib import ExitStack
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from threading import Lock
+import concurrent.futures
+import time
+
+import torch
+
+import damped
+
+from damped.utils.context import get_context, set_context
+
+from .const import no_wait_backward, wait_backward
+from .domain_task import DomainTask, PendingGrad, flush_domain_tasks, is_routed, work
+from .managed_service import ManagedMemory
+
+
+@dataclass
+class DomainTaskGroup(object):
+    """
+    Group of domain tasks fed with the same hidden tensor.
+
+    ``fork_detach`` converts and frames the tensor once, then sends it
+    concurrently to every rank of the group (instead of one full transfer
+    per DomainTask, one after the other).
+
+    Example::
+        >>> from damped import disturb
+        >>> disturb.init(expected_domain_tasks=3)
+        >>> group = disturb.DomainTaskGroup(name="branches", to_ranks=[1, 2, 3])
+        >>> group.fork_detach(hidden_tensor, domain_label).wait()
+
+    ``fork_recv_grad`` sends the tensor the same way and waits for the
+    gradient of every rank concurrently: it returns the sum of the gradients
+    weighted by ``grad_weights`` (one weight per rank, default: 1), the
+    latency is the one of the slowest rank. With ``grad_deadline`` (see
+    DomainTask), a stalled rank contributes its ``grad_fallback`` gradient.
+
+    Each rank of the group is also reachable through its own DomainTask
+    (``group.tasks``).
+    """
+
+    name: str
+    to_ranks: List[int]
+    # send label and features in one message (fork_detach)
+    fused: bool = False
+    # wire encoding of the features ("none", "fp16", "bf16", "int8")
+    codec: str = "none"
+    # "block", "drop" or "subsample" when a trainer granted no credit
+    credit_policy: str = "block"
+    # weight of the gradient of each rank (fork_recv_grad)
+    grad_weights: Optional[List[float]] = None
+    # seconds fork_recv_grad waits for the gradients (0: no deadline)
+    grad_deadline: float = 0.0
+    # gradient of a rank past the deadline ("zero", "last" or "last:<scale>")
+    grad_fallback: str = "zero"
+
+    def __post_init__(self):
+        if self.grad_weights is None:
+            self.grad_weights = [1.0] * len(self.to_ranks)
+        assert len(self.grad_weights) == len(self.to_ranks), (
+            "DomainTaskGroup needs one grad_weights per rank"
+        )
+        self._mutex_fork = Lock()
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self.tasks = [
+            DomainTask(
+                name=f"{self.name}/{rank}",
+                to_rank=rank,
+                fused=self.fused,
+                codec=self.codec,
+                credit_policy=self.credit_policy,
+                grad_deadline=self.grad_deadline,
+                grad_fallback=self.grad_fallback,
+            )
+            for rank in self.to_ranks
+        ]
+
+    def fork_detach(
+        self,
+        hidden_tensor: torch.Tensor,
+        domain_label: torch.Tensor,
+        dtype: Optional[Tuple[torch.dtype, torch.dtype]] = (
+            torch.float32,
+            torch.float32,
+        ),
+        lengths: Optional[torch.Tensor] = None,
+    ):
+        """Sends a tensor with a target label to every domain task of the group
+
+        Args:
+            hidden_tensor (torch.Tensor): tensor of features
+            domain_label (torch.Tensor): tensor of y label
+            dtype (Tuple(torch.dtype, torch.dtype), optional): the desired data
+                type of sent tensor. The first dtype if for the feature, the
+                second if for the label.
+            lengths (torch.Tensor, optional): length of each sequence of the
+                (B x Tmax x D) hidden_tensor, the padding is not sent.
+
+        Returns:
+            A distributed request object. (call ``wait()`` to block the process
+            until the operation is finished on all the ranks)
+        """
+        ManagedMemory().call_number.value += 1
+        start_time = time.time()
+
+        tasks = [t for t in self.tasks if is_routed(t.to_rank)]
+        with self._mutex_fork, ExitStack() as stack:
+            for task in tasks:
+                stack.enter_context(task._mutex_fork)
+            req, _ = self._fork(
+                tasks, hidden_tensor, domain_label, dtype, lengths, self.credit_policy
+            )
+
+        ManagedMemory().wait_time.value += time.time() - start_time
+        return work(req)
+
+    def fork_recv_grad(
+        self,
+        hidden_tensor: torch.Tensor,
+        domain_label: torch.Tensor,
+        dtype: Optional[Tuple[torch.dtype, torch.dtype]] = (
+            torch.float32,
+            torch.float32,
+        ),
+        lengths: Optional[torch.Tensor] = None,
+        deadline: Optional[float] = None,
+    ):
+        """Sends a tensor to every domain task of the group (the same way
+        fork_detach works), and wait for their backward gradients
+
+        Args:
+            deadline (float, optional): seconds to wait for the gradients
+                (default: grad_deadline)
+
+        Returns:
+            The sum of the hidden_tensor.grad.data processed by each
+            DomainTask() trainer.py, weighted by ``grad_weights``
+        """
+        tasks = [t for t in self.tasks if is_routed(t.to_rank)]
+        if len(tasks) == 0:
+            return work(None)
+
+        with self._mutex_fork, ExitStack() as stack:
+            for task in tasks:
+                stack.enter_context(task._mutex_fork_backward)
+                stack.enter_context(task._mutex_fork)
+            # the gradient is expected, never dropped
+            req, tasks = self._fork(
+                tasks, hidden_tensor, domain_label, dtype, lengths, "block", True
+            )
+            pending = {}
+            for task in tasks:
+                task._send_back_grad = True
+                pending[task.to_rank] = PendingGrad(
+                    task, hidden_tensor.size(), hidden_tensor.dtype, task._generation
+                )
+                task._pending_grads.append(pending[task.to_rank])
+            if req is not None:
+                req.wait()
+
+        weights = dict(zip(self.to_ranks, self.grad_weights))
+        grad = torch.zeros_like(hidden_tensor)
+        # summed as they arrive
+        futures = {
+            self._run(lambda p=p: p.wait(deadline)): rank for rank, p in pending.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            grad += weights[futures[future]] * future.result().to(grad.dtype)
+        return grad
+
+    def _run(self, call) -> concurrent.futures.Future:
+        """Run a blocking call on the threads waiting for the gradients"""
+        # started lazily (the group might be created before a fork())
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(self.to_ranks),
+                thread_name_prefix=f"damped-grad-{self.name}",
+                initializer=set_context,
+                initargs=(get_context(), True),
+            )
+        return self._executor.submit(call)
+
+    def _fork(
+        self,
+        tasks: List[DomainTask],
+        hidden_tensor: torch.Tensor,
+        domain_label: torch.Tensor,
+        dtype: Tuple[torch.dtype, torch.dtype],
+        lengths: Optional[torch.Tensor],
+        credit_policy: str,
+        backward: bool = False,
+    ):
+        """Sends a fork to the tasks (their mutexes are held)
+
+        Returns:
+            the request of the sending (None if nothing was sent), and the
+            tasks the fork was sent to
+        """
+        # ranks absent or without credit (flow control) might skip this fork
+        tasks = [t for t in tasks if t._available()]
+        tasks = [t for t in tasks if t._acquire_credit(credit_policy)]
+        ranks = [t.to_rank for t in tasks]
+        if len(ranks) == 0:
+            return None, tasks
+        for rank in ranks:
+            flush_domain_tasks(rank)
+
+        # ranks that must switch to sending back the gradient, or that were
+        # sending it back (fork_recv_grad)
+        notify = [t.to_rank for t in tasks if t._send_back_grad != backward]
+        for task in tasks:
+            task._send_back_grad = False
+        for rank in notify:
+            damped.utils.update_control(
+                rank, wait_backward() if backward else no_wait_backward()
+            )
+
+        if self.fused:
+            req = damped.utils.ibroadcast_fused(
+                ranks,
+                domain_label,
+                hidden_tensor,
+                dtype=dtype,
+                codec=self.codec,
+                lengths=lengths,
+            )
+        else:
+            damped.utils.ibroadcast(ranks, domain_label, dtype=dtype[1]).wait()
+            req = damped.utils.ibroadcast(
+                ranks, hidden_tensor, dtype=dtype[0], codec=self.codec, lengths=lengths
+            )
+        return req, tasks
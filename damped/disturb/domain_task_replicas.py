@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from threading import Lock
+
+import torch
+
+from damped.utils import get_transport
+
+from .domain_task import DomainTask, is_routed, work
+
+
+@dataclass
+class DomainTaskReplicas(object):
+    """
+    Domain task trained by several replicas (ranks running the same branch
+    config): each fork is sent to a single replica.
+
+    ``dispatch`` selects the replica of a fork: "round_robin", or
+    "least_outstanding" (the replica with the fewest forks in flight, the
+    replicas without flow control credit come last). With ``queue_depth > 0``
+    each replica has its own sender thread, a slow replica then does not
+    block the forks dispatched to the others.
+
+    Example::
+        >>> from damped import disturb
+        >>> disturb.init(expected_domain_tasks=3)
+        >>> task = disturb.DomainTaskReplicas(name="spk", to_ranks=[1, 2, 3])
+        >>> task.fork_detach(hidden_tensor, domain_label)
+
+    The stop/eval/train signals of damped.disturb are sent to every replica.
+    The replicas train their own copy of the branch, the forks sent to each
+    replica are counted in ``dispatched_forks``.
+    """
+
+    name: str
+    to_ranks: List[int]
+    # "round_robin" or "least_outstanding"
+    dispatch: str = "round_robin"
+    # send label and features in one message (fork_detach)
+    fused: bool = False
+    # max number of forks waiting for the sender thread of each replica
+    queue_depth: int = 0
+    # wire encoding of the features ("none", "fp16", "bf16", "int8")
+    codec: str = "none"
+    # "block", "drop" or "subsample" when a replica granted no credit
+    credit_policy: str = "block"
+
+    def __post_init__(self):
+        assert self.dispatch in ("round_robin", "least_outstanding"), (
+            f"Unknown dispatch '{self.dispatch}'"
+        )
+        assert len(self.to_ranks) > 0, "DomainTaskReplicas without replica"
+        self._mutex_dispatch = Lock()
+        self._next = 0
+        # forks sent to each replica not completed yet
+        self._in_flight: Dict[int, List[work]] = {r: [] for r in self.to_ranks}
+        self.dispatched_forks: Dict[int, int] = {r: 0 for r in self.to_ranks}
+        self.tasks = [
+            DomainTask(
+                name=f"{self.name}/{rank}",
+                to_rank=rank,
+                fused=self.fused,
+                queue_depth=self.queue_depth,
+                codec=self.codec,
+                credit_policy=self.credit_policy,
+            )
+            for rank in self.to_ranks
+        ]
+
+    def outstanding(self, rank: int) -> int:
+        """The number of forks sent to a replica that are not completed yet"""
+        in_flight = [w for w in self._in_flight[rank] if not w.is_completed()]
+        self._in_flight[rank] = in_flight
+        return len(in_flight)
+
+    def _select(self) -> Optional[DomainTask]:
+        # absent replicas (elastic transport) are skipped
+        tasks = [
+            t
+            for t in self.tasks
+            if is_routed(t.to_rank) and get_transport(t.to_rank).available
+        ]
+        if len(tasks) == 0:
+            return None
+
+        # ties are broken round-robin
+        start = self._next % len(tasks)
+        self._next += 1
+        tasks = tasks[start:] + tasks[:start]
+        if self.dispatch == "least_outstanding":
+            task = min(
+                tasks,
+                key=lambda t: (
+                    t._credits.enabled is True and t._credits.available <= 0,
+                    self.outstanding(t.to_rank) + t.queue_size,
+                ),
+            )
+        else:
+            task = tasks[0]
+        self.dispatched_forks[task.to_rank] += 1
+        return task
+
+    def _dispatch(self, fork) -> work:
+        with self._mutex_dispatch:
+            task = self._select()
+        if task is None:
+            return work(None)
+        req = fork(task)
+        with self._mutex_dispatch:
+            self._in_flight[task.to_rank].append(req)
+        return req
+
+    def fork_detach(
+        self,
+        hidden_tensor: torch.Tensor,
+        domain_label: torch.Tensor,
+        dtype: Optional[Tuple[torch.dtype, torch.dtype]] = (
+            torch.float32,
+            torch.float32,
+        ),
+        lengths: Optional[torch.Tensor] = None,
+    ):
+        """Sends a tensor with a target label to one of the replicas (see
+        DomainTask.fork_detach)
+
+        Returns:
+            A distributed request object. (call ``wait()`` to block the process
+            until the operation is finished)
+        """
+        return self._dispatch(
+            lambda task: task.fork_detach(hidden_tensor, domain_label, dtype, lengths)
+        )
+
+    def fork_recv_grad(
+        self,
+        hidden_tensor: torch.Tensor,
+        domain_label: torch.Tensor,
+        dtype: Optional[Tuple[torch.dtype, torch.dtype]] = (
+            torch.float32,
+            torch.float32,
+        ),
+        lengths: Optional[torch.Tensor] = None,
+    ):
+        """Sends a tensor to one of the replicas and wait for its backward
+        gradient (see DomainTask.fork_recv_grad)
+
+        Returns:
+            The hidden_tensor.grad.data processed by the replica
+        """
+        grad = []
+
+        def fork(task):
+            grad.append(
+                task.fork_recv_grad(hidden_tensor, domain_label, dtype, lengths)
+            )
+            return work(None)
+
+        self._dispatch(fork)
+        if len(grad) == 0:
+            return work(None)
+        return grad[0]
@@ -0,0 +1,147 @@
+from typing import Dict, Optional, Tuple, Union
+import math
+
+import torch
+
+"""
+Data reduction of the hidden tensors, applied by a DomainTask before sending
+them (see DomainTask.reducer). Named "<reducer>:<parameters>":
+  subsample:k          one frame out of k
+  meanpool:w           mean of each window of w frames
+  projection:d[:seed]  fixed random projection of the last dimension to d
+
+The gradients received by fork_recv_grad are computed by the domain task
+trainer with respect to the reduced tensor, they are mapped back to the
+hidden tensor (autograd through the reducer).
+"""
+
+
+class Reducer(object):
+    """
+    No reduction (the hidden tensor is sent as is).
+    """
+
+    name = "none"
+
+    def reduce(
+        self, tensor: torch.Tensor, lengths: Optional[torch.Tensor] = None
+    ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
+        """Reduce a batch of padded sequences
+
+        Args:
+            tensor (torch.Tensor): the hidden tensor (B x Tmax x ...)
+            lengths (torch.Tensor, optional): length of each sequence (B)
+
+        Returns:
+            Tuple(torch.Tensor, torch.Tensor): the reduced tensor and the
+            length of its sequences
+        """
+        return tensor, lengths
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class Subsample(Reducer):
+    """Keeps one frame out of ``k`` (the first of each window)"""
+
+    name = "subsample"
+
+    def __init__(self, k: int):
+        assert k > 0, "subsample needs a positive k"
+        self.k = k
+
+    def reduce(self, tensor, lengths=None):
+        if lengths is not None:
+            lengths = (torch.as_tensor(lengths, dtype=torch.int64) + self.k - 1) // self.k
+        return tensor[:, :: self.k], lengths
+
+    def __str__(self):
+        return f"{self.name}:{self.k}"
+
+
+class MeanPool(Reducer):
+    """Mean of each window of ``window`` frames (the padding is excluded)"""
+
+    name = "meanpool"
+
+    def __init__(self, window: int):
+        assert window > 0, "meanpool needs a positive window"
+        self.window = window
+
+    def reduce(self, tensor, lengths=None):
+        batch, tmax, rest = tensor.size(0), tensor.size(1), list(tensor.size()[2:])
+        windows = math.ceil(tmax / self.window)
+        valid = torch.full((batch,), tmax, dtype=torch.int64)
+        if lengths is not None:
+            valid = torch.as_tensor(lengths, dtype=torch.int64)
+        mask = torch.arange(windows * self.window).unsqueeze(0) < valid.unsqueeze(1)
+        padded = torch.cat(
+            [tensor, tensor.new_zeros([batch, windows * self.window - tmax] + rest)], 1
+        )
+        mask = mask.view([batch, windows, self.window] + [1] * len(rest))
+        sums = (padded.view([batch, windows, self.window] + rest) * mask).sum(2)
+        counts = mask.sum(2).clamp(min=1).to(sums.dtype)
+        if lengths is not None:
+            lengths = (valid + self.window - 1) // self.window
+        return sums / counts, lengths
+
+    def __str__(self):
+        return f"{self.name}:{self.window}"
+
+
+class RandomProjection(Reducer):
+    """
+    Projection of the last dimension (D) to ``dim`` with a fixed Gaussian
+    matrix generated from ``seed``: the domain task trainer can rebuild it
+    (``matrix(D)``) to invert the projection, or learn on the projected
+    features.
+    """
+
+    name = "projection"
+
+    def __init__(self, dim: int, seed: int = 0):
+        assert dim > 0, "projection needs a positive dimension"
+        self.dim = dim
+        self.seed = seed
+        self._matrices: Dict[int, torch.Tensor] = {}
+
+    def matrix(self, in_dim: int) -> torch.Tensor:
+        """The (in_dim x dim) projection matrix"""
+        if in_dim not in self._matrices:
+            generator = torch.Generator().manual_seed(self.seed)
+            self._matrices[in_dim] = torch.randn(
+                in_dim, self.dim, generator=generator
+            ) / math.sqrt(self.dim)
+        return self._matrices[in_dim]
+
+    def reduce(self, tensor, lengths=None):
+        return tensor @ self.matrix(tensor.size(-1)).to(tensor.dtype), lengths
+
+    def __str__(self):
+        return f"{self.name}:{self.dim}:{self.seed}"
+
+
+def get_reducer(reducer: Union[str, Reducer, None]) -> Reducer:
+    """Get a reducer from its name ("none", "subsample:k", "meanpool:w",
+    "projection:d[:seed]")"""
+    if reducer is None:
+        return Reducer()
+    if isinstance(reducer, Reducer):
+        return reducer
+    name, *params = reducer.split(":")
+    try:
+        if name == Reducer.name and len(params) == 0:
+            return Reducer()
+        if name == Subsample.name and len(params) == 1:
+            return Subsample(int(params[0]))
+        if name == MeanPool.name and len(params) == 1:
+            return MeanPool(int(params[0]))
+        if name == RandomProjection.name and len(params) in (1, 2):
+            return RandomProjection(*[int(p) for p in params])
+    except ValueError:
+        pass
+    raise ValueError(
+        f"Unknown reducer '{reducer}' (available: none, subsample:k, meanpool:w,"
+        " projection:d[:seed])"
+    )
@@ -0,0 +1,225 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple, Union
+import json
+
+"""
+Declarative topology of a damped distributed env: the producers (the
+damped.disturb-ed toolkits, eg: each process of a data-parallel master), the
+consumers (the domain task trainers) and which consumer receives the stream
+of which producer.
+
+JSON file, eg: 2 data-parallel master processes and 2 branches:
+{
+  "producers": [{"name": "asr", "count": 2}],
+  "consumers": [{"name": "spk"}, {"name": "gender", "rank": 0}],
+  "routes": {"asr": ["spk", "gender"]}
+}
+
+  - "count": number of instances of the node (default 1), one rank each.
+  - "rank": first rank of the node (optional), the other nodes get the lowest
+    free ranks: producers first, then consumers, in the declaration order.
+  - "routes": consumers fed by each producer (default: all of them). When a
+    consumer has several instances, the instance i of a producer sends to the
+    instance (i % count) of the consumer.
+  - "dispatch": the instances of the consumer are replicas, each producer
+    dispatches its forks among all of them ("round_robin" or
+    "least_outstanding", see DomainTaskReplicas).
+"""
+
+
+@dataclass
+class TopologyNode(object):
+    """
+    Producer or consumer of a Topology.
+    """
+
+    name: str
+    # number of instances (one rank each)
+    count: int = 1
+    # first rank of the instances (assigned by the Topology if None)
+    rank: Optional[int] = None
+    # consumer replicas dispatch ("round_robin", "least_outstanding")
+    dispatch: Optional[str] = None
+
+
+@dataclass
+class Topology(object):
+    """
+    Ranks and routing tables of the producers and consumers of a damped
+    distributed env (computed once).
+
+    Example::
+        >>> topology = disturb.Topology.load("topology.json")
+        >>> rank = topology.rank("asr", index=1)
+        >>> topology.destinations(rank)  # ranks of the consumers
+        [3, 0]
+        >>> topology.route(rank, "spk")  # rank of a DomainTask(to_rank=)
+        3
+    """
+
+    producers: List[TopologyNode]
+    consumers: List[TopologyNode]
+    # consumer names fed by each producer name (None: all the consumers)
+    routes: Optional[Dict[str, List[str]]] = None
+    # rank of each instance of the nodes (name -> ranks)
+    ranks: Dict[str, List[int]] = field(init=False, repr=False)
+
+    def __post_init__(self):
+        nodes = self.producers + self.consumers
+        names = [n.name for n in nodes]
+        assert len(set(names)) == len(names), f"duplicated node name in {names}"
+        assert all(n.count > 0 for n in nodes), "node count must be positive"
+        self.world_size = sum(n.count for n in nodes)
+
+        # nodes with a fixed rank first, the others get the lowest free ranks
+        taken = set()
+        self.ranks = {}
+        for node in nodes:
+            if node.rank is None:
+                continue
+            ranks = list(range(node.rank, node.rank + node.count))
+            if not taken.isdisjoint(ranks) or ranks[-1] >= self.world_size:
+                raise ValueError(
+                    f"Topology: invalid rank {node.rank} for node '{node.name}'"
+                    f" (world size: {self.world_size})"
+                )
+            taken.update(ranks)
+            self.ranks[node.name] = ranks
+        free = [r for r in range(self.world_size) if r not in taken]
+        for node in nodes:
+            if node.rank is None:
+                self.ranks[node.name] = free[: node.count]
+                free = free[node.count :]
+
+        consumers = [n.name for n in self.consumers]
+        routes = self.routes
+        if routes is None:
+            routes = {p.name: consumers for p in self.producers}
+        for producer, dsts in routes.items():
+            unknown = set(dsts).difference(consumers)
+            if producer not in self.ranks or producer in consumers or unknown:
+                raise ValueError(
+                    f"Topology: invalid route '{producer}' -> {list(dsts)}"
+                )
+
+        dispatch = {c.name: c.dispatch for c in self.consumers}
+        # routing tables: producer rank -> consumer name -> consumer ranks
+        self._routes: Dict[int, Dict[str, List[int]]] = {}
+        # consumer rank -> producer ranks
+        self._sources: Dict[int, List[int]] = {
+            r: [] for c in self.consumers for r in self.ranks[c.name]
+        }
+        for producer in self.producers:
+            for index, rank in enumerate(self.ranks[producer.name]):
+                table = {}
+                for consumer in routes.get(producer.name, []):
+                    instances = self.ranks[consumer]
+                    if dispatch[consumer] is None:
+                        instances = [instances[index % len(instances)]]
+                    table[consumer] = instances
+                    for instance in instances:
+                        self._sources[instance].append(rank)
+                self._routes[rank] = table
+
+    @classmethod
+    def from_dict(cls, conf: Dict) -> "Topology":
+        """Create a Topology from its (JSON) dict representation"""
+        return cls(
+            producers=[TopologyNode(**n) for n in conf["producers"]],
+            consumers=[TopologyNode(**n) for n in conf["consumers"]],
+            routes=conf.get("routes"),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "Topology":
+        """Load a Topology from a JSON file"""
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    @classmethod
+    def one_to_all(cls, domain_tasks: int) -> "Topology":
+        """Topology of ``disturb.init(all_to_one=False)``: the master (rank 0)
+        sends to the domain tasks (rank 1..N)"""
+        return cls(
+            producers=[TopologyNode("master")],
+            consumers=[TopologyNode(f"domain_task_{i}") for i in range(domain_tasks)],
+        )
+
+    @classmethod
+    def all_to_one(cls, masters: int) -> "Topology":
+        """Topology of ``disturb.init(all_to_one=True)``: the masters (rank
+        1..N) send to a single domain task (rank 0)"""
+        return cls(
+            producers=[TopologyNode("master", count=masters)],
+            consumers=[TopologyNode("domain_task", rank=0)],
+        )
+
+    def rank(self, name: str, index: int = 0) -> int:
+        """Rank of the instance ``index`` of a node"""
+        if name not in self.ranks:
+            raise ValueError(f"Topology: unknown node '{name}'")
+        ranks = self.ranks[name]
+        if not 0 <= index < len(ranks):
+            raise ValueError(
+                f"Topology: node '{name}' has {len(ranks)} instance(s), got index {index}"
+            )
+        return ranks[index]
+
+    def node(self, rank: int) -> Tuple[str, int]:
+        """Name and instance index of the node of a rank"""
+        for name, ranks in self.ranks.items():
+            if rank in ranks:
+                return name, ranks.index(rank)
+        raise ValueError(f"Topology: no node has the rank {rank}")
+
+    def is_producer(self, rank: int) -> bool:
+        return rank in self._routes
+
+    def destinations(self, rank: int) -> List[int]:
+        """Ranks of the consumers fed by a producer rank (with all the
+        replicas)"""
+        return [r for ranks in self._routes.get(rank, {}).values() for r in ranks]
+
+    def route(self, rank: int, consumer: str) -> int:
+        """Rank of the consumer ``consumer`` fed by a producer rank"""
+        ranks = self.replicas(rank, consumer)
+        if len(ranks) > 1:
+            raise ValueError(
+                f"Topology: consumer '{consumer}' has replicas, see Topology.replicas"
+            )
+        return ranks[0]
+
+    def replicas(self, rank: int, consumer: str) -> List[int]:
+        """Ranks of the replicas of the consumer ``consumer`` fed by a
+        producer rank (eg: DomainTaskReplicas(to_ranks=))"""
+        table = self._routes.get(rank, {})
+        if consumer not in table:
+            raise ValueError(
+                f"Topology: rank {rank} does not send to consumer '{consumer}'"
+            )
+        return list(table[consumer])
+
+    def sources(self, rank: int) -> List[int]:
+        """Ranks of the producers feeding a consumer rank"""
+        return list(self._sources.get(rank, []))
+
+
+_topology: Optional[Topology] = None
+
+
+def get_topology() -> Optional[Topology]:
+    """Get the Topology loaded by ``disturb.init`` (None if not used)"""
+    return _topology
+
+
+def set_topology(topology: Optional[Union[str, Topology]]) -> Optional[Topology]:
+    """Set the Topology used by damped.disturb
+
+    Args:
+        topology (str or Topology, optional): path of a JSON topology file
+    """
+    global _topology
+    if isinstance(topology, str):
+        topology = Topology.load(topology)
+    _topology = topology
+    return topology
@@ -1,6 +1,7 @@
 from .xvector import Xtractor
 from .brij_xvector import BrijSpeakerXvector
 from .gradient_reverse import grad_reverse_net, GradientReverse
+from .remote_branch import RemoteBranch
 
 """
 ``damped.nets `` provides a sets of building block to create custom neural net
@@ -14,4 +15,5 @@ _all__ = [
     "BrijSpeakerXvector",
     "grad_reverse_net",
     "GradientReverse",
+    "RemoteBranch",
 ]
@@ -0,0 +1,29 @@
+import torch
+
+
+class RemoteBranch(torch.autograd.Function):
+    """
+    Identical mapping from input to output, the input is forked to a domain
+    task trainer in forward, and the gradient computed by the trainer is
+    added to the gradient of the output during backwards.
+
+    The trainer computes its forward/backward while the rest of the forward
+    and the backward of the net are computed (see
+    DomainTask.fork_recv_grad_deferred).
+
+    Example::
+        >>> task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+        >>> # scale=-1: reverse the gradient of the domain task (adversarial)
+        >>> x = RemoteBranch.apply(hs_pad, task, spk_label, -1.0)
+    """
+
+    @staticmethod
+    def forward(ctx, x, task, domain_label, scale=1.0):
+        ctx.pending = task.fork_recv_grad_deferred(x.detach().cpu(), domain_label)
+        ctx.scale = scale
+        return x.view_as(x)
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        grad = ctx.pending.wait().to(grad_output.device, grad_output.dtype)
+        return grad_output + ctx.scale * grad, None, None, None
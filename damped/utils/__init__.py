@@ -1,6 +1,16 @@
-from .distributed_init import init_distributedenv
+from .distributed_init import init_distributedenv, peer_wire_version
 from .distributed_recv import recv, fork_recv
-from .codec import str_int_encoder
+from .buffer_pool import BufferPool
+from .receiver import ForkReceiver, Fork, MetaData
+from .recorder import ForkRecorder, ForkReplay, get_recorder
+from .transport import Transport, get_transport, set_transport
+from .throttled_transport import ThrottledTransport
+from .credits import CreditGate, grant_credits
+from .distributed_send import isend, isend_fused, isend_zeros, send_meta_data
+from .distributed_send import ibroadcast, ibroadcast_fused, broadcast_meta_data
+from .distributed_send import update_control
+from .control import publish_reducer, peer_reducer
+from .codec import str_int_encoder, WireCodec, get_wire_codec
 from .log import log_handler
 from .mapper import gender_mapper, spkid_mapper
 from .eval import display_evaluation_result
@@ -10,10 +20,36 @@ from .monitor import Monitor, Metric
 # be able to access:
 __all__ = [
     "init_distributedenv",
+    "peer_wire_version",
     "log_handler",
     "recv",
     "fork_recv",
+    "BufferPool",
+    "ForkReceiver",
+    "Fork",
+    "MetaData",
+    "ForkRecorder",
+    "ForkReplay",
+    "get_recorder",
+    "Transport",
+    "get_transport",
+    "set_transport",
+    "ThrottledTransport",
+    "CreditGate",
+    "grant_credits",
+    "isend",
+    "isend_fused",
+    "isend_zeros",
+    "send_meta_data",
+    "ibroadcast",
+    "ibroadcast_fused",
+    "broadcast_meta_data",
+    "update_control",
+    "publish_reducer",
+    "peer_reducer",
     "str_int_encoder",
+    "WireCodec",
+    "get_wire_codec",
     "gender_mapper",
     "spkid_mapper",
     "display_evaluation_result",
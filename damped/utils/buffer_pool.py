@@ -0,0 +1,160 @@
+from collections import defaultdict
+from threading import Lock, get_ident
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+from .header import element_size
+
+
+def storage_ptr(tensor: torch.Tensor) -> int:
+    """Address of the memory (storage) a tensor is a view of"""
+    if hasattr(tensor, "untyped_storage"):
+        return tensor.untyped_storage().data_ptr()
+    return tensor.storage().data_ptr()
+
+
+class BufferPool(object):
+    """
+    Pool of receive buffers recycled in between batches.
+
+    Buffers are keyed by dtype and by a rounded-up number of elements
+    (``buckets_per_octave`` buckets in between two powers of two), received
+    tensors are views into those buffers.
+
+    A buffer is given back to the pool with ``release()`` or, when
+    ``auto_release`` is set, as soon as the consumer receives the next batch.
+    (batches are tracked per thread, a pool can be shared by receiver threads)
+
+    Example::
+        >>> pool = utils.BufferPool()
+        >>> features, label, is_meta_data = utils.fork_recv(rank=0, pool=pool)
+        >>> pool.hit_rate
+    """
+
+    def __init__(
+        self,
+        auto_release: bool = True,
+        buckets_per_octave: int = 8,
+        max_bytes: Optional[int] = None,
+    ):
+        """
+        Args:
+            auto_release (bool): release the buffers of the previous batch when
+                the next batch is received
+            buckets_per_octave (int): number of buckets (power of two) in
+                between two powers of two, the higher the less memory is wasted
+                and the lower the hit rate is.
+            max_bytes (int, optional): the maximal amount of bytes kept by the
+                pool for later use
+        """
+        assert buckets_per_octave & (buckets_per_octave - 1) == 0, (
+            "buckets_per_octave must be a power of two"
+        )
+        self.auto_release = auto_release
+        self.max_bytes = max_bytes
+        self._octave_shift = buckets_per_octave.bit_length() - 1
+        self._free: Dict[Tuple[torch.dtype, int], List[torch.Tensor]] = defaultdict(
+            list
+        )
+        self._lent: Dict[int, Tuple[Tuple[torch.dtype, int], torch.Tensor]] = {}
+        # buffers of the batch being received by each thread (thread id -> ptrs)
+        self._batch: Dict[int, List[int]] = defaultdict(list)
+        self._mutex = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_retained = 0  # bytes of all the buffers owned by the pool
+        self.bytes_free = 0  # bytes of the buffers waiting to be reused
+
+    def bucket(self, numel: int) -> int:
+        """Round up a number of elements to its bucket size"""
+        numel = max(numel, 1)
+        step = 1 << max(0, numel.bit_length() - 1 - self._octave_shift)
+        return (numel + step - 1) // step * step
+
+    def empty(self, shape: List[int], dtype: torch.dtype) -> torch.Tensor:
+        """Returns an uninitialized tensor backed by a recycled buffer
+
+        Args:
+            shape (List[int]): the shape of the tensor
+            dtype (torch.dtype): the data type of the tensor
+        """
+        numel = 1
+        for s in shape:
+            numel *= s
+        key = (dtype, self.bucket(numel))
+        with self._mutex:
+            if len(self._free[key]) > 0:
+                buff = self._free[key].pop()
+                self.hits += 1
+                self.bytes_free -= buff.numel() * element_size(dtype)
+            else:
+                buff = torch.empty(key[1], dtype=dtype)
+                self.misses += 1
+                self.bytes_retained += buff.numel() * element_size(dtype)
+            ptr = storage_ptr(buff)
+            self._lent[ptr] = (key, buff)
+            if self.auto_release:
+                self._batch[get_ident()].append(ptr)
+        return buff[:numel].view(shape)
+
+    def release(self, *tensors: torch.Tensor) -> None:
+        """Give back the buffers of received tensors to the pool
+
+        The tensors (and any view of them) must not be used afterwards.
+        Tensors that were not allocated by the pool are ignored.
+        """
+        with self._mutex:
+            for tensor in tensors:
+                if tensor is None:
+                    continue
+                self._release(storage_ptr(tensor))
+
+    def next_batch(self) -> None:
+        """Called by the receiver before receiving a new batch"""
+        if not self.auto_release:
+            return
+        with self._mutex:
+            for ptr in self._batch.pop(get_ident(), []):
+                self._release(ptr)
+
+    def take_batch(self) -> List[int]:
+        """Detach the buffers of the current batch from the auto release
+
+        Used when batches are received ahead of their use (see ForkReceiver),
+        the buffers are given back with ``release_batch()``.
+        """
+        with self._mutex:
+            return self._batch.pop(get_ident(), [])
+
+    def release_batch(self, batch: List[int]) -> None:
+        """Give back the buffers detached with ``take_batch()``"""
+        with self._mutex:
+            for ptr in batch:
+                self._release(ptr)
+
+    def _release(self, ptr: int) -> None:
+        if ptr not in self._lent:
+            return
+        key, buff = self._lent.pop(ptr)
+        nbytes = buff.numel() * element_size(key[0])
+        if self.max_bytes is not None and self.bytes_free + nbytes > self.max_bytes:
+            self.bytes_retained -= nbytes
+            return
+        self._free[key].append(buff)
+        self.bytes_free += nbytes
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
+
+    def __repr__(self):
+        return (
+            f"BufferPool(hit_rate={self.hit_rate:.3f}, hits={self.hits}, "
+            f"misses={self.misses}, bytes_retained={self.bytes_retained}, "
+            f"bytes_free={self.bytes_free})"
+        )
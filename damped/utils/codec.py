@@ -1,3 +1,9 @@
+import math
+from typing import List, Tuple, Union
+
+import torch
+
+
 class str_int_encoder:
     """
     Used to convert a string to an int.
@@ -24,3 +30,153 @@ class str_int_encoder:
         return res
 
 #  decode(torch.tensor([encode("pv1-5703-47198-0014")], dtype=torch.long).tolist()[0])
+
+
+class WireCodec:
+    """
+    Encoding of the features sent over the wire by a DomainTask.
+    No encoding (the tensor is sent with the dtype requested by the DomainTask).
+
+    A codec is carried in the message header (its code), the receiver decodes
+    the features back to the requested dtype.
+    """
+
+    name = "none"
+    code = 0
+    # each element is encoded on its own, a tensor can be encoded in chunks
+    chunkable = True
+
+    def encode(
+        self, tensor: torch.Tensor, dtype: torch.dtype
+    ) -> Tuple[List[torch.Tensor], List[torch.dtype]]:
+        """Encode a tensor
+
+        Args:
+            tensor (torch.Tensor): the tensor to encode
+            dtype (torch.dtype): the data type requested by the sender
+
+        Returns:
+            Tuple(List[torch.Tensor], List[torch.dtype]): the tensors to send
+            and their wire data type
+        """
+        return [tensor], [dtype]
+
+    def decode(self, parts: List[torch.Tensor], dtype: torch.dtype) -> torch.Tensor:
+        """Decode the received tensors
+
+        Args:
+            parts (List[torch.Tensor]): the received tensors
+            dtype (torch.dtype): the desired data type of the decoded tensor
+        """
+        return parts[0].to(dtype)
+
+
+class Float16Codec(WireCodec):
+    """Half precision (IEEE fp16) encoding"""
+
+    name = "fp16"
+    code = 1
+    wire_dtype = torch.float16
+
+    def encode(self, tensor, dtype):
+        return [tensor], [self.wire_dtype]
+
+
+class BFloat16Codec(Float16Codec):
+    """bfloat16 encoding (float32 range, 8 bits of mantissa)"""
+
+    name = "bf16"
+    code = 2
+    wire_dtype = torch.bfloat16
+
+
+class Int8Codec(WireCodec):
+    """
+    Per-channel (last dimension) affine int8 quantization.
+    The scale and the zero-point of each channel are sent alongside the
+    quantized values.
+    """
+
+    name = "int8"
+    code = 3
+    chunkable = False
+
+    def encode(self, tensor, dtype):
+        channels = tensor.size(-1) if tensor.dim() > 0 else 1
+        flat = tensor.detach().reshape(-1, channels).float()
+        if flat.size(0) == 0:
+            low = torch.zeros(channels)
+            high = torch.zeros(channels)
+        else:
+            low = flat.min(dim=0)[0]
+            high = flat.max(dim=0)[0]
+        scale = ((high - low) / 255).clamp(min=1e-12)
+        quantized = ((flat - low) / scale).round_().sub_(128).clamp_(-128, 127)
+        quantized = quantized.to(torch.int8).view(tensor.size())
+        return [quantized, scale, low], [torch.int8, torch.float32, torch.float32]
+
+    def decode(self, parts, dtype):
+        quantized, scale, low = parts
+        return ((quantized.to(torch.float32) + 128) * scale + low).to(dtype)
+
+
+class TopKCodec(WireCodec):
+    """
+    Sparse encoding of the ``ratio`` largest values (in magnitude), the
+    others are decoded as zeros. Meant for the gradients sent back to the
+    disturb-ed toolkit (see trainer.py --grad-encoding).
+    Named "topk" (ratio of 0.01) or "topk:<ratio>".
+    """
+
+    name = "topk"
+    code = 4
+    chunkable = False
+
+    def __init__(self, ratio: float = 0.01):
+        assert 0 < ratio <= 1, "the ratio of values to send must be in ]0, 1]"
+        self.ratio = ratio
+
+    def encode(self, tensor, dtype):
+        flat = tensor.detach().reshape(-1)
+        k = min(flat.numel(), max(1, math.ceil(flat.numel() * self.ratio)))
+        indices = flat.abs().topk(k, sorted=False)[1]
+        shape = torch.tensor(tensor.size(), dtype=torch.int64)
+        index_dtype = torch.int32 if flat.numel() < 2 ** 31 else torch.int64
+        return (
+            [shape, indices, flat[indices]],
+            [torch.int64, index_dtype, dtype],
+        )
+
+    def decode(self, parts, dtype):
+        shape, indices, values = parts
+        numel = int(torch.prod(shape)) if shape.numel() > 0 else 1
+        out = torch.zeros(numel, dtype=dtype)
+        out[indices.long()] = values.to(dtype)
+        return out.view(shape.tolist())
+
+
+WIRE_CODECS = {
+    c.name: c()
+    for c in [WireCodec, Float16Codec, BFloat16Codec, Int8Codec, TopKCodec]
+}
+WIRE_CODECS_BY_CODE = {c.code: c for c in WIRE_CODECS.values()}
+
+
+def get_wire_codec(codec: Union[str, int, WireCodec, None]) -> WireCodec:
+    """Get a wire codec from its name ("none", "fp16", "bf16", "int8",
+    "topk[:ratio]") or code"""
+    if codec is None:
+        return WIRE_CODECS["none"]
+    if isinstance(codec, WireCodec):
+        return codec
+    if isinstance(codec, int):
+        if codec not in WIRE_CODECS_BY_CODE:
+            raise ValueError(f"Unknown wire codec code {codec} received")
+        return WIRE_CODECS_BY_CODE[codec]
+    if codec.startswith(TopKCodec.name + ":"):
+        return TopKCodec(float(codec[len(TopKCodec.name) + 1 :]))
+    if codec not in WIRE_CODECS:
+        raise ValueError(
+            f"Unknown wire codec '{codec}' (available: {list(WIRE_CODECS.keys())})"
+        )
+    return WIRE_CODECS[codec]
@@ -0,0 +1,82 @@
+import threading
+from typing import Deque, Dict, List, Optional, Tuple
+
+import torch
+import torch.distributed as dist
+
+from .header import WIRE_VERSION
+
+"""
+State of the distributed env of a node: its rank, the rendezvous store, the
+negotiated wire versions, the transport used for each peer and the state of
+the control plane.
+
+A process usually holds a single node (process context). With the loopback
+transport several nodes run in the same interpreter, each on its own thread
+(thread context).
+"""
+
+
+class DistContext(object):
+    """
+    Distributed env state of a node.
+    """
+
+    def __init__(
+        self,
+        rank: int = 0,
+        store: Optional[dist.Store] = None,
+        wire_version: int = WIRE_VERSION,
+    ):
+        """
+        Args:
+            rank (int): rank of the node in the distributed env
+            store (dist.Store, optional): key-value store shared by all the
+                nodes (used to negotiate the wire version and the transports)
+            wire_version (int): wire version of this node
+        """
+        self.rank = rank
+        self.store = store
+        self.wire_version = wire_version
+        # wire version used to exchange with each peer (rank -> version)
+        self.peer_wire_versions: Dict[int, int] = {}
+        # transport used to exchange with each peer (rank -> Transport)
+        self.transports: Dict[int, "Transport"] = {}  # noqa: F821
+        # sequence number of the last control state sent to each peer
+        self.control_sent: Dict[int, int] = {}
+        # control states switched but not sent yet to each peer
+        self.control_pending: Dict[int, List[Tuple[int, torch.Tensor]]] = {}
+        # sequence number of the last control state applied from each peer
+        self.control_applied: Dict[int, int] = {}
+        # received messages not delivered yet (rank -> messages)
+        self.pending_messages: Dict[int, Deque] = {}
+        # peers can join and leave (see damped.utils.socket_transport)
+        self.elastic = False
+
+
+_process_context = DistContext()
+_thread_context = threading.local()
+
+
+def get_context() -> DistContext:
+    """Get the distributed env state of the calling thread"""
+    return getattr(_thread_context, "context", _process_context)
+
+
+def set_context(context: DistContext, thread: bool = False) -> None:
+    """Set the distributed env state
+
+    Args:
+        context (DistContext): the new state
+        thread (bool): only set the state of the calling thread. Threads
+            started by a node (eg: sender threads) must call
+            ``set_context(context, thread=True)`` with the context of the node.
+    """
+    global _process_context
+    if thread:
+        _thread_context.context = context
+        return
+    _process_context = context
+    # the calling thread now uses the process context
+    if hasattr(_thread_context, "context"):
+        del _thread_context.context
@@ -0,0 +1,178 @@
+from collections import deque
+from typing import Any, List, Tuple
+import time
+
+import torch
+
+from .context import get_context
+
+"""
+Control plane: the mode of the exchanges with a peer (damped.disturb.const
+signals: eval/train/stop, backward gradient expected or not) is numbered
+and carried by the header of the next data message instead of a message of
+its own.
+
+Switching the mode does not send anything (see damped.utils.update_control):
+the next message sent to the peer carries it in its header (FLAG_MODE, the
+meta-data slots hold the mode, H_SEQ its number). The receiver delivers the
+mode (as meta-data) before the message. When several modes are switched in
+between two messages, the previous ones are sent as header only meta-data
+(FLAG_META) right before the message (wire version 3).
+
+The stop signal is not followed by any data message: it is published in the
+rendezvous store,
+  "damped/control/{src}->{dst}/{seq}" = meta-data of the mode number seq
+and a header only message (FLAG_CONTROL) wakes the peer up. The store is
+hosted by the node of rank 0: after the stop signal, it waits for its peers
+to fetch it before leaving (see wait_control_fetched).
+"""
+
+CONTROL_WIRE_VERSION = 3
+
+_CONTROL_KEY = "damped/control/{}->{}/{}"
+_REDUCER_KEY = "damped/reducer/{}->{}"
+
+# seconds a node waits for a peer to fetch its last mode (see
+# wait_control_fetched)
+CONTROL_FETCH_TIMEOUT = 10.0
+
+
+def switch_control(dst: int, meta_data: torch.Tensor) -> int:
+    """Switch the mode of the messages sent to a peer (carried by the next
+    message sent to it, see take_control)
+
+    Args:
+        dst (int): rank of the peer in the distributed env
+        meta_data (torch.Tensor): the mode (damped.disturb.const signal)
+
+    Returns:
+        int: the sequence number of the mode
+    """
+    context = get_context()
+    seq = context.control_sent.get(dst, 0) + 1
+    context.control_sent[dst] = seq
+    context.control_pending.setdefault(dst, []).append((seq, meta_data.clone()))
+    return seq
+
+
+def take_control(dst: int) -> List[Tuple[int, torch.Tensor]]:
+    """Pop the modes switched since the last message sent to a peer
+
+    Returns:
+        List[Tuple[int, torch.Tensor]]: the (sequence number, meta-data) of
+        each mode, in order
+    """
+    return get_context().control_pending.pop(dst, [])
+
+
+def publish_control(dst: int, meta_data: torch.Tensor) -> int:
+    """Publish a mode in the store (the stop signal, no message follows it)
+
+    Args:
+        dst (int): rank of the peer in the distributed env
+        meta_data (torch.Tensor): the mode (damped.disturb.const signal)
+
+    Returns:
+        int: the sequence number of the mode
+    """
+    context = get_context()
+    seq = context.control_sent.get(dst, 0) + 1
+    value = ",".join(str(v) for v in meta_data.tolist())
+    context.store.set(_CONTROL_KEY.format(context.rank, dst, seq), value)
+    context.control_sent[dst] = seq
+    return seq
+
+
+def wait_control_fetched(dst: int, timeout: float = CONTROL_FETCH_TIMEOUT) -> bool:
+    """Wait until a peer fetched the last mode published for it (the peer
+    deletes it from the store)
+
+    Args:
+        dst (int): rank of the peer in the distributed env
+        timeout (float): max seconds to wait
+
+    Returns:
+        bool: whether the peer fetched the mode
+    """
+    context = get_context()
+    seq = context.control_sent.get(dst, 0)
+    key = _CONTROL_KEY.format(context.rank, dst, seq)
+    deadline = time.time() + timeout
+    while seq > 0 and context.store.check([key]):
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def apply_control(src: int, seq: int) -> None:
+    """Record the mode ``seq`` of a peer as delivered"""
+    context = get_context()
+    if seq > context.control_applied.get(src, 0):
+        context.control_applied[src] = seq
+
+
+def fetch_control(src: int, seq: int) -> torch.Tensor:
+    """Get the mode ``seq`` published by a peer in the store
+
+    Args:
+        src (int): rank of the peer in the distributed env
+        seq (int): sequence number carried by the wake up message
+
+    Returns:
+        torch.Tensor: the meta-data of the mode
+    """
+    context = get_context()
+    key = _CONTROL_KEY.format(src, context.rank, seq)
+    # published before the message carrying it was sent
+    value = context.store.get(key).decode()
+    context.store.delete_key(key)
+    apply_control(src, seq)
+    return torch.tensor([int(v) for v in value.split(",")], dtype=torch.int)
+
+
+def reset_control(peer: int) -> None:
+    """Forget the state of the exchanges with a peer (eg: the peer has been
+    restarted, see damped.utils.socket_transport)"""
+    context = get_context()
+    seq = context.control_sent.pop(peer, 0)
+    if seq > 0:
+        context.store.delete_key(_CONTROL_KEY.format(context.rank, peer, seq))
+    context.control_pending.pop(peer, None)
+    context.control_applied.pop(peer, None)
+    context.pending_messages.pop(peer, None)
+    context.peer_wire_versions.pop(peer, None)
+
+
+def publish_reducer(dst: int, description: str) -> None:
+    """Describe the reduction applied to the features sent to a peer (see
+    damped.disturb.reducer), displayed by the peer"""
+    context = get_context()
+    context.store.set(_REDUCER_KEY.format(context.rank, dst), description)
+
+
+def peer_reducer(src: int) -> str:
+    """Description of the reduction applied by a peer to the features it
+    sends ("none" if nothing was published)"""
+    context = get_context()
+    key = _REDUCER_KEY.format(src, context.rank)
+    if context.store is None or not context.store.check([key]):
+        return "none"
+    return context.store.get(key).decode()
+
+
+def pending_message(src: int) -> Any:
+    """Pop a message received from a peer but not delivered yet (None if
+    there are none)"""
+    pending = get_context().pending_messages.get(src)
+    if pending:
+        return pending.popleft()
+    return None
+
+
+def deliver(src: int, messages: List[Any]) -> Any:
+    """Deliver the first message, the others are kept for the next receive"""
+    if len(messages) > 1:
+        pending = get_context().pending_messages.setdefault(src, deque())
+        pending.extend(messages[1:])
+    return messages[0]
@@ -0,0 +1,81 @@
+import time
+
+from .context import get_context
+
+"""
+Credit-based flow control: a domain task trainer grants credits to the
+nodes sending it forks, one credit is consumed per fork. The credits are
+counters of the rendezvous store:
+  "damped/credits/{granter}->{grantee}" = total number of credits granted
+"""
+
+_CREDITS_KEY = "damped/credits/{}->{}"
+
+
+def grant_credits(peer: int, n: int = 1) -> None:
+    """Grant credits to a peer (eg: once a fork has been consumed)
+
+    Args:
+        peer (int): rank of the peer sending the forks
+        n (int): number of credits to grant
+    """
+    context = get_context()
+    context.store.add(_CREDITS_KEY.format(context.rank, peer), n)
+
+
+class CreditGate(object):
+    """
+    Credits granted by a peer to this node.
+
+    The peer has enabled the flow control if it has granted credits before
+    joining the distributed env (see init_distributedenv ``credits``),
+    otherwise the gate never blocks.
+    """
+
+    def __init__(self, peer: int, max_poll_interval: float = 0.01):
+        """
+        Args:
+            peer (int): rank of the peer granting the credits
+            max_poll_interval (float): max time in seconds in between two
+                reads of the credits while waiting for a credit
+        """
+        self.peer = peer
+        self.max_poll_interval = max_poll_interval
+        self.enabled = None
+        self._used = 0
+        self._granted = 0
+
+    @property
+    def available(self) -> int:
+        """Number of credits left (as of the last read)"""
+        return self._granted - self._used
+
+    def try_acquire(self) -> bool:
+        """Consume a credit if one is available (non blocking)"""
+        context = get_context()
+        key = _CREDITS_KEY.format(self.peer, context.rank)
+        if self.enabled is None:
+            self.enabled = context.store is not None and context.store.check([key])
+        if not self.enabled:
+            return True
+
+        if self._used >= self._granted:
+            self._granted = context.store.add(key, 0)
+        if self._used >= self._granted:
+            return False
+        self._used += 1
+        return True
+
+    def acquire(self) -> bool:
+        """Consume a credit, blocks until one is granted
+
+        Returns:
+            bool: True if the caller had to wait for the credit
+        """
+        poll_interval = 0.0005
+        waited = False
+        while not self.try_acquire():
+            waited = True
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, self.max_poll_interval)
+        return waited
@@ -1,15 +1,40 @@
 import logging
+import os
+from threading import Lock
+from typing import Dict
 
 import torch.distributed as dist
 from .log import log_handler
+from .header import WIRE_VERSION, LEGACY_WIRE_VERSION
+from .context import DistContext, get_context, set_context
+from .credits import _CREDITS_KEY
+from .shm_transport import ShmTransport, host_id
+from .socket_transport import SocketListener, SocketTransport
+from .throttled_transport import throttle_transport
+from .transport import LoopbackHub, LoopbackTransport, get_transport, set_transport
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 logger.addHandler(log_handler)
 
+_WIRE_VERSION_KEY = "damped/wire_version/{}"
+_TRANSPORT_KEY = "damped/transport/{}"
+_LOOPBACK_JOINED_KEY = "damped/loopback/joined"
+
+# rendezvous of the in-process nodes being initialized (port -> hub)
+_loopback_hubs: Dict[int, LoopbackHub] = {}
+_loopback_mutex = Lock()
+
 
 def init_distributedenv(
-    rank: int, world_size: int = 2, ip: str = "0.0.0.0", port: int = 29500
+    rank: int,
+    world_size: int = 2,
+    ip: str = "0.0.0.0",
+    port: int = 29500,
+    wire_version: int = WIRE_VERSION,
+    transport: str = os.getenv("DAMPED_TRANSPORT", "auto"),
+    credits: int = 0,
+    throttle: str = os.getenv("DAMPED_THROTTLE", ""),
 ) -> None:
     """Initialize the distributed environment
 
@@ -22,12 +47,48 @@ def init_distributedenv(
 
     This function must be called on the main thread. (in the if-main)
 
+    Each node publishes its wire version in the rendezvous store, peers running
+    an older damped (that do not publish anything) are exchanged with using
+    the legacy wire format.
+
+    With the "auto" transport, tensors are exchanged through shared memory
+    (damped.utils.shm_transport) with the peers running on the same host, and
+    through gloo with the others.
+
+    With the "loopback" transport, every node runs on a thread of the same
+    interpreter (no process group is created), nodes meet on ``port``.
+
+    With the "elastic" transport, the nodes are connected with TCP sockets
+    (damped.utils.socket_transport) instead of a process group: a domain task
+    trainer can join late, crash and be restarted while the others keep
+    running (the messages sent to an absent peer are dropped).
+
+    With ``throttle``, the messages sent to the peers go through a simulated
+    link of the given bandwidth, latency and jitter, on top of the selected
+    transport (damped.utils.throttled_transport).
+
     Args:
         rank (int): unique identifier for a DomainTask (0 if )
         world_size (int): The number of expected domain task.
         ip (str): The ipv4 or ipv6 cluster node address
         port (int): port on which the the tensor will be exchanged
+        wire_version (int): The highest wire version this node can speak
+        transport (str): "auto", "gloo", "shm", "loopback" or "elastic"
+            (env: DAMPED_TRANSPORT)
+        credits (int): enables the flow control, number of forks the peers
+            can send before this node grants more credits (see
+            damped.utils.grant_credits)
+        throttle (str): simulated link "<bandwidth Mbit/s>:<latency ms>[:<jitter ms>]"
+            ("": none, env: DAMPED_THROTTLE)
     """
+    if transport == "loopback":
+        _init_loopback(rank, world_size, port, wire_version, credits)
+        _throttle_transports(rank, world_size, throttle)
+        return
+    if transport == "elastic":
+        _init_elastic(rank, world_size, ip, port, wire_version, credits)
+        _throttle_transports(rank, world_size, throttle)
+        return
 
     init_param = {
         "backend": "gloo",
@@ -39,6 +100,139 @@ def init_distributedenv(
     logger.info(
         f"Initialization of distributed env... [init: {init_param['init_method']}, rank: {init_param['rank']}, world_size: {init_param['world_size']}]"  # noqa
     )
-    dist.init_process_group(**init_param)
+    # Same store as the one created by the "tcp://" init_method, legacy peers
+    # can still join the rendezvous.
+    store = dist.TCPStore(ip, port, world_size, rank == 0)
+    set_context(DistContext(rank, store, wire_version))
+    # published before joining the process group, once the group is
+    # initialized every (non legacy) peer has published its version.
+    store.set(_WIRE_VERSION_KEY.format(rank), str(wire_version))
+    store.set(_TRANSPORT_KEY.format(rank), f"{transport}|{host_id()}")
+    _publish_credits(store, rank, world_size, credits)
+
+    del init_param["init_method"]
+    dist.init_process_group(store=store, **init_param)
     dist.is_available()
+    _init_transports(rank, world_size, transport, port)
+    _throttle_transports(rank, world_size, throttle)
     logger.info("Distributed env inited!")
+
+
+def _init_loopback(
+    rank: int, world_size: int, port: int, wire_version: int, credits: int
+) -> None:
+    """Join the in-process nodes (the calling thread becomes the node)"""
+    logger.info(
+        f"Initialization of loopback env... [port: {port}, rank: {rank}, world_size: {world_size}]"  # noqa
+    )
+    with _loopback_mutex:
+        if port not in _loopback_hubs:
+            _loopback_hubs[port] = LoopbackHub()
+        hub = _loopback_hubs[port]
+        # the port can be reused by the next in-process env once every node joined
+        if hub.store.add(_LOOPBACK_JOINED_KEY, 1) == world_size:
+            del _loopback_hubs[port]
+
+    set_context(DistContext(rank, hub.store, wire_version), thread=True)
+    _publish_credits(hub.store, rank, world_size, credits)
+    hub.store.set(_WIRE_VERSION_KEY.format(rank), str(wire_version))
+    hub.store.wait([_WIRE_VERSION_KEY.format(r) for r in range(world_size)])
+    for peer in range(world_size):
+        if peer != rank:
+            set_transport(peer, LoopbackTransport(rank, peer, hub))
+    logger.info("Loopback env inited!")
+
+
+def _init_elastic(
+    rank: int, world_size: int, ip: str, port: int, wire_version: int, credits: int
+) -> None:
+    """Join the elastic env (does not wait for the other nodes)"""
+    logger.info(
+        f"Initialization of elastic env... [store: {ip}:{port}, rank: {rank}, world_size: {world_size}]"  # noqa
+    )
+    store = dist.TCPStore(ip, port, None, rank == 0, wait_for_workers=False)
+    context = DistContext(rank, store, wire_version)
+    context.elastic = True
+    set_context(context)
+    store.set(_WIRE_VERSION_KEY.format(rank), str(wire_version))
+    _publish_credits(store, rank, world_size, credits)
+
+    for peer in range(world_size):
+        if peer != rank:
+            set_transport(peer, SocketTransport(rank, peer))
+    listener = SocketListener(context, ip)
+    for peer in range(rank):
+        listener.dial(context.transports[peer])
+    logger.info("Elastic env inited!")
+
+
+def _publish_credits(
+    store: dist.Store, rank: int, world_size: int, credits: int
+) -> None:
+    """Initial credits granted to the peers (flow control)"""
+    if credits <= 0:
+        return
+    for peer in range(world_size):
+        if peer != rank:
+            store.add(_CREDITS_KEY.format(rank, peer), credits)
+
+
+def _init_transports(rank: int, world_size: int, transport: str, port: int) -> None:
+    """Select the transport of each peer (same decision made on both sides)"""
+    store = get_context().store
+    shm_transports = []
+    for peer in range(world_size):
+        if peer == rank or peer_wire_version(peer) == LEGACY_WIRE_VERSION:
+            continue
+        peer_transport, peer_host = (
+            store.get(_TRANSPORT_KEY.format(peer)).decode().split("|", 1)
+        )
+        use_shm = (
+            transport in ("auto", "shm")
+            and peer_transport in ("auto", "shm")
+            and peer_host == host_id()
+        )
+        if transport == "shm" and not use_shm:
+            logger.warning(f"shm transport not available with rank {peer}, using gloo")
+        if use_shm:
+            shm_transports.append(ShmTransport(rank, peer, store, tag=str(port)))
+
+    # all the inbound rings are created before connecting to the peers' ones
+    for t in shm_transports:
+        t.connect()
+        set_transport(t.peer, t)
+        logger.info(f"Using the shm transport with rank {t.peer}")
+
+
+def _throttle_transports(rank: int, world_size: int, throttle: str) -> None:
+    """Send the messages to the peers through a simulated link"""
+    if not throttle:
+        return
+    for peer in range(world_size):
+        if peer != rank:
+            set_transport(peer, throttle_transport(get_transport(peer), throttle, rank))
+    logger.info(f"Messages sent through a simulated link ({throttle})")
+
+
+def peer_wire_version(rank: int) -> int:
+    """Get the wire version to use to exchange with a peer
+
+    Args:
+        rank (int): rank of the peer in the distributed env
+
+    Returns:
+        int: the highest version supported by both nodes
+    """
+    context = get_context()
+    if rank in context.peer_wire_versions:
+        return context.peer_wire_versions[rank]
+
+    version = LEGACY_WIRE_VERSION
+    key = _WIRE_VERSION_KEY.format(rank)
+    if context.store is not None and context.store.check([key]):
+        version = min(context.wire_version, int(context.store.get(key)))
+    elif context.elastic:
+        # the peer has not joined yet (the messages to it are dropped)
+        return context.wire_version
+    context.peer_wire_versions[rank] = version
+    return version
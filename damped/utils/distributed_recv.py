@@ -1,58 +1,277 @@
 import torch
-import torch.distributed as dist
-from typing import Optional, Tuple
+from torch.nn.utils.rnn import PackedSequence, pack_sequence, pack_padded_sequence
+from typing import List, Optional, Tuple, Union
+
+from .buffer_pool import BufferPool
+from .codec import get_wire_codec
+from .control import apply_control, deliver, fetch_control, pending_message
+from .distributed_init import peer_wire_version
+from .header import Header, LEGACY_WIRE_VERSION, empty_header, unpack_parts
+from .header import packed_chunks, restore_padding
+from .transport import get_transport
 
 
 def fork_recv(
     rank: int,
     dtype: Optional[Tuple[torch.dtype, torch.dtype]] = (torch.float32, torch.float32),
-) -> Tuple[torch.Tensor, torch.Tensor]:
+    pool: Optional[BufferPool] = None,
+    packed_sequence: bool = False,
+) -> Tuple[Union[torch.Tensor, PackedSequence], torch.Tensor]:
     """Get label and feature from forked task
 
+    Label and feature sent with a single (fused) message are returned as
+    views into the received buffer.
+    Features sent without padding (DomainTask.fork_detach(lengths=...)) are
+    returned as a padded (B x Tmax x ...) tensor, or as a PackedSequence if
+    ``packed_sequence`` is set.
+
     Args:
         rank (int): rank of the note in the distributed env
         dtype (Tuple(torch.dtype, torch.dtype), optional): the desired data
             type of sent tensor. The first dtype if for the feature, the
             second if for the label.
+        pool (BufferPool, optional): recycle the receive buffers
+        packed_sequence (bool, optional): return the features sent without
+            padding as a torch.nn.utils.rnn.PackedSequence
 
     Returns:
         Tuple(torch.Tensor, torch.Tensor): the related features and class label
     """
-    label, is_meta_data = recv(rank=rank, dtype=dtype[1])
-    if is_meta_data:
-        return (None, label, is_meta_data)
-    features, _ = recv(rank=rank, dtype=dtype[0])
-    return (features, label, is_meta_data)
+    message = pending_message(rank)
+    if message is not None:
+        return message
+    if pool is not None:
+        pool.next_batch()
+
+    if peer_wire_version(rank) == LEGACY_WIRE_VERSION:
+        label, is_meta_data = _recv_legacy(rank=rank, dtype=dtype[1], pool=pool)
+        if is_meta_data:
+            return (None, label, is_meta_data)
+        features, _ = _recv_legacy(rank=rank, dtype=dtype[0], pool=pool)
+        return (features, label, is_meta_data)
+
+    header, label = _recv_frame(rank, pool=pool)
+    # the modes switched before the message are delivered first
+    modes = _modes(rank, header)
+    if header.is_meta_data:
+        message = (None, label, True)
+    elif header.is_control:
+        message = None
+    elif header.is_fused:
+        parts = unpack_parts(label)
+        features = _decode_features(
+            header, parts[1:], dtype[0], pool, packed_sequence
+        )
+        message = (features, parts[0].to(dtype[1]), False)
+    else:
+        header_features, features = _recv_frame(rank, pool=pool)
+        modes += _modes(rank, header_features)
+        parts = _parts(header_features, features)
+        features = _decode_features(
+            header_features, parts, dtype[0], pool, packed_sequence
+        )
+        message = (features, label.to(dtype[1]), False)
+    messages = [(None, m, True) for m in modes]
+    if message is not None:
+        messages.append(message)
+    return deliver(rank, messages)
 
 
 def recv(
-    rank: int, dtype: Optional[torch.dtype] = torch.float32
+    rank: int,
+    dtype: Optional[torch.dtype] = torch.float32,
+    pool: Optional[BufferPool] = None,
 ) -> Tuple[torch.Tensor, bool]:
     """Receive a tensor from a DomainTask
 
     Args:
         rank (int): rank of the note in the distributed env
         dtype (torch.dtype, optional): the desired data type of received tensor
+        pool (BufferPool, optional): recycle the receive buffers
 
     Returns:
         Tuple(torch.Tensor, bool): [data value received, is meta-data]
     """
+    message = pending_message(rank)
+    if message is not None:
+        return message
+    if pool is not None:
+        pool.next_batch()
+
+    if peer_wire_version(rank) == LEGACY_WIRE_VERSION:
+        return _recv_legacy(rank, dtype, pool=pool)
+
+    header, recv_buff = _recv_frame(rank, pool=pool)
+    modes = _modes(rank, header)
+    if header.is_meta_data:
+        message = (recv_buff, True)
+    elif header.is_control:
+        message = None
+    elif header.is_fused:
+        raise RuntimeError("Fused label/features must be received with fork_recv")
+    else:
+        parts = _parts(header, recv_buff)
+        message = (_decode_features(header, parts, dtype, pool), False)
+    messages = [(m, True) for m in modes]
+    if message is not None:
+        messages.append(message)
+    return deliver(rank, messages)
+
+
+def _modes(rank: int, header: Header) -> List[torch.Tensor]:
+    """The control states carried by a header (see damped.utils.control)"""
+    if header.has_mode:
+        apply_control(rank, header.seq)
+        return [header.meta_data]
+    if header.is_control:
+        # published in the store (the stop signal)
+        return [fetch_control(rank, header.seq)]
+    if header.is_meta_data and header.seq > 0:
+        apply_control(rank, header.seq)
+    return []
+
+
+def _decode_features(
+    header: Header,
+    parts: List[torch.Tensor],
+    dtype: torch.dtype,
+    pool: Optional[BufferPool] = None,
+    packed_sequence: bool = False,
+) -> Union[torch.Tensor, PackedSequence]:
+    """Decode the features of a (non meta-data) message"""
+    codec = get_wire_codec(header.codec)
+    if header.is_chunked:
+        # the padding is restored by _recv_chunks
+        features = codec.decode(parts[-1:], dtype)
+        if header.is_packed and packed_sequence:
+            return pack_padded_sequence(
+                features, parts[0], batch_first=True, enforce_sorted=False
+            )
+        return features
+    if not header.is_packed:
+        return codec.decode(parts, dtype)
+
+    lengths = parts[0]
+    frames = codec.decode(parts[1:], dtype)
+    if packed_sequence:
+        return pack_sequence(
+            torch.split(frames, lengths.tolist()), enforce_sorted=False
+        )
+    shape = [lengths.size(0), header.padded_len] + list(frames.size()[1:])
+    return restore_padding(
+        frames, lengths, header.padded_len, _empty(shape, dtype, pool)
+    )
+
+
+def _parts(header: Header, payload) -> List[torch.Tensor]:
+    """The tensors of a payload received by _recv_frame"""
+    if header.is_chunked:
+        return payload  # already split by _recv_chunks
+    if header.has_parts:
+        return unpack_parts(payload)
+    return [payload]
+
+
+def _empty(shape, dtype: torch.dtype, pool: Optional[BufferPool]) -> torch.Tensor:
+    if pool is not None:
+        return pool.empty(shape, dtype)
+    return torch.empty(shape, dtype=dtype)  # random value in tensor
+
+
+def _recv_frame(
+    rank: int, pool: Optional[BufferPool] = None
+) -> Tuple[Header, torch.Tensor]:
+    """Receive a header and its payload (version 2 of the wire format)
+
+    Returns:
+        Tuple(Header, torch.Tensor): [the header, the payload or the meta-data]
+        (the list of tensors returned by _recv_chunks with FLAG_CHUNKED)
+    """
+    buff_header = empty_header()
+    get_transport(rank).recv(buff_header, rank)
+    header = Header.unpack(buff_header)
+
+    if header.is_meta_data:
+        return header, header.meta_data
+    if header.is_control:
+        return header, None
+    if header.is_zero:
+        return header, _empty(header.shape, header.dtype, pool).zero_()
+    if header.is_chunked:
+        return header, _recv_chunks(rank, header, pool)
+
+    # value of (eg: B x Tmax x D)
+    recv_buff = _empty(header.shape, header.dtype, pool)
+    get_transport(rank).recv(recv_buff, rank)
+    return header, recv_buff
+
+
+def _recv_chunks(
+    rank: int, header: Header, pool: Optional[BufferPool] = None
+) -> List[torch.Tensor]:
+    """Receive a chunked payload (version 4 of the wire format)
+
+    The chunks are received in place into the tensor (through a buffer of the
+    size of a chunk when they are not contiguous in it, or not padded).
+
+    Returns:
+        List[torch.Tensor]: [the lengths (FLAG_PACKED),] the tensor
+    """
+    transport = get_transport(rank)
+    out = _empty(header.shape, header.dtype, pool)
+    lengths = None
+    if header.is_packed:
+        lengths = torch.empty(header.shape[0], dtype=torch.int64)
+        transport.recv(lengths, rank)
+
+    staging: Optional[torch.Tensor] = None
+    if lengths is not None:
+        out.zero_()  # padding
+        for ranges in packed_chunks(lengths, header.chunk_len):
+            if staging is None:
+                shape = [header.chunk_len] + header.shape[2:]
+                staging = torch.empty(shape, dtype=header.dtype)
+            frames = staging[: sum(end - start for _, start, end in ranges)]
+            transport.recv(frames, rank)
+            offset = 0
+            for b, start, end in ranges:
+                out[b, start:end] = frames[offset : offset + end - start]
+                offset += end - start
+        return [lengths, out]
+
+    size = header.shape[header.chunk_dim]
+    chunk_numel = out.numel() // size * header.chunk_len
+    for start in range(0, size, header.chunk_len):
+        dest = out.narrow(header.chunk_dim, start, min(header.chunk_len, size - start))
+        if dest.is_contiguous():
+            transport.recv(dest, rank)
+            continue
+        if staging is None:
+            staging = torch.empty(chunk_numel, dtype=header.dtype)
+        chunk = staging[: dest.numel()].view(dest.size())
+        transport.recv(chunk, rank)
+        dest.copy_(chunk)
+    return [out]
+
+
+def _recv_legacy(
+    rank: int, dtype: torch.dtype, pool: Optional[BufferPool] = None
+) -> Tuple[torch.Tensor, bool]:
     exchange_dimensions = torch.zeros(1, dtype=torch.int)  # dimensions (eg: 3)
-    dist.recv(exchange_dimensions, src=rank)
+    get_transport(rank).recv(exchange_dimensions, rank)
 
     # a negative value of exchange_dimensions indicate a meta-data exchange
     if exchange_dimensions[0] == -1:
         buff_meta_data = torch.zeros(5, dtype=torch.int)
-        dist.recv(buff_meta_data, src=rank)
+        get_transport(rank).recv(buff_meta_data, rank)
         return buff_meta_data, True
 
     exchange_size = torch.zeros(  # shape of (eg: B x Tmax X D)
         exchange_dimensions, dtype=torch.int
     )
-    dist.recv(exchange_size, src=rank)
+    get_transport(rank).recv(exchange_size, rank)
 
-    recv_buff = torch.empty(  # value of (eg: B x Tmax x D)
-        *exchange_size.tolist(), dtype=dtype,
-    )  # random value in tensor
-    dist.recv(recv_buff, src=rank)
+    # value of (eg: B x Tmax x D)
+    recv_buff = _empty(exchange_size.tolist(), dtype, pool)
+    get_transport(rank).recv(recv_buff, rank)
     return recv_buff, False
@@ -0,0 +1,470 @@
+from collections import deque
+from contextlib import ExitStack
+from typing import List, Optional, Tuple, Union
+
+import torch
+
+from .codec import WireCodec, get_wire_codec
+from .control import CONTROL_WIRE_VERSION, publish_control, switch_control
+from .control import take_control
+from .distributed_init import peer_wire_version
+from .header import Header, FLAG_META, FLAG_PARTS, FLAG_FUSED, FLAG_PACKED
+from .header import FLAG_ZERO, FLAG_CONTROL, FLAG_CHUNKED, FLAG_MODE
+from .header import H_FLAGS, H_META, H_SEQ, META_LEN
+from .header import LEGACY_WIRE_VERSION, CHUNKED_WIRE_VERSION
+from .header import element_size, pack_parts, packed_chunks, remove_padding
+from .transport import GroupWork, Transport, get_transport
+
+# number of chunks being sent while the next one is converted (isend chunk_bytes)
+CHUNK_PIPELINE_DEPTH = 2
+
+
+def isend(
+    dst: int,
+    tensor: torch.Tensor,
+    dtype: torch.dtype = torch.float32,
+    codec: Union[str, WireCodec, None] = None,
+    lengths: Optional[torch.Tensor] = None,
+    chunk_bytes: int = 0,
+):
+    """Sends a tensor asynchronously to a peer
+
+    The wire format is negotiated with the peer (see damped.utils.header).
+
+    With ``chunk_bytes``, the tensor is split along the batch axis (or the
+    time axis when a single sequence is larger, or into runs of valid frames
+    with ``lengths``) into chunks of about chunk_bytes bytes on the wire. Each chunk is converted while the previous
+    ones are sent, the receiver reassembles them in place: the extra memory
+    used on both sides is bounded by the chunk size instead of the tensor
+    size. Ignored by peers older than the version 4 of the wire format, and
+    with the codecs that encode the whole tensor at once ("int8", "topk").
+
+    Args:
+        dst (int): rank of the peer in the distributed env
+        tensor (torch.Tensor): Tensor to send (must be allocated on the CPU)
+        dtype (torch.dtype, optional): the desired data type of sent tensor
+        codec (str, optional): encoding of the tensor on the wire
+            ("none", "fp16", "bf16", "int8"), see damped.utils.codec.
+            Ignored by legacy peers.
+        lengths (torch.Tensor, optional): length of each sequence of a
+            (B x Tmax x ...) tensor, only the valid frames are sent.
+            Ignored by legacy peers.
+        chunk_bytes (int, optional): size of the chunks (0: not chunked)
+
+    Returns:
+        A distributed request object. (call ``wait()`` to block the process
+        until the operation is finished)
+    """
+    shape = tensor.size()
+    if peer_wire_version(dst) == LEGACY_WIRE_VERSION:
+        transport = get_transport(dst)
+        with transport.frame():
+            #  share the number of dimensions in the tensor (3 in B x Tmax x D)
+            transport.send(torch.tensor(len(shape), dtype=torch.int), dst)
+            # send the tensor shape for correct a memory allocation on the worker side
+            # can be (B x Tmax x D)
+            transport.send(torch.tensor(shape, dtype=torch.int), dst)
+            return transport.isend(tensor.to(dtype).contiguous(), dst)
+
+    codec = get_wire_codec(codec)
+    if (
+        chunk_bytes > 0
+        and codec.chunkable
+        and tensor.dim() > 0
+        and tensor.numel() > 0
+        and peer_wire_version(dst) >= CHUNKED_WIRE_VERSION
+    ):
+        return _isend_chunked(dst, tensor, dtype, codec, lengths, chunk_bytes)
+    return isend_frame(dst, frame(tensor, dtype, codec, lengths))
+
+
+def _isend_chunked(
+    dst: int,
+    tensor: torch.Tensor,
+    dtype: torch.dtype,
+    codec: WireCodec,
+    lengths: Optional[torch.Tensor],
+    chunk_bytes: int,
+) -> GroupWork:
+    """Sends a tensor in chunks (version 4 of the wire format)"""
+    wire_dtype = codec.encode(tensor[:0], dtype)[1][0]
+    chunk_dim = 0
+    slice_bytes = tensor[0].numel() * element_size(wire_dtype)
+    if lengths is not None:
+        # chunks of valid frames, a sequence can span several chunks
+        chunk_dim = 1
+        slice_bytes = tensor[0, 0].numel() * element_size(wire_dtype)
+    elif tensor.dim() > 1 and slice_bytes > chunk_bytes:
+        # a single sequence is larger than a chunk
+        chunk_dim = 1
+        slice_bytes = tensor.select(1, 0).numel() * element_size(wire_dtype)
+    chunk_len = max(1, chunk_bytes // max(1, slice_bytes))
+
+    header = Header(
+        flags=FLAG_CHUNKED,
+        dtype=wire_dtype,
+        shape=list(tensor.size()),
+        codec=codec.code,
+        chunk_len=chunk_len,
+        chunk_dim=chunk_dim,
+    )
+    if lengths is not None:
+        lengths = torch.as_tensor(lengths, dtype=torch.int64)
+        header.flags |= FLAG_PACKED
+        header.padded_len = tensor.size(1)
+
+    transport = get_transport(dst)
+    works = deque()
+    if lengths is None:
+        size = tensor.size(chunk_dim)
+        chunks = (
+            tensor.narrow(chunk_dim, start, min(chunk_len, size - start))
+            for start in range(0, size, chunk_len)
+        )
+    else:
+        chunks = (
+            torch.cat([tensor[b, start:end] for b, start, end in ranges])
+            for ranges in packed_chunks(lengths, chunk_len)
+        )
+    with transport.frame():
+        _isend_header(transport, dst, header.pack()).wait()
+        if lengths is not None:
+            works.append(transport.isend(lengths, dst))
+        for chunk in chunks:
+            parts, dtypes = codec.encode(chunk, dtype)
+            # converted while the previous chunks are being sent
+            works.append(transport.isend(parts[0].to(dtypes[0]).contiguous(), dst))
+            while len(works) > CHUNK_PIPELINE_DEPTH:
+                works.popleft().wait()
+    return GroupWork(list(works))
+
+
+def isend_zeros(
+    dst: int, shape: List[int], dtype: torch.dtype = torch.float32
+):
+    """Sends a tensor of zeros to a peer, without sending its values
+
+    Used to send back a null gradient (eg: trainer.py in eval mode).
+    Legacy peers are sent the full tensor.
+
+    Args:
+        dst (int): rank of the peer in the distributed env
+        shape (List[int]): the shape of the tensor
+        dtype (torch.dtype, optional): the data type of the tensor
+
+    Returns:
+        A distributed request object.
+    """
+    if peer_wire_version(dst) == LEGACY_WIRE_VERSION:
+        return isend(dst, torch.zeros(shape, dtype=dtype), dtype)
+    header = Header(flags=FLAG_ZERO, dtype=dtype, shape=list(shape))
+    transport = get_transport(dst)
+    with transport.frame():
+        return _isend_header(transport, dst, header.pack())
+
+
+def isend_fused(
+    dst: int,
+    label: torch.Tensor,
+    features: torch.Tensor,
+    dtype: Tuple[torch.dtype, torch.dtype] = (torch.float32, torch.float32),
+    codec: Union[str, WireCodec, None] = None,
+    lengths: Optional[torch.Tensor] = None,
+):
+    """Sends a label and its features in a single message
+
+    label and features are packed into one contiguous buffer (see
+    damped.utils.header.pack_parts), fork_recv returns views into it.
+    Only supported by peers that speak the version 2 of the wire format.
+
+    Args:
+        dst (int): rank of the peer in the distributed env
+        label (torch.Tensor): tensor of y label
+        features (torch.Tensor): tensor of features
+        dtype (Tuple(torch.dtype, torch.dtype), optional): the desired data
+            type of sent tensor. The first dtype if for the feature, the
+            second if for the label.
+        codec (str, optional): encoding of the features on the wire
+        lengths (torch.Tensor, optional): length of each sequence of the
+            (B x Tmax x ...) features, only the valid frames are sent.
+
+    Returns:
+        A distributed request object. (call ``wait()`` to block the process
+        until the operation is finished)
+    """
+    return isend_frame(dst, frame_fused(label, features, dtype, codec, lengths))
+
+
+def ibroadcast(
+    dsts: List[int],
+    tensor: torch.Tensor,
+    dtype: torch.dtype = torch.float32,
+    codec: Union[str, WireCodec, None] = None,
+    lengths: Optional[torch.Tensor] = None,
+) -> GroupWork:
+    """Sends a tensor asynchronously to several peers
+
+    The tensor is converted and framed once, then sent concurrently to all
+    the peers (legacy peers are sent a legacy message each).
+
+    Args:
+        dsts (List[int]): ranks of the peers in the distributed env
+        tensor (torch.Tensor): Tensor to send (must be allocated on the CPU)
+        dtype (torch.dtype, optional): the desired data type of sent tensor
+        codec (str, optional): encoding of the tensor on the wire
+        lengths (torch.Tensor, optional): length of each sequence of a
+            (B x Tmax x ...) tensor, only the valid frames are sent.
+
+    Returns:
+        GroupWork: the requests of all the peers (call ``wait()`` to block
+        the process until all the operations are finished)
+    """
+    legacy, dsts = _split_legacy(dsts)
+    works = [isend(dst, tensor, dtype) for dst in legacy]
+    if len(dsts) > 0:
+        works += _ibroadcast_frame(dsts, frame(tensor, dtype, codec, lengths))
+    return GroupWork(works)
+
+
+def ibroadcast_fused(
+    dsts: List[int],
+    label: torch.Tensor,
+    features: torch.Tensor,
+    dtype: Tuple[torch.dtype, torch.dtype] = (torch.float32, torch.float32),
+    codec: Union[str, WireCodec, None] = None,
+    lengths: Optional[torch.Tensor] = None,
+) -> GroupWork:
+    """Sends a label and its features in a single message to several peers
+
+    Legacy peers are sent the label and the features separately.
+
+    Args:
+        dsts (List[int]): ranks of the peers in the distributed env
+        label (torch.Tensor): tensor of y label
+        features (torch.Tensor): tensor of features
+        dtype (Tuple(torch.dtype, torch.dtype), optional): the desired data
+            type of sent tensor. The first dtype if for the feature, the
+            second if for the label.
+        codec (str, optional): encoding of the features on the wire
+        lengths (torch.Tensor, optional): length of each sequence of the
+            (B x Tmax x ...) features, only the valid frames are sent.
+
+    Returns:
+        GroupWork: the requests of all the peers
+    """
+    legacy, dsts = _split_legacy(dsts)
+    works = []
+    for dst in legacy:
+        works += [isend(dst, label, dtype[1]), isend(dst, features, dtype[0])]
+    if len(dsts) > 0:
+        works += _ibroadcast_frame(
+            dsts, frame_fused(label, features, dtype, codec, lengths)
+        )
+    return GroupWork(works)
+
+
+def frame(
+    tensor: torch.Tensor,
+    dtype: torch.dtype = torch.float32,
+    codec: Union[str, WireCodec, None] = None,
+    lengths: Optional[torch.Tensor] = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Encode a tensor into a message (version 2 of the wire format)
+
+    Returns:
+        Tuple(torch.Tensor, torch.Tensor): [the packed header, the payload]
+    """
+    codec = get_wire_codec(codec)
+    if lengths is not None:
+        parts, dtypes, padded_len = _encode_packed(tensor, dtype, codec, lengths)
+        return _frame_parts(
+            parts, dtypes, FLAG_PARTS | FLAG_PACKED, codec, padded_len
+        )
+
+    parts, dtypes = codec.encode(tensor, dtype)
+    if len(parts) == 1:
+        header = Header(dtype=dtypes[0], shape=list(tensor.size()), codec=codec.code)
+        # gloo only sends contiguous tensors (eg: subsampled features)
+        return header.pack(), parts[0].to(dtypes[0]).contiguous()
+    return _frame_parts(parts, dtypes, FLAG_PARTS, codec)
+
+
+def frame_fused(
+    label: torch.Tensor,
+    features: torch.Tensor,
+    dtype: Tuple[torch.dtype, torch.dtype] = (torch.float32, torch.float32),
+    codec: Union[str, WireCodec, None] = None,
+    lengths: Optional[torch.Tensor] = None,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Encode a label and its features into a single message
+
+    Returns:
+        Tuple(torch.Tensor, torch.Tensor): [the packed header, the payload]
+    """
+    codec = get_wire_codec(codec)
+    flags = FLAG_PARTS | FLAG_FUSED
+    padded_len = 0
+    if lengths is not None:
+        flags |= FLAG_PACKED
+        parts, dtypes, padded_len = _encode_packed(features, dtype[0], codec, lengths)
+    else:
+        parts, dtypes = codec.encode(features, dtype[0])
+    return _frame_parts(
+        [label] + parts, [dtype[1]] + dtypes, flags, codec, padded_len
+    )
+
+
+def isend_frame(dst: int, message: Tuple[torch.Tensor, torch.Tensor]):
+    """Sends a message built by frame() or frame_fused()"""
+    header, payload = message
+    transport = get_transport(dst)
+    with transport.frame():
+        _isend_header(transport, dst, header).wait()
+        return transport.isend(payload, dst)
+
+
+def _ibroadcast_frame(dsts: List[int], message: Tuple[torch.Tensor, torch.Tensor]):
+    header, payload = message
+    # the header and payload to the same peer are delivered in order
+    with ExitStack() as frames:
+        for dst in dsts:
+            frames.enter_context(get_transport(dst).frame())
+        works = [_isend_header(get_transport(dst), dst, header) for dst in dsts]
+        works += [get_transport(dst).isend(payload, dst) for dst in dsts]
+    return works
+
+
+def _isend_header(transport: Transport, dst: int, header: torch.Tensor):
+    """Sends a packed header, carrying the control states switched since the
+    last message sent to dst (see damped.utils.control)
+
+    Returns:
+        The request of the header.
+    """
+    modes = take_control(dst)
+    if len(modes) == 0:
+        return transport.isend(header, dst)
+    if header[H_FLAGS] & (FLAG_META | FLAG_CONTROL):
+        # the meta-data slots of the header are taken
+        last = []
+    else:
+        modes, last = modes[:-1], modes[-1:]
+    # the previous control states are sent as header only meta-data
+    for seq, meta_data in modes:
+        mode_header = Header(
+            flags=FLAG_META, dtype=torch.int32, meta_data=meta_data, seq=seq
+        )
+        transport.send(mode_header.pack(), dst)
+    for seq, meta_data in last:
+        header = header.clone()  # might be shared by several peers
+        header[H_FLAGS] |= FLAG_MODE
+        header[H_META : H_META + META_LEN] = meta_data
+        header[H_SEQ] = seq
+    return transport.isend(header, dst)
+
+
+def _split_legacy(dsts: List[int]) -> Tuple[List[int], List[int]]:
+    legacy = [d for d in dsts if peer_wire_version(d) == LEGACY_WIRE_VERSION]
+    return legacy, [d for d in dsts if d not in legacy]
+
+
+def _encode_packed(
+    tensor: torch.Tensor,
+    dtype: torch.dtype,
+    codec: WireCodec,
+    lengths: torch.Tensor,
+) -> Tuple[List[torch.Tensor], List[torch.dtype], int]:
+    """Encode the valid frames of padded sequences, preceded by their lengths"""
+    lengths = torch.as_tensor(lengths, dtype=torch.int64)
+    parts, dtypes = codec.encode(remove_padding(tensor, lengths), dtype)
+    return [lengths] + parts, [torch.int64] + dtypes, tensor.size(1)
+
+
+def _frame_parts(
+    parts: List[torch.Tensor],
+    dtypes: List[torch.dtype],
+    flags: int,
+    codec: WireCodec,
+    padded_len: int = 0,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    buff = pack_parts(parts, dtypes)
+    header = Header(
+        flags=flags,
+        dtype=torch.uint8,
+        shape=list(buff.size()),
+        codec=codec.code,
+        padded_len=padded_len,
+    )
+    return header.pack(), buff
+
+
+def update_control(dst: int, meta_data: torch.Tensor) -> None:
+    """Switches the mode (damped.disturb.const signal) of the next messages
+    sent to a peer
+
+    No message is sent, the header of the next message carries the new mode
+    (see damped.utils.control). Peers older than the version 3 of the wire
+    format are sent the meta-data in-band.
+
+    Args:
+        dst (int): rank of the peer in the distributed env
+        meta_data (torch.Tensor): the new mode
+    """
+    if peer_wire_version(dst) < CONTROL_WIRE_VERSION:
+        send_meta_data(dst, meta_data)
+        return
+    switch_control(dst, meta_data)
+
+
+def send_meta_data(dst: int, meta_data: torch.Tensor) -> None:
+    """Sends meta-data (damped.disturb.const signals) to a peer
+
+    The peer receives the meta-data even if no data message follows (eg:
+    the stop signal, published in the rendezvous store with the version 3
+    of the wire format). See update_control for the other mode switches.
+
+    Args:
+        dst (int): rank of the peer in the distributed env
+        meta_data (torch.Tensor): the signal to send
+    """
+    if peer_wire_version(dst) == LEGACY_WIRE_VERSION:
+        # indicate for meta-data exchange
+        with get_transport(dst).frame():
+            get_transport(dst).send(torch.tensor(-1, dtype=torch.int), dst)
+            get_transport(dst).send(meta_data, dst)
+        return
+
+    transport = get_transport(dst)
+    with transport.frame():
+        _isend_header(transport, dst, _meta_data_header(dst, meta_data)).wait()
+
+
+def broadcast_meta_data(dsts: List[int], meta_data: torch.Tensor) -> None:
+    """Sends meta-data (damped.disturb.const signals) to several peers at once
+
+    Args:
+        dsts (List[int]): ranks of the peers in the distributed env
+        meta_data (torch.Tensor): the signal to send
+    """
+    legacy, dsts = _split_legacy(dsts)
+    for dst in legacy:
+        send_meta_data(dst, meta_data)
+    with ExitStack() as frames:
+        works = []
+        for dst in dsts:
+            transport = get_transport(dst)
+            frames.enter_context(transport.frame())
+            works.append(
+                _isend_header(transport, dst, _meta_data_header(dst, meta_data))
+            )
+    GroupWork(works).wait()
+
+
+def _meta_data_header(dst: int, meta_data: torch.Tensor) -> torch.Tensor:
+    if peer_wire_version(dst) < CONTROL_WIRE_VERSION:
+        header = Header(flags=FLAG_META, dtype=torch.int32, meta_data=meta_data)
+        return header.pack()
+    # published out-of-band (no data message follows), the header wakes the
+    # peer up
+    seq = publish_control(dst, meta_data)
+    return Header(flags=FLAG_CONTROL, dtype=torch.int32, seq=seq).pack()
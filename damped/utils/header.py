@@ -0,0 +1,354 @@
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+import functools
+import operator
+
+import torch
+
+"""
+Wire format used to exchange tensors between a damped.disturb-ed toolkit and
+the domain task trainers.
+
+Version 1 (legacy):
+    ndim (int32[1]) -> shape (int32[ndim]) -> payload
+    meta-data: -1 (int32[1]) -> meta_data (int32[5])
+
+Version 2:
+    header (int32[HEADER_LEN]) -> payload
+    meta-data: header only (FLAG_META, meta_data carried by the header)
+    parts: header (FLAG_PARTS) -> uint8 payload holding several tensors
+    zeros: header only (FLAG_ZERO, a tensor of zeros of the header shape)
+
+Version 3:
+    same as version 2, a message can carry the control state switched before
+    it (FLAG_MODE, meta_data carried by the header, see damped.utils.control).
+    stop: published in the rendezvous store, header only message
+    (FLAG_CONTROL) to wake the peer up.
+
+Version 4:
+    chunked: header (FLAG_CHUNKED) -> one message per chunk of the payload
+    (split along the chunk dimension, chunk length slices per message).
+    With FLAG_PACKED, the lengths (int64[B]) are sent first, then the valid
+    frames (sum(lengths) x ...) in chunks of chunk length frames (a sequence
+    can span several chunks, see packed_chunks).
+
+Parts payload layout (int64 offset table, then the tensors data):
+[
+ 0: number of parts
+ per part (PART_LEN values):
+   dtype code, ndim, shape (MAX_NDIM values), byte offset in the payload
+]
+
+Header layout (version 2 and 3):
+[
+ 0:  magic number (MAGIC)
+ 1:  wire version
+ 2:  flags (FLAG_*)
+ 3:  dtype code of the payload (see DTYPE_CODES)
+ 4:  number of dimensions of the payload
+ 5-12: shape of the payload (MAX_NDIM values, padded with 0)
+ 13-17: meta-data (see damped.disturb.const)
+ 18: wire codec of the features (see damped.utils.codec.WireCodec)
+ 19: padded length (Tmax) of packed sequences (FLAG_PACKED)
+ 20: sequence number of the control state (FLAG_MODE or FLAG_CONTROL, version 3)
+ 21: chunk length (FLAG_CHUNKED, version 4)
+ 22: chunk dimension (FLAG_CHUNKED: 0 batch, 1 time or valid frames)
+ 23-31: reserved
+]
+"""
+
+MAGIC = 0x64616D70  # "damp"
+WIRE_VERSION = 4
+LEGACY_WIRE_VERSION = 1
+CHUNKED_WIRE_VERSION = 4
+
+HEADER_LEN = 32
+MAX_NDIM = 8
+META_LEN = 5
+
+H_MAGIC = 0
+H_VERSION = 1
+H_FLAGS = 2
+H_DTYPE = 3
+H_NDIM = 4
+H_SHAPE = 5
+H_META = H_SHAPE + MAX_NDIM
+H_CODEC = H_META + META_LEN
+H_PADDED_LEN = H_CODEC + 1
+H_SEQ = H_PADDED_LEN + 1
+H_CHUNK_LEN = H_SEQ + 1
+H_CHUNK_DIM = H_CHUNK_LEN + 1
+
+FLAG_META = 1 << 0
+FLAG_PARTS = 1 << 1  # the payload is a uint8 buffer holding several tensors
+FLAG_FUSED = 1 << 2  # the first part is the label, the next ones the features
+FLAG_PACKED = 1 << 3  # features without padding, preceded by their lengths part
+FLAG_ZERO = 1 << 4  # no payload, the tensor is filled with zeros
+FLAG_CONTROL = 1 << 5  # no payload, the control state changed
+FLAG_CHUNKED = 1 << 6  # the payload is sent in several messages
+FLAG_MODE = 1 << 7  # the meta-data is the control state switched before the message
+
+PART_LEN = 3 + MAX_NDIM
+PART_ALIGN = 64  # bytes
+
+DTYPE_CODES = {
+    torch.float32: 1,
+    torch.float64: 2,
+    torch.float16: 3,
+    torch.bfloat16: 4,
+    torch.uint8: 5,
+    torch.int8: 6,
+    torch.int16: 7,
+    torch.int32: 8,
+    torch.int64: 9,
+    torch.bool: 10,
+}
+CODES_DTYPE = {v: k for k, v in DTYPE_CODES.items()}
+
+
+def dtype_to_code(dtype: torch.dtype) -> int:
+    if dtype not in DTYPE_CODES:
+        raise ValueError(f"dtype {dtype} can not be sent over the wire")
+    return DTYPE_CODES[dtype]
+
+
+def code_to_dtype(code: int) -> torch.dtype:
+    if code not in CODES_DTYPE:
+        raise ValueError(f"Unknown dtype code {code} received")
+    return CODES_DTYPE[code]
+
+
+@dataclass
+class Header(object):
+    """
+    Decoded version 2 (or 3) header.
+    """
+
+    flags: int = 0
+    dtype: torch.dtype = torch.float32
+    shape: List[int] = field(default_factory=list)
+    meta_data: Optional[torch.Tensor] = None
+    codec: int = 0
+    padded_len: int = 0
+    seq: int = 0
+    chunk_len: int = 0
+    chunk_dim: int = 0
+    version: int = WIRE_VERSION
+
+    @property
+    def is_meta_data(self) -> bool:
+        return bool(self.flags & FLAG_META)
+
+    @property
+    def is_fused(self) -> bool:
+        return bool(self.flags & FLAG_FUSED)
+
+    @property
+    def has_parts(self) -> bool:
+        return bool(self.flags & FLAG_PARTS)
+
+    @property
+    def is_packed(self) -> bool:
+        return bool(self.flags & FLAG_PACKED)
+
+    @property
+    def is_zero(self) -> bool:
+        return bool(self.flags & FLAG_ZERO)
+
+    @property
+    def is_control(self) -> bool:
+        return bool(self.flags & FLAG_CONTROL)
+
+    @property
+    def is_chunked(self) -> bool:
+        return bool(self.flags & FLAG_CHUNKED)
+
+    @property
+    def has_mode(self) -> bool:
+        return bool(self.flags & FLAG_MODE)
+
+    def pack(self) -> torch.Tensor:
+        """Encode the header into a fixed size int32 tensor"""
+        if len(self.shape) > MAX_NDIM:
+            raise ValueError(
+                f"Tensor of {len(self.shape)} dimensions can not be sent (max: {MAX_NDIM})"
+            )
+        buff = torch.zeros(HEADER_LEN, dtype=torch.int)
+        buff[H_MAGIC] = MAGIC
+        buff[H_VERSION] = self.version
+        buff[H_FLAGS] = self.flags
+        buff[H_DTYPE] = dtype_to_code(self.dtype)
+        buff[H_NDIM] = len(self.shape)
+        if len(self.shape) > 0:
+            buff[H_SHAPE : H_SHAPE + len(self.shape)] = torch.tensor(
+                self.shape, dtype=torch.int
+            )
+        if self.meta_data is not None:
+            buff[H_META : H_META + META_LEN] = self.meta_data
+        buff[H_CODEC] = self.codec
+        buff[H_PADDED_LEN] = self.padded_len
+        buff[H_SEQ] = self.seq
+        buff[H_CHUNK_LEN] = self.chunk_len
+        buff[H_CHUNK_DIM] = self.chunk_dim
+        return buff
+
+    @staticmethod
+    def unpack(buff: torch.Tensor) -> "Header":
+        """Decode a header received from the wire"""
+        values = buff.tolist()
+        if values[H_MAGIC] != MAGIC:
+            raise RuntimeError(
+                "Corrupted stream: received an invalid damped header (wrong magic)"
+            )
+        ndim = values[H_NDIM]
+        header = Header(
+            flags=values[H_FLAGS],
+            dtype=code_to_dtype(values[H_DTYPE]),
+            shape=values[H_SHAPE : H_SHAPE + ndim],
+            codec=values[H_CODEC],
+            padded_len=values[H_PADDED_LEN],
+            seq=values[H_SEQ],
+            chunk_len=values[H_CHUNK_LEN],
+            chunk_dim=values[H_CHUNK_DIM],
+            version=values[H_VERSION],
+        )
+        if header.is_meta_data or header.has_mode:
+            header.meta_data = buff[H_META : H_META + META_LEN].clone()
+        return header
+
+
+def empty_header() -> torch.Tensor:
+    """Allocate a buffer able to receive a header"""
+    return torch.zeros(HEADER_LEN, dtype=torch.int)
+
+
+def element_size(dtype: torch.dtype) -> int:
+    return torch.empty(0, dtype=dtype).element_size()
+
+
+def _align(offset: int) -> int:
+    return (offset + PART_ALIGN - 1) // PART_ALIGN * PART_ALIGN
+
+
+def pack_parts(
+    tensors: List[torch.Tensor], dtypes: List[torch.dtype]
+) -> torch.Tensor:
+    """Pack several tensors into one contiguous uint8 buffer
+
+    The tensors are converted to their dtype while being copied into the
+    buffer.
+
+    Args:
+        tensors (List[torch.Tensor]): the tensors to pack
+        dtypes (List[torch.dtype]): the desired data type of each packed tensor
+
+    Returns:
+        torch.Tensor: the uint8 buffer (offset table followed by the tensors)
+    """
+    table = [len(tensors)]
+    offsets = []
+    offset = _align((1 + len(tensors) * PART_LEN) * 8)
+    for tensor, dtype in zip(tensors, dtypes):
+        shape = list(tensor.size())
+        if len(shape) > MAX_NDIM:
+            raise ValueError(
+                f"Tensor of {len(shape)} dimensions can not be sent (max: {MAX_NDIM})"
+            )
+        table += [dtype_to_code(dtype), len(shape)]
+        table += shape + [0] * (MAX_NDIM - len(shape))
+        table += [offset]
+        offsets.append(offset)
+        offset = _align(offset + tensor.numel() * element_size(dtype))
+
+    buff = torch.empty(offset, dtype=torch.uint8)
+    buff[: len(table) * 8].view(torch.int64).copy_(
+        torch.tensor(table, dtype=torch.int64)
+    )
+    for tensor, dtype, offset in zip(tensors, dtypes, offsets):
+        nbytes = tensor.numel() * element_size(dtype)
+        buff[offset : offset + nbytes].view(dtype).view(tensor.size()).copy_(tensor)
+    return buff
+
+
+def unpack_parts(buff: torch.Tensor) -> List[torch.Tensor]:
+    """Get the tensors packed with pack_parts
+
+    Args:
+        buff (torch.Tensor): uint8 buffer created by pack_parts
+
+    Returns:
+        List[torch.Tensor]: views into buff (no copy)
+    """
+    n_parts = int(buff[:8].view(torch.int64)[0])
+    table = buff[: (1 + n_parts * PART_LEN) * 8].view(torch.int64).tolist()
+    parts = []
+    for i in range(n_parts):
+        entry = table[1 + i * PART_LEN : 1 + (i + 1) * PART_LEN]
+        dtype = code_to_dtype(entry[0])
+        shape = entry[2 : 2 + entry[1]]
+        offset = entry[2 + MAX_NDIM]
+        numel = functools.reduce(operator.mul, shape, 1)
+        nbytes = numel * element_size(dtype)
+        parts.append(buff[offset : offset + nbytes].view(dtype).view(shape))
+    return parts
+
+
+def remove_padding(tensor: torch.Tensor, lengths: torch.Tensor) -> torch.Tensor:
+    """Keep the valid frames of a batch of padded sequences
+
+    Args:
+        tensor (torch.Tensor): padded sequences (B x Tmax x ...)
+        lengths (torch.Tensor): length of each sequence (B)
+
+    Returns:
+        torch.Tensor: the valid frames (sum(lengths) x ...)
+    """
+    mask = torch.arange(tensor.size(1)).unsqueeze(0) < lengths.unsqueeze(1)
+    return tensor[mask]
+
+
+def packed_chunks(
+    lengths: torch.Tensor, chunk_len: int
+) -> Iterator[List[Tuple[int, int, int]]]:
+    """Split the valid frames of a batch of padded sequences into chunks of
+    chunk_len frames (the last one can be shorter)
+
+    Args:
+        lengths (torch.Tensor): length of each sequence (B)
+        chunk_len (int): number of frames per chunk
+
+    Returns:
+        Iterator[List[Tuple[int, int, int]]]: the (sequence, first frame,
+        last frame + 1) ranges of each chunk, in the order of remove_padding
+    """
+    ranges: List[Tuple[int, int, int]] = []
+    size = 0
+    for b, length in enumerate(lengths.tolist()):
+        start = 0
+        while start < length:
+            end = min(length, start + chunk_len - size)
+            ranges.append((b, start, end))
+            size += end - start
+            start = end
+            if size == chunk_len:
+                yield ranges
+                ranges, size = [], 0
+    if ranges:
+        yield ranges
+
+
+def restore_padding(
+    frames: torch.Tensor, lengths: torch.Tensor, padded_len: int, out: torch.Tensor
+) -> torch.Tensor:
+    """Inverse of remove_padding
+
+    Args:
+        frames (torch.Tensor): the valid frames (sum(lengths) x ...)
+        lengths (torch.Tensor): length of each sequence (B)
+        padded_len (int): Tmax
+        out (torch.Tensor): the (B x Tmax x ...) tensor to fill (padding set to 0)
+    """
+    mask = torch.arange(padded_len).unsqueeze(0) < lengths.unsqueeze(1)
+    out.zero_()
+    out[mask] = frames
+    return out
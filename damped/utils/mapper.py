@@ -33,7 +33,7 @@ def gender_mapper(dir_path):
     log_once = False
 
     # sent y_mapper (from damped.disturb) to y label (for branch task training)
-    def mapper(y_mapper):
+    def mapper(y_mapper, raw=False):
         nonlocal log_once
         decoded_y_mapped_label = list(
             map(
@@ -41,6 +41,9 @@ def gender_mapper(dir_path):
                 y_mapper.tolist(),
             )
         )
+        if raw:
+            return decoded_y_mapped_label
+
         label = torch.zeros(len(y_mapper), dtype=torch.long)
         # gender 'f' for female, 'm' for male
         indice = {"f": 0, "m": 1}
@@ -176,6 +176,14 @@ class Monitor:
                         self._save_model(metric=metric, do_symlink=True)
                     )
 
+    def last_checkpoint(self):
+        """Returns the path of the last saved iteration checkpoint (or None)."""
+        ckpts = Path(self.save_path).glob("{}-iter*.ckpt".format(self.exp_id))
+        ckpts = sorted(ckpts, key=lambda p: p.stat().st_mtime)
+        if len(ckpts) == 0:
+            return None
+        return str(ckpts[-1])
+
     def load_checkpoint(self, fname, load_opti=True):
         data = self.load_pt_file(fname)
         self.model.load_state_dict(data["model"], strict=True)
@@ -0,0 +1,238 @@
+from dataclasses import dataclass, field
+from threading import Thread
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
+import asyncio
+import queue
+import time
+
+import torch
+from torch.nn.utils.rnn import PackedSequence
+
+from .buffer_pool import BufferPool
+from .context import get_context, set_context
+from .credits import grant_credits
+from .distributed_recv import fork_recv
+
+# polling interval of the queues and requests awaited by the asyncio APIs
+# (seconds, see ForkReceiver.__aiter__ and damped.disturb.DomainTask)
+ASYNC_POLL_INTERVAL = 0.001
+
+
+@dataclass
+class Fork(object):
+    """
+    Features and label forked by a DomainTask (item of a ForkReceiver).
+    """
+
+    rank: int
+    features: Union[torch.Tensor, PackedSequence]
+    label: torch.Tensor
+    # receive buffers of the pool (released when the consumer moves on)
+    _buffers: List[int] = field(default_factory=list, repr=False)
+
+
+@dataclass
+class MetaData(object):
+    """
+    Meta-data (damped.disturb.const signal) sent by a disturb-ed toolkit
+    (item of a ForkReceiver).
+    """
+
+    rank: int
+    meta_data: torch.Tensor
+
+
+@dataclass
+class ProducerStats(object):
+    """
+    Forks received from a disturb-ed toolkit (see ForkReceiver.stats).
+    """
+
+    forks: int = 0
+    bytes: int = 0
+    # time spent waiting for its forks (includes the time the producer was slow)
+    recv_time: float = 0.0
+    stopped: bool = False
+
+
+class _Failure(object):
+    def __init__(self, exception: BaseException):
+        self.exception = exception
+
+
+class _End(object):
+    def __init__(self, rank: int):
+        self.rank = rank
+
+
+class ForkReceiver(torch.utils.data.IterableDataset):
+    """
+    Receives the forks of one or several disturb-ed toolkits on a background
+    thread, ahead of their use (``prefetch`` items), so that receiving
+    overlaps the forward/backward of the domain task.
+
+    Forks and meta-data are delivered as ``Fork`` and ``MetaData`` items.
+    Each rank is received from by its own thread: the items of the rank that
+    is ready first are delivered first (a slow producer does not stall the
+    others), the items of a rank are delivered in the order it sent them.
+    A rank is no longer received from once it has sent the stop signal, the
+    iteration ends when all the ranks have stopped.
+    The per-producer counters are available in ``stats``.
+
+    Example::
+        >>> receiver = utils.ForkReceiver([0], dtype=(torch.float32, torch.long))
+        >>> for item in receiver:
+        ...     if isinstance(item, utils.MetaData):
+        ...         continue
+        ...     y_pred = net(item.features)
+
+    It is also an asynchronous iterator (``async for item in receiver``).
+
+    The buffers of the pool (and the credit of the flow control) of an item
+    are given back when the consumer asks for the next item: the features
+    and label must not be used afterwards.
+    Must be iterated in the process that initialized the distributed env
+    (use a DataLoader with num_workers=0 and batch_size=None).
+    """
+
+    def __init__(
+        self,
+        ranks: List[int],
+        dtype: Tuple[torch.dtype, torch.dtype] = (torch.float32, torch.float32),
+        prefetch: int = 2,
+        pool: Optional[BufferPool] = None,
+        packed_sequence: bool = False,
+        credits: bool = False,
+    ):
+        """
+        Args:
+            ranks (List[int]): ranks of the disturb-ed toolkits
+            dtype (Tuple(torch.dtype, torch.dtype), optional): the desired data
+                type of received tensor. The first dtype if for the feature,
+                the second if for the label.
+            prefetch (int): max number of items received ahead
+            pool (BufferPool, optional): recycle the receive buffers
+            packed_sequence (bool, optional): see damped.utils.fork_recv
+            credits (bool): grant a credit (flow control) to the sender of a
+                fork once it is consumed
+        """
+        super().__init__()
+        assert prefetch > 0, "prefetch must be positive"
+        self.ranks = list(ranks)
+        self.dtype = dtype
+        self.pool = pool
+        self.packed_sequence = packed_sequence
+        self.credits = credits
+        self._queue: queue.Queue = queue.Queue(maxsize=prefetch)
+        self._threads: List[Thread] = []
+        self.stats: Dict[int, ProducerStats] = {r: ProducerStats() for r in ranks}
+        self._start_time = time.time()
+
+    def __iter__(self) -> Iterator[Union[Fork, MetaData]]:
+        self._start()
+        running = len(self.ranks)
+        while running > 0:
+            item = self._queue.get()
+            if isinstance(item, _End):
+                running -= 1
+                continue
+            if isinstance(item, _Failure):
+                raise item.exception
+            yield item
+            # the consumer asks for the next item
+            if isinstance(item, Fork):
+                self._consumed(item)
+
+    async def __aiter__(self) -> AsyncIterator[Union[Fork, MetaData]]:
+        """Same as iterating, without blocking the asyncio event loop"""
+        self._start()
+        running = len(self.ranks)
+        while running > 0:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                # polled: a blocking get in an executor would dequeue (and
+                # lose) an item after the awaiting task is cancelled
+                await asyncio.sleep(ASYNC_POLL_INTERVAL)
+                continue
+            if isinstance(item, _End):
+                running -= 1
+                continue
+            if isinstance(item, _Failure):
+                raise item.exception
+            yield item
+            # the consumer asks for the next item
+            if isinstance(item, Fork):
+                self._consumed(item)
+
+    def _start(self) -> None:
+        assert len(self._threads) == 0, "a ForkReceiver can only be iterated once"
+        self._start_time = time.time()
+        context = get_context()
+        for rank in self.ranks:
+            thread = Thread(
+                target=self._recv_loop,
+                args=(context, rank),
+                name=f"damped-receiver-{rank}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def throughput(self) -> Dict[int, Tuple[float, float]]:
+        """Forks per second and MB per second received from each rank"""
+        elapsed = max(time.time() - self._start_time, 1e-9)
+        return {
+            rank: (s.forks / elapsed, s.bytes / elapsed / 2 ** 20)
+            for rank, s in self.stats.items()
+        }
+
+    def _consumed(self, fork: Fork) -> None:
+        if self.pool is not None:
+            self.pool.release_batch(fork._buffers)
+        if self.credits:
+            grant_credits(fork.rank)
+
+    def _recv_loop(self, context, rank: int) -> None:
+        # receives on behalf of the node that iterates
+        set_context(context, thread=True)
+        # imported here, damped.disturb depends on damped.utils
+        from damped.disturb import const
+
+        stats = self.stats[rank]
+        try:
+            while True:
+                start_time = time.time()
+                try:
+                    features, label, is_meta_data = fork_recv(
+                        rank=rank,
+                        dtype=self.dtype,
+                        pool=self.pool,
+                        packed_sequence=self.packed_sequence,
+                    )
+                except ConnectionError:
+                    # elastic transport: the next fork comes from the
+                    # restarted producer (recv waits for it)
+                    continue
+                if is_meta_data:
+                    self._queue.put(MetaData(rank, label))
+                    if const.should_stop(label):
+                        stats.stopped = True
+                        break
+                    continue
+
+                stats.recv_time += time.time() - start_time
+                stats.forks += 1
+                stats.bytes += _nbytes(features) + _nbytes(label)
+                buffers = self.pool.take_batch() if self.pool is not None else []
+                self._queue.put(Fork(rank, features, label, buffers))
+        except BaseException as e:
+            self._queue.put(_Failure(e))
+            return
+        self._queue.put(_End(rank))
+
+
+def _nbytes(tensor: Union[torch.Tensor, PackedSequence]) -> int:
+    if isinstance(tensor, PackedSequence):
+        tensor = tensor.data
+    return tensor.numel() * tensor.element_size()
@@ -0,0 +1,247 @@
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from threading import Lock, RLock
+import json
+import os
+import random
+import time
+
+import torch
+from torch.nn.utils.rnn import PackedSequence, pack_sequence
+
+from .context import get_context
+from .header import pack_parts, unpack_parts, remove_padding, restore_padding
+from .receiver import Fork, MetaData, ProducerStats, _nbytes
+
+"""
+Recording of the forks sent by a DomainTask, replayed without the disturb-ed
+toolkit (trainer.py --train-mode finetune).
+
+A recording is made of two files:
+  {path}: the forks, one pack_parts buffer per fork (label, features) or
+      (label, lengths, valid frames) when the padding is not sent
+  {path}.index: one JSON object per line, in the order of the stream
+      fork: {"rank": sender, "offset": byte offset, "nbytes": size}
+            (+ "padded_len": Tmax, when the padding was not sent)
+      meta-data: {"rank": sender, "meta": [meta-data values]}
+
+The forks file is memory mapped by the replay (no copy, no decoding).
+
+The offsets of the index come from the writer of the forks file: a recording
+has a single ForkRecorder per process (shared by the DomainTask recording to
+the same path, see get_recorder).
+"""
+
+INDEX_SUFFIX = ".index"
+
+# recordings open in this process (real path -> recorder)
+_recorders: Dict[str, "ForkRecorder"] = {}
+_recorders_mutex = RLock()
+
+
+def get_recorder(path: str) -> "ForkRecorder":
+    """Get the recorder of a recording, shared by all its writers"""
+    with _recorders_mutex:
+        recorder = _recorders.get(os.path.realpath(path))
+        if recorder is None:
+            recorder = ForkRecorder(path)
+        return recorder
+
+
+class ForkRecorder(object):
+    """
+    Appends the forks and meta-data of a stream to a recording (see
+    DomainTask.record).
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): path of the recording (appended to if it exists)
+
+        Raises:
+            ValueError: the recording is already open in this process (its
+                recorder must be shared, see get_recorder)
+        """
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._key = os.path.realpath(path)
+        with _recorders_mutex:
+            if self._key in _recorders:
+                raise ValueError(
+                    f"The recording '{path}' is already open (see damped.utils.get_recorder)"
+                )
+            self._data = open(path, "ab")
+            self._index = open(path + INDEX_SUFFIX, "a")
+            _recorders[self._key] = self
+        self._mutex = Lock()
+
+    def record_fork(
+        self,
+        features: torch.Tensor,
+        label: torch.Tensor,
+        dtype: Tuple[torch.dtype, torch.dtype] = (torch.float32, torch.float32),
+        lengths: Optional[torch.Tensor] = None,
+    ) -> None:
+        """Record a fork (features converted to the dtype sent, before the
+        wire codec)"""
+        features, label = features.detach().cpu(), label.detach().cpu()
+        entry = {"rank": get_context().rank}
+        if lengths is None:
+            buff = pack_parts([label, features], [dtype[1], dtype[0]])
+        else:
+            lengths = torch.as_tensor(lengths, dtype=torch.int64)
+            entry["padded_len"] = features.size(1)
+            buff = pack_parts(
+                [label, lengths, remove_padding(features, lengths)],
+                [dtype[1], torch.int64, dtype[0]],
+            )
+        with self._mutex:
+            entry["offset"] = self._data.tell()
+            entry["nbytes"] = buff.numel()
+            self._data.write(buff.numpy())
+            self._data.flush()
+            self._append(entry)
+
+    def record_meta_data(self, meta_data: torch.Tensor) -> None:
+        """Record a meta-data (damped.disturb.const signal)"""
+        with self._mutex:
+            self._append({"rank": get_context().rank, "meta": meta_data.tolist()})
+
+    def _append(self, entry: Dict) -> None:
+        # written once the data is, a crash leaves a valid recording
+        self._index.write(json.dumps(entry) + "\n")
+        self._index.flush()
+
+    def close(self) -> None:
+        with _recorders_mutex:
+            if _recorders.get(self._key) is self:
+                del _recorders[self._key]
+        with self._mutex:
+            self._data.close()
+            self._index.close()
+
+
+class ForkReplay(torch.utils.data.IterableDataset):
+    """
+    Replays a recording made by ForkRecorder (drop-in replacement of a
+    ForkReceiver, items are ``Fork`` and ``MetaData``).
+
+    The forks in between two meta-data (eg: a training or an evaluation
+    phase) are shuffled with ``shuffle``. The recording is replayed
+    ``epochs`` times, the stop signals are delivered at the end of the last
+    one. No gradient can be sent back.
+
+    Example::
+        >>> replay = utils.ForkReplay("exp/spk.rec", dtype=(torch.float32, torch.long))
+        >>> for item in replay:
+        ...     if isinstance(item, utils.MetaData):
+        ...         continue
+        ...     y_pred = net(item.features)
+
+    The features and label are views of the memory mapped recording when
+    their dtype is the recorded one (copy-on-write).
+    """
+
+    def __init__(
+        self,
+        path: str,
+        dtype: Tuple[torch.dtype, torch.dtype] = (torch.float32, torch.float32),
+        shuffle: bool = False,
+        epochs: int = 1,
+        seed: int = 0,
+        packed_sequence: bool = False,
+    ):
+        """
+        Args:
+            path (str): path of the recording
+            dtype (Tuple(torch.dtype, torch.dtype), optional): the desired data
+                type of the replayed tensors. The first dtype if for the
+                feature, the second if for the label.
+            shuffle (bool): shuffle the forks of each phase
+            epochs (int): number of times the recording is replayed
+            seed (int): seed of the shuffling
+            packed_sequence (bool, optional): see damped.utils.fork_recv
+        """
+        super().__init__()
+        assert epochs > 0, "epochs must be positive"
+        self.path = path
+        self.dtype = dtype
+        self.shuffle = shuffle
+        self.epochs = epochs
+        self.seed = seed
+        self.packed_sequence = packed_sequence
+        with open(path + INDEX_SUFFIX) as f:
+            self.entries: List[Dict] = [json.loads(line) for line in f if line.strip()]
+        self.ranks = sorted({e["rank"] for e in self.entries})
+        self.stats: Dict[int, ProducerStats] = {r: ProducerStats() for r in self.ranks}
+        size = os.path.getsize(path)
+        self._data = torch.empty(0, dtype=torch.uint8)
+        if size > 0:
+            self._data = torch.from_file(path, shared=False, size=size, dtype=torch.uint8)
+        self._start_time = time.time()
+
+    def __iter__(self) -> Iterator[Union[Fork, MetaData]]:
+        # imported here, damped.disturb depends on damped.utils
+        from damped.disturb import const
+
+        rng = random.Random(self.seed)
+        self._start_time = time.time()
+        for _ in range(self.epochs):
+            phase: List[Dict] = []
+            for entry in self.entries:
+                if "meta" not in entry:
+                    phase.append(entry)
+                    continue
+                yield from self._replay(phase, rng)
+                phase = []
+                meta_data = torch.tensor(entry["meta"], dtype=torch.int)
+                if not const.should_stop(meta_data):
+                    yield MetaData(entry["rank"], meta_data)
+            yield from self._replay(phase, rng)
+
+        for rank in self.ranks:
+            self.stats[rank].stopped = True
+            yield MetaData(rank, const.stop_signal())
+
+    def throughput(self) -> Dict[int, Tuple[float, float]]:
+        """Forks per second and MB per second replayed for each rank"""
+        elapsed = max(time.time() - self._start_time, 1e-9)
+        return {
+            rank: (s.forks / elapsed, s.bytes / elapsed / 2 ** 20)
+            for rank, s in self.stats.items()
+        }
+
+    def _replay(self, phase: List[Dict], rng: random.Random) -> Iterator[Fork]:
+        if self.shuffle:
+            phase = list(phase)
+            rng.shuffle(phase)
+        for entry in phase:
+            start_time = time.time()
+            fork = self._load(entry)
+            stats = self.stats[fork.rank]
+            stats.recv_time += time.time() - start_time
+            stats.forks += 1
+            stats.bytes += _nbytes(fork.features) + _nbytes(fork.label)
+            yield fork
+
+    def _load(self, entry: Dict) -> Fork:
+        offset = entry["offset"]
+        parts = unpack_parts(self._data[offset : offset + entry["nbytes"]])
+        label = parts[0].to(self.dtype[1])
+        if "padded_len" not in entry:
+            return Fork(entry["rank"], parts[1].to(self.dtype[0]), label)
+
+        lengths, frames = parts[1], parts[2].to(self.dtype[0])
+        features: Union[torch.Tensor, PackedSequence]
+        if self.packed_sequence:
+            features = pack_sequence(
+                torch.split(frames, lengths.tolist()), enforce_sorted=False
+            )
+        else:
+            shape = [lengths.size(0), entry["padded_len"]] + list(frames.size()[1:])
+            features = restore_padding(
+                frames, lengths, entry["padded_len"], torch.empty(shape, dtype=frames.dtype)
+            )
+        return Fork(entry["rank"], features, label)
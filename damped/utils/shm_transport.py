@@ -0,0 +1,175 @@
+import atexit
+import mmap
+import os
+import socket
+import uuid
+from threading import Lock
+from typing import Optional
+
+import torch
+import torch.distributed as dist
+
+from .transport import Transport, CompletedWork
+
+"""
+Same-host transport: a ring of slots in shared memory (/dev/shm) per
+direction, with two named pipes used as doorbells (counting semaphores):
+ - ".data": one byte per slot filled by the sender
+ - ".space": one byte per slot freed by the receiver
+
+A message larger than a slot is sent over several consecutive slots, the
+receiver knows the size of the message (wire format header).
+"""
+
+SHM_DIR = os.getenv("DAMPED_SHM_DIR", "/dev/shm")
+SHM_SLOTS = int(os.getenv("DAMPED_SHM_SLOTS", 8))
+SHM_SLOT_BYTES = int(os.getenv("DAMPED_SHM_SLOT_BYTES", 4 * 1024 * 1024))
+
+_SHM_RING_KEY = "damped/shm/{}->{}"
+
+
+def host_id() -> str:
+    """Identifier of the machine (peers with the same id can use shm)"""
+    boot_id = ""
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            boot_id = f.read().strip()
+    except OSError:
+        pass
+    return f"{socket.gethostname()}/{boot_id}"
+
+
+def as_bytes(tensor: torch.Tensor) -> torch.Tensor:
+    """uint8 view of the memory of a contiguous tensor"""
+    return tensor.reshape(-1).view(torch.uint8)
+
+
+class ShmRing(object):
+    """
+    Single producer / single consumer ring buffer of slots in shared memory.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        writer: bool,
+        create: bool = False,
+        n_slots: int = SHM_SLOTS,
+        slot_bytes: int = SHM_SLOT_BYTES,
+    ):
+        """
+        Args:
+            path (str): path of the ring in the shared memory file system
+            writer (bool): True for the sender side of the ring
+            create (bool): create the ring (and its doorbells)
+            n_slots (int): number of slots in the ring
+            slot_bytes (int): size of a slot
+        """
+        self.path = path
+        self.n_slots = n_slots
+        self.slot_bytes = slot_bytes
+
+        if create:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_RDWR, 0o600)
+            os.ftruncate(fd, n_slots * slot_bytes)
+            os.mkfifo(path + ".data", 0o600)
+            os.mkfifo(path + ".space", 0o600)
+            atexit.register(self.unlink)
+        else:
+            fd = os.open(path, os.O_RDWR)
+        self._mm = mmap.mmap(fd, n_slots * slot_bytes)
+        os.close(fd)
+        self._ring = torch.frombuffer(self._mm, dtype=torch.uint8)
+
+        # O_RDWR: opening a fifo does not wait for the other side
+        self._data_fd = os.open(path + ".data", os.O_RDWR)
+        self._space_fd = os.open(path + ".space", os.O_RDWR)
+
+        self._slot = 0  # next slot to fill / to consume
+        # number of slots the writer can fill / the reader can consume
+        self._credits = n_slots if writer else 0
+
+    def write(self, data: torch.Tensor) -> None:
+        """Copy a uint8 tensor into the ring (blocks if the ring is full)"""
+        for start in range(0, data.numel(), self.slot_bytes):
+            if self._credits == 0:
+                self._credits += len(os.read(self._space_fd, self.n_slots))
+            self._credits -= 1
+            chunk = data[start : start + self.slot_bytes]
+            offset = self._slot * self.slot_bytes
+            self._ring[offset : offset + chunk.numel()].copy_(chunk)
+            self._slot = (self._slot + 1) % self.n_slots
+            os.write(self._data_fd, b"\x01")
+
+    def read_into(self, out: torch.Tensor) -> None:
+        """Fill a uint8 tensor from the ring (blocks until the data is there)"""
+        for start in range(0, out.numel(), self.slot_bytes):
+            if self._credits == 0:
+                self._credits += len(os.read(self._data_fd, self.n_slots))
+            self._credits -= 1
+            chunk = out[start : start + self.slot_bytes]
+            offset = self._slot * self.slot_bytes
+            chunk.copy_(self._ring[offset : offset + chunk.numel()])
+            self._slot = (self._slot + 1) % self.n_slots
+            os.write(self._space_fd, b"\x01")
+
+    def unlink(self) -> None:
+        """Remove the ring from the file system (it stays mapped)"""
+        for path in [self.path, self.path + ".data", self.path + ".space"]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+class ShmTransport(Transport):
+    """
+    Shared memory transport in between two peers of the same host.
+
+    Each side creates its inbound ring when the transport is created, and
+    opens its outbound ring (created by the peer) with ``connect()``. Once
+    opened, the rings are unlinked so that nothing is left in /dev/shm.
+    """
+
+    name = "shm"
+
+    def __init__(self, rank: int, peer: int, store: dist.Store, tag: str = ""):
+        """
+        Args:
+            rank (int): rank of this node
+            peer (int): rank of the peer
+            store (dist.Store): store shared with the peer (rings handshake)
+            tag (str): tag added to the name of the rings
+        """
+        self.rank = rank
+        self.peer = peer
+        self._store = store
+        self._send_mutex = Lock()
+        self._recv_mutex = Lock()
+        self._outbound: Optional[ShmRing] = None
+
+        path = os.path.join(
+            SHM_DIR, f"damped-{tag}-{peer}-{rank}-{uuid.uuid4().hex[:8]}"
+        )
+        self._inbound = ShmRing(path, writer=False, create=True)
+        store.set(_SHM_RING_KEY.format(peer, rank), path)
+
+    def connect(self) -> None:
+        """Open the outbound ring (waits until the peer has created it)"""
+        key = _SHM_RING_KEY.format(self.rank, self.peer)
+        self._store.wait([key])
+        self._outbound = ShmRing(self._store.get(key).decode(), writer=True)
+        self._outbound.unlink()
+
+    def send(self, tensor, dst):
+        with self._send_mutex:
+            self._outbound.write(as_bytes(tensor.contiguous()))
+
+    def isend(self, tensor, dst):
+        self.send(tensor, dst)
+        return CompletedWork()
+
+    def recv(self, tensor, src):
+        assert tensor.is_contiguous(), "shm can only receive into contiguous tensors"
+        with self._recv_mutex:
+            self._inbound.read_into(as_bytes(tensor))
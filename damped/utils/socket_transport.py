@@ -0,0 +1,247 @@
+import logging
+import os
+import socket
+import struct
+import time
+import uuid
+from contextlib import contextmanager
+from threading import Condition, Lock, RLock, Thread
+from typing import Optional
+
+import torch.distributed as dist
+
+from .context import DistContext, set_context
+from .control import reset_control
+from .log import log_handler
+from .shm_transport import as_bytes
+from .transport import Transport, CompletedWork
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.addHandler(log_handler)
+
+"""
+Elastic transport: one TCP connection per peer, established through the
+rendezvous store, that can drop and be re-established while the other nodes
+keep running (no process group is involved).
+
+Each node listens on a socket and publishes its address:
+  "damped/socket/{rank}" = "host:port:incarnation"
+The node with the higher rank of a pair connects to the other one (and
+reconnects when the connection drops, eg: to the restarted incarnation of
+its peer), the node with the lower rank accepts the connections.
+
+While a peer is absent, the messages sent to it are dropped (see
+SocketTransport.available). The rendezvous store is hosted by the node of
+rank 0, which must stay up.
+"""
+
+_SOCKET_KEY = "damped/socket/{}"
+_HELLO = struct.Struct("!i")  # rank of the connecting node
+
+# address the other nodes connect to (default: address of the interface
+# routing to the rendezvous store)
+SOCKET_HOST = os.getenv("DAMPED_SOCKET_HOST", "")
+RECONNECT_INTERVAL = 0.5  # seconds
+
+
+def local_address(ip: str) -> str:
+    """Address of the interface used to reach ``ip``"""
+    if SOCKET_HOST:
+        return SOCKET_HOST
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        probe.connect((ip, 9))  # no packet is sent (UDP)
+        return probe.getsockname()[0]
+    except OSError:
+        return socket.gethostbyname(socket.gethostname())
+    finally:
+        probe.close()
+
+
+class SocketTransport(Transport):
+    """
+    Elastic TCP connection with a peer.
+
+    ``available`` is False while the peer is absent, ``generation`` is
+    incremented each time the connection is (re-)established.
+    """
+
+    name = "socket"
+
+    def __init__(self, rank: int, peer: int):
+        """
+        Args:
+            rank (int): rank of this node
+            peer (int): rank of the peer
+        """
+        self.rank = rank
+        self.peer = peer
+        self.generation = 0
+        self._sock: Optional[socket.socket] = None
+        self._connected = Condition()
+        self._send_mutex = RLock()
+        self._recv_mutex = Lock()
+        # connection the messages of the current frame are sent on
+        self._in_frame = False
+        self._frame_sock: Optional[socket.socket] = None
+
+    @property
+    def available(self) -> bool:
+        return self._sock is not None
+
+    def attach(self, sock: socket.socket) -> None:
+        """Use a new connection with the peer (the previous one is closed)"""
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._connected:
+            if self._sock is not None:
+                self._sock.close()
+            # state of the exchanges with the previous incarnation of the peer
+            reset_control(self.peer)
+            self._sock = sock
+            self.generation += 1
+            self._connected.notify_all()
+        logger.info(f"Connected with rank {self.peer} (generation {self.generation})")
+
+    def _drop(self, sock: socket.socket) -> None:
+        with self._connected:
+            if self._sock is not sock:
+                return  # already replaced
+            self._sock = None
+            sock.close()
+            self._connected.notify_all()
+        logger.warning(f"Connection with rank {self.peer} lost")
+
+    def wait_disconnected(self) -> None:
+        with self._connected:
+            while self._sock is not None:
+                self._connected.wait()
+
+    @contextmanager
+    def frame(self):
+        # a frame is sent on a single connection: once it dropped (or was
+        # replaced by a new one), the rest of the frame is dropped as well
+        with self._send_mutex:
+            self._in_frame = True
+            self._frame_sock = self._sock
+            try:
+                yield
+            finally:
+                self._in_frame = False
+                self._frame_sock = None
+
+    def send(self, tensor, dst):
+        with self._send_mutex:
+            sock = self._frame_sock if self._in_frame else self._sock
+            if sock is None:
+                return  # the peer is absent, the message is dropped
+            try:
+                sock.sendall(as_bytes(tensor.contiguous()).numpy())
+            except OSError:
+                self._frame_sock = None
+                self._drop(sock)
+
+    def isend(self, tensor, dst):
+        self.send(tensor, dst)
+        return CompletedWork()
+
+    def recv(self, tensor, src):
+        """Receive a tensor, waits for the peer if it is absent
+
+        Raises:
+            ConnectionError: the connection dropped while receiving
+        """
+        assert tensor.is_contiguous(), "socket can only receive into contiguous tensors"
+        with self._recv_mutex:
+            with self._connected:
+                while self._sock is None:
+                    self._connected.wait()
+                sock = self._sock
+            buff = memoryview(as_bytes(tensor).numpy())
+            received = 0
+            try:
+                while received < len(buff):
+                    n = sock.recv_into(buff[received:], len(buff) - received)
+                    if n == 0:
+                        raise ConnectionError(f"rank {self.peer} closed the connection")
+                    received += n
+            except OSError as e:
+                self._drop(sock)
+                raise ConnectionError(f"Connection with rank {self.peer} lost") from e
+
+
+class SocketListener(object):
+    """
+    Accepts the connections of the peers with a higher rank, and connects to
+    the peers with a lower rank (background threads).
+    """
+
+    def __init__(self, context: DistContext, ip: str):
+        """
+        Args:
+            context (DistContext): distributed env state of this node
+            ip (str): address of the rendezvous store
+        """
+        self._context = context
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(("", 0))
+        self._server.listen()
+        address = f"{local_address(ip)}:{self._server.getsockname()[1]}"
+        context.store.set(
+            _SOCKET_KEY.format(context.rank), f"{address}:{uuid.uuid4().hex[:8]}"
+        )
+        Thread(target=self._accept_loop, name="damped-socket-accept", daemon=True).start()
+
+    def dial(self, transport: SocketTransport) -> None:
+        """Keep a connection with a peer of lower rank"""
+        Thread(
+            target=self._dial_loop,
+            args=(transport,),
+            name=f"damped-socket-dial-{transport.peer}",
+            daemon=True,
+        ).start()
+
+    def _accept_loop(self) -> None:
+        set_context(self._context, thread=True)
+        while True:
+            sock, _ = self._server.accept()
+            try:
+                (rank,) = _HELLO.unpack(_recv_exactly(sock, _HELLO.size))
+                transport = self._context.transports.get(rank)
+                # wrapped by a simulated link (see init_distributedenv throttle)
+                transport = getattr(transport, "transport", transport)
+                if not isinstance(transport, SocketTransport):
+                    raise ConnectionError(f"unexpected connection from rank {rank}")
+                transport.attach(sock)
+            except OSError as e:
+                logger.warning(f"Rejected a connection: {e}")
+                sock.close()
+
+    def _dial_loop(self, transport: SocketTransport) -> None:
+        set_context(self._context, thread=True)
+        store: dist.Store = self._context.store
+        key = _SOCKET_KEY.format(transport.peer)
+        while True:
+            transport.wait_disconnected()
+            try:
+                if store.check([key]):
+                    host, port, _ = store.get(key).decode().split(":")
+                    sock = socket.create_connection((host, int(port)), timeout=10)
+                    sock.settimeout(None)
+                    sock.sendall(_HELLO.pack(self._context.rank))
+                    transport.attach(sock)
+                    continue
+            except OSError:
+                pass  # the peer is absent (or restarting)
+            time.sleep(RECONNECT_INTERVAL)
+
+
+def _recv_exactly(sock: socket.socket, n: int) -> bytes:
+    data = b""
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return data
@@ -0,0 +1,209 @@
+import queue
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from threading import Lock, RLock, Thread
+from typing import Optional
+
+from .transport import LoopbackWork, Transport
+
+"""
+Simulated network link: wraps the transport used with a peer to give the
+messages sent to it the bandwidth, latency and jitter of a slower link
+(capacity planning on a single machine, see bench_transport.py --links).
+
+Named "<bandwidth Mbit/s>:<latency ms>[:<jitter ms>]" (bandwidth 0:
+unlimited), eg: "1000:0.2" or "100:5:1".
+
+Each message occupies the link for nbytes / bandwidth seconds (the
+messages sent back to back queue behind each other), then reaches the peer
+after latency + uniform(0, jitter) seconds. The messages are delivered in
+order. Only the sending side is throttled, each node throttles the messages
+it sends.
+"""
+
+# marks of the messages of a frame in the queue of the sender thread
+_FRAME_BEGIN = "frame-begin"
+_FRAME_END = "frame-end"
+
+
+class LinkSpec(object):
+    """Parameters of a simulated link"""
+
+    def __init__(
+        self, bandwidth: float = 0.0, latency: float = 0.0, jitter: float = 0.0
+    ):
+        """
+        Args:
+            bandwidth (float): Mbit/s (0: unlimited)
+            latency (float): one way latency in ms
+            jitter (float): max extra latency in ms
+        """
+        assert bandwidth >= 0 and latency >= 0 and jitter >= 0, (
+            "the link parameters must be positive"
+        )
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.jitter = jitter
+
+    def transmission_time(self, nbytes: int) -> float:
+        """Seconds the link is busy sending nbytes"""
+        if self.bandwidth == 0:
+            return 0.0
+        return nbytes * 8 / (self.bandwidth * 1e6)
+
+    def __str__(self) -> str:
+        return f"{self.bandwidth:g}:{self.latency:g}:{self.jitter:g}"
+
+
+def get_link_spec(link: str) -> LinkSpec:
+    """Get the parameters of a link from its name
+    ("<bandwidth Mbit/s>:<latency ms>[:<jitter ms>]")"""
+    params = link.split(":")
+    try:
+        if len(params) in (2, 3):
+            return LinkSpec(*[float(p) for p in params])
+    except ValueError:
+        pass
+    raise ValueError(
+        f"Unknown link '{link}' (expected: <bandwidth Mbit/s>:<latency ms>[:<jitter ms>])"
+    )
+
+
+class ThrottledWork(LoopbackWork):
+    """
+    Request of a throttled send, completed once the message is handed to the
+    wrapped transport. ``wait()`` raises the error of the wrapped transport.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.error: Optional[BaseException] = None
+
+    def wait(self):
+        super().wait()
+        if self.error is not None:
+            raise self.error
+        return True
+
+
+class ThrottledTransport(Transport):
+    """
+    Transport delaying the messages sent through another transport (see
+    damped.utils.init_distributedenv ``throttle``).
+
+    A sender thread per peer holds each message until the simulated link
+    delivered it, the request of a send is completed once the message is
+    handed to the wrapped transport. Receiving is not delayed.
+
+    The messages of a frame (see Transport.frame) are handed to the wrapped
+    transport within one of its frames.
+
+    Once the wrapped transport failed to send a message, the link is broken:
+    the requests of the queued messages and the next sends raise its error
+    (the peer would receive a partial stream).
+    """
+
+    name = "throttled"
+
+    def __init__(self, transport: Transport, link: LinkSpec, seed: int = 0):
+        """
+        Args:
+            transport (Transport): the transport the messages go through
+            link (LinkSpec): the simulated link
+            seed (int): seed of the jitter
+        """
+        self.transport = transport
+        self.link = link
+        self._rng = random.Random(seed)
+        self._queue: queue.Queue = queue.Queue()
+        self._mutex = Lock()
+        # the messages of a frame are queued in a row
+        self._frame_mutex = RLock()
+        self._frame_depth = 0
+        self._busy_until = 0.0  # the link is sending the previous messages
+        self._last_delivery = 0.0
+        # bytes sent and seconds spent queued behind the previous messages
+        self.bytes_sent = 0
+        self.queued_time = 0.0
+        self._sender: Optional[Thread] = None
+        self._error: Optional[BaseException] = None
+
+    @property
+    def available(self):
+        return self.transport.available
+
+    @property
+    def generation(self):
+        return self.transport.generation
+
+    @contextmanager
+    def frame(self):
+        with self._frame_mutex:
+            self._frame_depth += 1
+            if self._frame_depth == 1:
+                self._queue.put(_FRAME_BEGIN)
+            try:
+                yield
+            finally:
+                self._frame_depth -= 1
+                if self._frame_depth == 0:
+                    self._queue.put(_FRAME_END)
+
+    def isend(self, tensor, dst):
+        # like gloo, the tensor must not be modified until wait() returns
+        if self._error is not None:
+            raise ConnectionError(
+                f"the link is broken by a previous send: {self._error}"
+            ) from self._error
+        req = ThrottledWork()
+        nbytes = tensor.numel() * tensor.element_size()
+        with self._frame_mutex, self._mutex:
+            now = time.perf_counter()
+            start = max(now, self._busy_until)
+            self.queued_time += start - now
+            self.bytes_sent += nbytes
+            self._busy_until = start + self.link.transmission_time(nbytes)
+            extra = self._rng.uniform(0, self.link.jitter) if self.link.jitter else 0
+            delivery = self._busy_until + (self.link.latency + extra) / 1000
+            # no overtaking: a message is delivered after the previous ones
+            self._last_delivery = max(delivery, self._last_delivery)
+            if self._sender is None:
+                self._sender = Thread(
+                    target=self._send_loop, name="damped-throttled-sender", daemon=True
+                )
+                self._sender.start()
+            self._queue.put((tensor, dst, self._last_delivery, req))
+        return req
+
+    def recv(self, tensor, src):
+        self.transport.recv(tensor, src)
+
+    def _send_loop(self):
+        frame = ExitStack()
+        while True:
+            item = self._queue.get()
+            if item is _FRAME_BEGIN:
+                frame.enter_context(self.transport.frame())
+                continue
+            if item is _FRAME_END:
+                frame.close()
+                continue
+            tensor, dst, delivery, req = item
+            delay = delivery - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if self._error is None:
+                try:
+                    self.transport.send(tensor, dst)
+                except BaseException as e:
+                    self._error = e
+            req.error = self._error
+            req._done.set()
+
+
+def throttle_transport(transport: Transport, link: str, seed: int = 0) -> Transport:
+    """Wraps a transport into a ThrottledTransport (no-op without link)"""
+    if not link:
+        return transport
+    return ThrottledTransport(transport, get_link_spec(link), seed)
@@ -0,0 +1,186 @@
+import contextlib
+import queue
+from threading import Event, Lock
+from typing import Dict, List, Tuple
+
+import torch
+import torch.distributed as dist
+
+from .context import get_context
+
+"""
+Transports move the messages (tensors) of the wire format in between two
+peers. The default transport is the gloo process group (torch.distributed),
+the transport used to exchange with a peer is selected by
+damped.utils.init_distributedenv.
+"""
+
+
+class CompletedWork(object):
+    """
+    Request of a transport operation that completed synchronously.
+    Exposes the same interface as torch.distributed.Work.
+    """
+
+    def wait(self):
+        return True
+
+    def is_completed(self):
+        return True
+
+
+class GroupWork(object):
+    """
+    Requests of several transport operations (eg: a broadcast).
+    Exposes the same interface as torch.distributed.Work.
+    """
+
+    def __init__(self, works: List):
+        self.works = works
+
+    def wait(self):
+        for w in self.works:
+            w.wait()
+        return True
+
+    def is_completed(self):
+        return all(w.is_completed() for w in self.works)
+
+
+class Transport(object):
+    """
+    Interface of a transport.
+    """
+
+    name = "transport"
+    # False while the peer is absent (elastic transports)
+    available = True
+    # incremented each time the connection with the peer is re-established
+    generation = 0
+
+    def send(self, tensor: torch.Tensor, dst: int) -> None:
+        """Sends a tensor, blocking operation"""
+        self.isend(tensor, dst).wait()
+
+    def isend(self, tensor: torch.Tensor, dst: int):
+        """Sends a tensor asynchronously
+
+        Returns:
+            A request object. (call ``wait()`` to block the process
+            until the operation is finished)
+        """
+        raise NotImplementedError
+
+    def recv(self, tensor: torch.Tensor, src: int) -> None:
+        """Receive a tensor into a (contiguous) pre-allocated tensor"""
+        raise NotImplementedError
+
+    def frame(self):
+        """Context of the messages of a frame (eg: a header and its payload),
+        the peer receives all of them or none"""
+        return contextlib.nullcontext()
+
+
+class GlooTransport(Transport):
+    """
+    torch.distributed point to point communication.
+    """
+
+    name = "gloo"
+
+    def send(self, tensor, dst):
+        dist.send(tensor, dst=dst)
+
+    def isend(self, tensor, dst):
+        return dist.isend(tensor, dst=dst)
+
+    def recv(self, tensor, src):
+        dist.recv(tensor, src=src)
+
+
+class LoopbackWork(object):
+    """
+    Request of a loopback send, completed once the receiver copied the tensor.
+    """
+
+    def __init__(self):
+        self._done = Event()
+
+    def wait(self):
+        self._done.wait()
+        return True
+
+    def is_completed(self):
+        return self._done.is_set()
+
+
+class LoopbackHub(object):
+    """
+    Queues in between the nodes of a same interpreter (one per direction).
+    """
+
+    def __init__(self):
+        self.store = dist.HashStore()
+        self._queues: Dict[Tuple[int, int], queue.Queue] = {}
+        self._mutex = Lock()
+
+    def queue(self, src: int, dst: int) -> queue.Queue:
+        with self._mutex:
+            if (src, dst) not in self._queues:
+                self._queues[(src, dst)] = queue.Queue()
+            return self._queues[(src, dst)]
+
+
+class LoopbackTransport(Transport):
+    """
+    In-process transport in between two nodes running on threads of the same
+    interpreter. Tensors are not serialized, the receiver copies the sent
+    tensor into its buffer (a single copy).
+    """
+
+    name = "loopback"
+
+    def __init__(self, rank: int, peer: int, hub: LoopbackHub):
+        """
+        Args:
+            rank (int): rank of this node
+            peer (int): rank of the peer
+            hub (LoopbackHub): queues shared with the peer
+        """
+        self.rank = rank
+        self.peer = peer
+        self._outbound = hub.queue(rank, peer)
+        self._inbound = hub.queue(peer, rank)
+
+    def isend(self, tensor, dst):
+        # like gloo, the tensor must not be modified until wait() returns
+        req = LoopbackWork()
+        self._outbound.put((tensor, req))
+        return req
+
+    def recv(self, tensor, src):
+        sent, req = self._inbound.get()
+        tensor.copy_(sent.reshape(tensor.shape))
+        req._done.set()
+
+
+_default_transport: Transport = GlooTransport()
+
+
+def get_transport(rank: int) -> Transport:
+    """Get the transport used to exchange with a peer
+
+    Args:
+        rank (int): rank of the peer in the distributed env
+    """
+    return get_context().transports.get(rank, _default_transport)
+
+
+def set_transport(rank: int, transport: Transport) -> None:
+    """Select the transport used to exchange with a peer
+
+    Args:
+        rank (int): rank of the peer in the distributed env
+        transport (Transport): the transport to use
+    """
+    get_context().transports[rank] = transport
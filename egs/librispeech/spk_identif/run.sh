@@ -122,3 +122,17 @@ if [ ${stage} -le 3 ] && [ ${stop_stage} -ge 3 ]; then
     $other \
     | tee -a $log_path/eval.log
 fi
+
+if [ ${stage} -le 4 ] && [ ${stop_stage} -ge 4 ]; then
+  echo "stage 4: Accuracy vs bytes of the wire codecs on the '$(basename `pwd`)' branch"
+
+  echo -e "-------\nNew run: $_date\n" >> $log_path/codec_report.log
+
+  codec_report.py \
+    --config $(pwd)/conf/$conf \
+    --snapshot "$log_path/$snapshot" \
+    --store $log_path/eval_store.scp \
+    --gpu-device $gpu_device \
+    $other \
+    | tee -a $log_path/codec_report.log
+fi
@@ -24,9 +24,9 @@ setup(
     url="https://github.com/deep-privacy/damped",
     license="TODO",
     packages=setuptools.find_packages(),
-    python_requires=">=3.6",
+    python_requires=">=3.7",
     install_requires=[
-        "torch>=1.0.1",
+        "torch>=1.10",
         "scikit-learn>=0.20.1",
         "pandas>=0.23.4",
         "tensorboardX>=1.9",
@@ -38,6 +38,6 @@ setup(
         "Operating System :: Linux",
         "Intended Audience :: Audio Science/Research",
         "Topic :: Scientific/Engineering :: Artificial Intelligence",
-        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.7",
     ],
 )
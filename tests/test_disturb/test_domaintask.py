@@ -1,8 +1,21 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+
+import pytest
 import torch
-from torch.multiprocessing import Process
+from torch.multiprocessing import Event, Process
 
 from damped import utils
 from damped import disturb
+from damped import nets
+from damped.utils.context import get_context
+
+# the co-located processes would use shm with the "auto" transport
+TRANSPORTS = ["gloo", "shm"]
+PORT_OFFSET = {"gloo": 0, "shm": 60}
 
 
 def test_domaintask_creation():
@@ -10,18 +23,20 @@ def test_domaintask_creation():
     assert task.to_rank == 1
 
 
-def test_domaintask_sharetensor():
+@pytest.mark.parametrize("transport", TRANSPORTS)
+def test_domaintask_sharetensor(transport):
     task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+    port = 12121 + PORT_OFFSET[transport]
 
     def run(rank, size):
         if rank == task.to_rank:  # process disturb-ed
-            disturb.init(port=12121)
+            disturb.init(port=port, transport=transport)
             for _ in range(10):
                 req = task.isend(torch.zeros(size))
                 req.wait()
 
         else:  # Some server task running on another node
-            utils.init_distributedenv(1, port=12121)
+            utils.init_distributedenv(1, port=port, transport=transport)
 
             for _ in range(10):
                 recv_buff, _ = utils.recv(rank=0)
@@ -38,18 +53,20 @@ def test_domaintask_sharetensor():
         assert p.exitcode == 0  # something went wrong!
 
 
-def test_domaintask_fork_detach():
+@pytest.mark.parametrize("transport", TRANSPORTS)
+def test_domaintask_fork_detach(transport):
     task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+    port = 12123 + PORT_OFFSET[transport]
 
     def run(rank, size):
         if rank == task.to_rank:  # process disturb-ed
-            disturb.init(port=12123)
+            disturb.init(port=port, transport=transport)
             for _ in range(10):
                 req = task.fork_detach(torch.zeros(size), torch.zeros(size) + 1)
                 req.wait()
 
         else:  # Some server task running on another node
-            utils.init_distributedenv(1, port=12123)
+            utils.init_distributedenv(1, port=port, transport=transport)
 
             for _ in range(10):
                 recv_buff_feat, recv_buff_label, _ = utils.fork_recv(rank=0)
@@ -67,12 +84,14 @@ def test_domaintask_fork_detach():
         assert p.exitcode == 0  # something went wrong!
 
 
-def test_domaintask_fork_detach_type():
+@pytest.mark.parametrize("transport", TRANSPORTS)
+def test_domaintask_fork_detach_type(transport):
     task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+    port = 12123 + PORT_OFFSET[transport]
 
     def run(rank, size):
         if rank == task.to_rank:  # process disturb-ed
-            disturb.init(port=12123)
+            disturb.init(port=port, transport=transport)
             for _ in range(10):
                 req = task.fork_detach(
                     torch.zeros(size),
@@ -82,7 +101,7 @@ def test_domaintask_fork_detach_type():
                 req.wait()
 
         else:  # Some server task running on another node
-            utils.init_distributedenv(1, port=12123)
+            utils.init_distributedenv(1, port=port, transport=transport)
 
             for _ in range(10):
                 recv_buff_feat, recv_buff_label, _ = utils.fork_recv(
@@ -106,3 +125,748 @@ def test_domaintask_fork_detach_type():
     for p in processes:
         p.join()
         assert p.exitcode == 0  # something went wrong!
+
+
+def test_domaintask_legacy_peer():
+    task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+
+    def run(rank, size):
+        if rank == task.to_rank:  # process disturb-ed
+            disturb.init(port=12125)
+            assert utils.peer_wire_version(1) == 1
+            for _ in range(10):
+                req = task.fork_detach(torch.zeros(size), torch.zeros(size) + 1)
+                req.wait()
+            disturb.eval()
+
+        else:  # a domain task running an older wire format
+            utils.init_distributedenv(1, port=12125, wire_version=1)
+
+            for _ in range(10):
+                recv_buff_feat, recv_buff_label, _ = utils.fork_recv(rank=0)
+                assert torch.all(torch.eq(recv_buff_feat, torch.zeros(size)))
+                assert torch.all(torch.eq(recv_buff_label, torch.zeros(size) + 1))
+            _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            assert is_meta_data
+            assert disturb.const.is_eval(meta_data)
+
+    processes = []
+    for rank in range(2):  # fork multiple processes for testing (single machine)
+        p = Process(target=run, args=(rank, (3, 30, 8)))
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0  # something went wrong!
+
+
+@pytest.mark.parametrize("transport", TRANSPORTS)
+def test_domaintask_meta_data(transport):
+    task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+    port = 12127 + PORT_OFFSET[transport]
+
+    def run(rank, size):
+        if rank == task.to_rank:  # process disturb-ed
+            disturb.init(port=port, transport=transport)
+            assert utils.peer_wire_version(1) == 4
+            disturb.eval()
+            task.fork_detach(torch.zeros(size), torch.zeros(size) + 1).wait()
+            disturb.stop()
+
+        else:  # Some server task running on another node
+            utils.init_distributedenv(1, port=port, transport=transport)
+
+            _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            assert is_meta_data and disturb.const.is_eval(meta_data)
+            recv_buff_feat, _, is_meta_data = utils.fork_recv(rank=0)
+            assert not is_meta_data
+            assert torch.all(torch.eq(recv_buff_feat, torch.zeros(size)))
+            _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            assert is_meta_data and disturb.const.should_stop(meta_data)
+
+    processes = []
+    for rank in range(2):  # fork multiple processes for testing (single machine)
+        p = Process(target=run, args=(rank, (3, 30, 8)))
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0  # something went wrong!
+
+
+@pytest.mark.parametrize("transport", TRANSPORTS)
+def test_domaintask_fork_detach_fused(transport):
+    task = disturb.DomainTask(name="speaker_identificaion", to_rank=1, fused=True)
+    port = 12129 + PORT_OFFSET[transport]
+
+    def run(rank, size):
+        if rank == task.to_rank:  # process disturb-ed
+            disturb.init(port=port, transport=transport)
+            for _ in range(10):
+                req = task.fork_detach(
+                    torch.zeros(size),
+                    torch.zeros(size[0], dtype=torch.long) + 1,
+                    dtype=(torch.float32, torch.long),
+                )
+                req.wait()
+
+        else:  # Some server task running on another node
+            utils.init_distributedenv(1, port=port, transport=transport)
+            pool = utils.BufferPool()
+
+            for _ in range(10):
+                recv_buff_feat, recv_buff_label, _ = utils.fork_recv(
+                    rank=0, dtype=(torch.float32, torch.long), pool=pool
+                )
+                assert torch.all(torch.eq(recv_buff_feat, torch.zeros(size)))
+                assert torch.all(torch.eq(recv_buff_label, torch.ones(size[0])))
+                assert recv_buff_label.dtype == torch.long
+                assert recv_buff_feat.dtype == torch.float32
+            assert pool.hits == 9
+
+    processes = []
+    for rank in range(2):  # fork multiple processes for testing (single machine)
+        p = Process(target=run, args=(rank, (30, 300, 80)))
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0  # something went wrong!
+
+
+def test_domaintask_fork_detach_queue():
+    task = disturb.DomainTask(name="speaker_identificaion", to_rank=1, queue_depth=4)
+
+    def run(rank, size):
+        if rank == task.to_rank:  # process disturb-ed
+            disturb.init(port=12131)
+            reqs = []
+            for i in range(10):
+                reqs.append(task.fork_detach(torch.zeros(size) + i, torch.zeros(size) + 1))
+                assert task.queue_size <= 4
+            disturb.eval()  # sent after the queued forks
+            for req in reqs:
+                req.wait()
+            assert task.dropped_forks == 0
+            disturb.stop()  # carries the eval mode (no fork follows it)
+
+        else:  # Some server task running on another node
+            utils.init_distributedenv(1, port=12131)
+
+            for i in range(10):
+                recv_buff_feat, recv_buff_label, _ = utils.fork_recv(rank=0)
+                assert torch.all(torch.eq(recv_buff_feat, torch.zeros(size) + i))
+            _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            assert is_meta_data and disturb.const.is_eval(meta_data)
+            _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            assert is_meta_data and disturb.const.should_stop(meta_data)
+
+    processes = []
+    for rank in range(2):  # fork multiple processes for testing (single machine)
+        p = Process(target=run, args=(rank, (3, 30, 8)))
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0  # something went wrong!
+
+
+def test_domaintask_fork_detach_codec():
+    task_fp16 = disturb.DomainTask(name="speaker_identificaion", to_rank=1, codec="fp16")
+    task_int8 = disturb.DomainTask(
+        name="speaker_identificaion", to_rank=1, codec="int8", fused=True
+    )
+
+    def run(rank, size):
+        features = torch.linspace(-1, 1, steps=size[0] * size[1] * size[2]).view(size)
+        if rank == task_fp16.to_rank:  # process disturb-ed
+            disturb.init(port=12133)
+            for _ in range(5):
+                task_fp16.fork_detach(features, torch.zeros(size[0]) + 1).wait()
+                task_int8.fork_detach(features, torch.zeros(size[0]) + 1).wait()
+
+        else:  # Some server task running on another node
+            utils.init_distributedenv(1, port=12133)
+
+            for _ in range(10):
+                recv_buff_feat, recv_buff_label, _ = utils.fork_recv(rank=0)
+                assert recv_buff_feat.dtype == torch.float32
+                assert torch.allclose(recv_buff_feat, features, atol=1e-2)
+                assert torch.all(torch.eq(recv_buff_label, torch.ones(size[0])))
+
+    processes = []
+    for rank in range(2):  # fork multiple processes for testing (single machine)
+        p = Process(target=run, args=(rank, (3, 30, 8)))
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0  # something went wrong!
+
+
+def test_domaintask_fork_detach_lengths():
+    task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+    task_fused = disturb.DomainTask(name="speaker_identificaion", to_rank=1, fused=True)
+
+    def run(rank, size):
+        lengths = torch.tensor([30, 12, 1])
+        torch.manual_seed(0)
+        features = torch.rand(size)
+        mask = torch.arange(size[1]).unsqueeze(0) < lengths.unsqueeze(1)
+        features[~mask] = 0
+        if rank == task.to_rank:  # process disturb-ed
+            disturb.init(port=12135)
+            task.fork_detach(features, torch.zeros(size[0]), lengths=lengths).wait()
+            task_fused.fork_detach(features, torch.zeros(size[0]), lengths=lengths).wait()
+            task.fork_detach(features, torch.zeros(size[0]), lengths=lengths).wait()
+            assert task.padding_bytes_saved == 2 * (3 * 30 - 43) * 8 * 4
+
+        else:  # Some server task running on another node
+            utils.init_distributedenv(1, port=12135)
+
+            for _ in range(2):
+                recv_buff_feat, _, _ = utils.fork_recv(rank=0)
+                assert torch.equal(recv_buff_feat, features)
+            recv_buff_feat, _, _ = utils.fork_recv(rank=0, packed_sequence=True)
+            padded, recv_lengths = torch.nn.utils.rnn.pad_packed_sequence(
+                recv_buff_feat, batch_first=True, total_length=size[1]
+            )
+            assert torch.equal(padded, features)
+            assert torch.equal(recv_lengths, lengths)
+
+    processes = []
+    for rank in range(2):  # fork multiple processes for testing (single machine)
+        p = Process(target=run, args=(rank, (3, 30, 8)))
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0  # something went wrong!
+
+
+def test_domaintask_shm_transport():
+    task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+
+    def run(rank, size):
+        if rank == task.to_rank:  # process disturb-ed
+            disturb.init(port=12137)
+            assert utils.get_transport(1).name == "shm"
+            for i in range(3):
+                grad = task.fork_recv_grad(torch.zeros(size) + i, torch.ones(size[0]))
+                assert torch.all(torch.eq(grad, torch.zeros(size) - i))
+
+        else:  # Some server task running on the same node
+            utils.init_distributedenv(1, port=12137)
+            assert utils.get_transport(0).name == "shm"
+            _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            assert is_meta_data and disturb.const.is_wait_backward(meta_data)
+            for i in range(3):
+                features, label, _ = utils.fork_recv(rank=0)
+                assert torch.all(torch.eq(features, torch.zeros(size) + i))
+                assert torch.all(torch.eq(label, torch.ones(size[0])))
+                utils.isend(0, -features).wait()
+
+    processes = []
+    for rank in range(2):  # fork multiple processes for testing (single machine)
+        # larger than the ring (8 slots of 4MB), the message wraps around it
+        p = Process(target=run, args=(rank, (32, 250, 1024 * 5)))
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0  # something went wrong!
+
+
+def test_domaintask_loopback_transport():
+    task = disturb.DomainTask(name="speaker_identificaion", to_rank=1, queue_depth=2)
+    size = (3, 30, 8)
+
+    def run_branch():  # domain task trainer running on a thread
+        utils.init_distributedenv(1, port=12139, transport="loopback")
+        assert utils.get_transport(0).name == "loopback"
+        for i in range(3):
+            features, label, _ = utils.fork_recv(rank=0)
+            assert torch.all(torch.eq(features, torch.zeros(size) + i))
+            assert torch.all(torch.eq(label, torch.ones(size[0])))
+        _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+        assert is_meta_data and disturb.const.is_wait_backward(meta_data)
+        features, _, _ = utils.fork_recv(rank=0)
+        utils.isend(0, -features).wait()
+
+    def run():  # disturb-ed process running on another thread
+        utils.init_distributedenv(0, port=12139, transport="loopback")
+        for i in range(3):
+            task.fork_detach(torch.zeros(size) + i, torch.ones(size[0]))
+        grad = task.fork_recv_grad(torch.zeros(size) + 1, torch.ones(size[0]))
+        assert torch.all(torch.eq(grad, torch.zeros(size) - 1))
+
+    # both nodes run in this interpreter, no process nor socket involved
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run_branch), executor.submit(run)]
+        for future in futures:
+            future.result(timeout=60)  # re-raise the assertion errors
+
+
+def test_domaintask_group():
+    group = disturb.DomainTaskGroup(name="branches", to_ranks=[1, 2])
+
+    def run(rank, size):
+        os.environ["DAMPED_N_DOMAIN"] = "2"
+        if rank == 0:  # process disturb-ed
+            disturb.init(expected_domain_tasks=2, port=12141)
+            for i in range(3):
+                group.fork_detach(torch.zeros(size) + i, torch.ones(size[0])).wait()
+            disturb.eval(domain_tasks=2)
+            disturb.stop(domain_tasks=2)
+
+        else:  # domain tasks fed with the same tensors
+            utils.init_distributedenv(rank, world_size=3, port=12141)
+            for i in range(3):
+                features, label, _ = utils.fork_recv(rank=0)
+                assert torch.all(torch.eq(features, torch.zeros(size) + i))
+                assert torch.all(torch.eq(label, torch.ones(size[0])))
+            _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            assert is_meta_data and disturb.const.is_eval(meta_data)
+            _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            assert is_meta_data and disturb.const.should_stop(meta_data)
+
+    processes = []
+    for rank in range(3):  # fork multiple processes for testing (single machine)
+        p = Process(target=run, args=(rank, (3, 30, 8)))
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0  # something went wrong!
+
+
+def test_domaintask_replicas():
+    task = disturb.DomainTaskReplicas(name="spk", to_ranks=[1, 2])
+
+    def run(rank, size):
+        os.environ["DAMPED_N_DOMAIN"] = "2"
+        if rank == 0:  # process disturb-ed
+            disturb.init(expected_domain_tasks=2, port=12153)
+            for i in range(4):
+                task.fork_detach(torch.zeros(size) + i, torch.ones(size[0])).wait()
+            assert task.dispatched_forks == {1: 2, 2: 2}
+            disturb.eval(domain_tasks=2)
+            disturb.stop(domain_tasks=2)
+
+        else:  # replicas of the same branch, one fork out of two each
+            utils.init_distributedenv(rank, world_size=3, port=12153)
+            for i in range(rank - 1, 4, 2):
+                features, label, _ = utils.fork_recv(rank=0)
+                assert torch.all(torch.eq(features, torch.zeros(size) + i))
+            _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            assert is_meta_data and disturb.const.is_eval(meta_data)
+            _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            assert is_meta_data and disturb.const.should_stop(meta_data)
+
+    processes = []
+    for rank in range(3):  # fork multiple processes for testing (single machine)
+        p = Process(target=run, args=(rank, (3, 30, 8)))
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0  # something went wrong!
+
+
+def test_domaintask_control_plane():
+    size = (3, 30, 8)
+
+    def run_branch(port, wire_version):
+        utils.init_distributedenv(
+            1, port=port, transport="loopback", wire_version=wire_version
+        )
+        features, _, is_meta_data = utils.fork_recv(rank=0)
+        assert not is_meta_data and torch.all(torch.eq(features, torch.zeros(size)))
+        _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+        assert is_meta_data and disturb.const.is_wait_backward(meta_data)
+        features, _, _ = utils.fork_recv(rank=0)
+        utils.isend(0, -features).wait()
+        _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+        assert is_meta_data and disturb.const.is_no_wait_backward(meta_data)
+        features, _, _ = utils.fork_recv(rank=0)
+        assert torch.all(torch.eq(features, torch.zeros(size) + 2))
+        _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+        assert is_meta_data and disturb.const.is_eval(meta_data)
+        _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+        assert is_meta_data and disturb.const.should_stop(meta_data)
+
+    class Store(object):
+        """Counts the writes to the rendezvous store"""
+
+        def __init__(self, store):
+            self.store = store
+            self.writes = 0
+
+        def set(self, key, value):
+            self.writes += 1
+            return self.store.set(key, value)
+
+        def __getattr__(self, name):
+            return getattr(self.store, name)
+
+    def run(port):
+        utils.init_distributedenv(0, port=port, transport="loopback")
+        context = get_context()
+        context.store = Store(context.store)
+        task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+        task.fork_detach(torch.zeros(size), torch.ones(size[0])).wait()
+        grad = task.fork_recv_grad(torch.zeros(size) + 1, torch.ones(size[0]))
+        assert torch.all(torch.eq(grad, torch.zeros(size) - 1))
+        task.fork_detach(torch.zeros(size) + 2, torch.ones(size[0])).wait()
+        disturb.eval()
+        # the mode switches are carried by the forks, without the store
+        assert context.store.writes == 0
+        disturb.stop()
+
+    # the modes are carried by the headers of the messages (version 3), or
+    # sent in-band to older peers (version 2)
+    for port, wire_version in [(12155, 3), (12157, 2)]:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(run_branch, port, wire_version),
+                executor.submit(run, port),
+            ]
+            for future in futures:
+                future.result(timeout=60)
+
+
+def test_domaintask_credits():
+    task = disturb.DomainTask(
+        name="speaker_identificaion", to_rank=1, credit_policy="drop"
+    )
+    size = (3, 30, 8)
+    forked = threading.Event()
+
+    def run_branch():  # slow domain task trainer granting 2 credits
+        utils.init_distributedenv(1, port=12143, transport="loopback", credits=2)
+        for i in range(2):
+            features, _, _ = utils.fork_recv(rank=0)
+            assert torch.all(torch.eq(features, torch.zeros(size) + i))
+        forked.wait()
+        utils.grant_credits(0)
+        features, _, _ = utils.fork_recv(rank=0)
+        assert torch.all(torch.eq(features, torch.zeros(size) + 5))
+
+    def run():
+        utils.init_distributedenv(0, port=12143, transport="loopback")
+        for i in range(5):
+            task.fork_detach(torch.zeros(size) + i, torch.ones(size[0])).wait()
+        assert task.dropped_forks == 3
+        forked.set()
+
+        task.credit_policy = "block"
+        task.fork_detach(torch.zeros(size) + 5, torch.ones(size[0])).wait()
+        assert task.dropped_forks == 3 and task.delayed_forks <= 1
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run_branch), executor.submit(run)]
+        for future in futures:
+            future.result(timeout=60)
+
+
+def test_domaintask_grad_encoding():
+    task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+    size = (3, 30, 8)
+
+    def run_branch():
+        utils.init_distributedenv(1, port=12147, transport="loopback")
+        _, meta_data, _ = utils.fork_recv(rank=0)
+        assert disturb.const.is_wait_backward(meta_data)
+        features, _, _ = utils.fork_recv(rank=0)
+        utils.isend_zeros(0, features.size()).wait()  # eval: null gradient
+        features, _, _ = utils.fork_recv(rank=0)
+        utils.isend(0, features, codec="topk:0.5").wait()
+
+    def run():
+        utils.init_distributedenv(0, port=12147, transport="loopback")
+        grad = task.fork_recv_grad(torch.ones(size), torch.ones(size[0]))
+        assert torch.equal(grad, torch.zeros(size))
+        features = torch.arange(720, dtype=torch.float32).view(size)
+        grad = task.fork_recv_grad(features, torch.ones(size[0]))
+        assert torch.equal(grad, torch.where(features >= 360, features, 0.0))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run_branch), executor.submit(run)]
+        for future in futures:
+            future.result(timeout=60)
+
+
+def test_domaintask_elastic():
+    size = (3, 30, 8)
+
+    def run_branch(incarnation):
+        utils.init_distributedenv(1, port=12159, transport="elastic")
+        if incarnation == 2:  # the eval mode is replayed to the new trainer
+            _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            assert is_meta_data and disturb.const.is_eval(meta_data)
+        features, _, is_meta_data = utils.fork_recv(rank=0)
+        assert not is_meta_data
+        assert torch.all(torch.eq(features, torch.zeros(size) + incarnation))
+        if incarnation == 2:
+            _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+            assert is_meta_data and disturb.const.should_stop(meta_data)
+
+    def run(absent):
+        utils.init_distributedenv(0, port=12159, transport="elastic")
+        transport = utils.get_transport(1)
+        task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+        # the trainer has not joined yet, the signal and the fork are skipped
+        disturb.train()
+        task.fork_detach(torch.zeros(size), torch.ones(size[0])).wait()
+        assert task.absent_forks == 1
+        absent.set()
+        for incarnation in (1, 2):
+            while transport.generation < incarnation:
+                time.sleep(0.05)
+            task.fork_detach(
+                torch.zeros(size) + incarnation, torch.ones(size[0])
+            ).wait()
+            if incarnation == 1:
+                disturb.eval()
+        disturb.stop()
+
+    absent = Event()
+    master = Process(target=run, args=(absent,))
+    master.start()
+    assert absent.wait(timeout=60)
+    for incarnation in (1, 2):  # the trainer is restarted
+        p = Process(target=run_branch, args=(incarnation,))
+        p.start()
+        p.join()
+        assert p.exitcode == 0  # something went wrong!
+    master.join()
+    assert master.exitcode == 0  # something went wrong!
+
+
+def test_domaintask_async():
+    size = (3, 30, 8)
+
+    async def receive():
+        items = []
+        async for item in utils.ForkReceiver([0]):
+            items.append(item)
+            if isinstance(item, utils.Fork) and len(items) == 6:
+                utils.isend(0, -item.features).wait()
+        return items
+
+    def run_branch():
+        utils.init_distributedenv(1, port=12163, transport="loopback")
+        items = asyncio.run(receive())
+        assert [type(i) for i in items] == [utils.Fork] * 4 + [
+            utils.MetaData,
+            utils.Fork,
+            utils.MetaData,
+        ]
+        assert disturb.const.is_wait_backward(items[4].meta_data)
+        values = sorted(int(i.features[0, 0, 0]) for i in items[:4])
+        assert values == [0, 1, 2, 3]
+
+    async def fork(task):
+        # the forks are in flight concurrently
+        await asyncio.gather(
+            *[
+                task.fork_async(torch.zeros(size) + i, torch.ones(size[0]))
+                for i in range(4)
+            ]
+        )
+        return await task.fork_recv_grad_async(torch.ones(size), torch.ones(size[0]))
+
+    def run():
+        utils.init_distributedenv(0, port=12163, transport="loopback")
+        task = disturb.DomainTask(name="speaker_identificaion", to_rank=1, queue_depth=2)
+        grad = asyncio.run(fork(task))
+        assert torch.all(torch.eq(grad, -torch.ones(size)))
+        disturb.stop()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run_branch), executor.submit(run)]
+        for future in futures:
+            future.result(timeout=60)
+
+
+def test_domaintask_remote_branch():
+    size = (3, 30, 8)
+
+    def run_branch():
+        utils.init_distributedenv(1, port=12165, transport="loopback")
+        for item in utils.ForkReceiver([0]):
+            if isinstance(item, utils.Fork):
+                utils.isend(0, item.features * 10).wait()
+
+    def run():
+        utils.init_distributedenv(0, port=12165, transport="loopback")
+        task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+        x = torch.ones(size, requires_grad=True)
+        # both forks wait for their gradient until backward
+        y1 = nets.RemoteBranch.apply(x * 1, task, torch.ones(size[0]), -1.0)
+        y2 = nets.RemoteBranch.apply(x * 2, task, torch.ones(size[0]), -1.0)
+        assert len(task._pending_grads) == 2
+        (y1 + y2).sum().backward()
+        # d(y1 + y2)/dx = 1 + 2, reversed branch gradients: -10 * (1 + 2 * 2)
+        assert torch.all(torch.eq(x.grad, torch.zeros(size) + 3 - 50))
+        disturb.stop()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run_branch), executor.submit(run)]
+        for future in futures:
+            future.result(timeout=60)
+
+
+def test_domaintask_remote_branch_unrouted(monkeypatch):
+    # a master without domain task: the forks and gradients are skipped
+    monkeypatch.setenv("DAMPED_N_DOMAIN", "0")
+    size = (3, 30, 8)
+    task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+    x = torch.ones(size, requires_grad=True)
+    y = nets.RemoteBranch.apply(x * 2, task, torch.ones(size[0]), -1.0)
+    assert len(task._pending_grads) == 0
+    y.sum().backward()
+    assert torch.all(torch.eq(x.grad, torch.zeros(size) + 2))
+
+
+def test_domaintask_group_grad(monkeypatch):
+    monkeypatch.setenv("DAMPED_N_DOMAIN", "2")
+    size = (3, 30, 8)
+
+    def run_branch(rank, delay):
+        utils.init_distributedenv(rank, world_size=3, port=12167, transport="loopback")
+        send_back_grad = False
+        for item in utils.ForkReceiver([0]):
+            if isinstance(item, utils.MetaData):
+                send_back_grad = disturb.const.is_wait_backward(item.meta_data)
+            elif send_back_grad:
+                time.sleep(delay)
+                utils.isend(0, item.features * rank).wait()
+
+    def run():
+        utils.init_distributedenv(0, world_size=3, port=12167, transport="loopback")
+        group = disturb.DomainTaskGroup(
+            name="branches", to_ranks=[1, 2], grad_weights=[1.0, 0.5]
+        )
+        for i in range(2):
+            grad = group.fork_recv_grad(torch.ones(size) + i, torch.ones(size[0]))
+            # 1 * (1 + i) + 0.5 * 2 * (1 + i)
+            assert torch.all(torch.eq(grad, torch.zeros(size) + 2 * (1 + i)))
+        group.fork_detach(torch.ones(size), torch.ones(size[0])).wait()
+        disturb.stop(domain_tasks=2)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(run),
+            executor.submit(run_branch, 1, 0.2),  # the slow branch answers last
+            executor.submit(run_branch, 2, 0.0),
+        ]
+        for future in futures:
+            future.result(timeout=60)
+
+
+def test_domaintask_chunked():
+    torch.manual_seed(0)
+    features = torch.rand(4, 30, 8)
+    lengths = torch.tensor([30, 12, 0, 7])
+    padded = features * (torch.arange(30).unsqueeze(0) < lengths.unsqueeze(1)).unsqueeze(2)
+
+    def run_branch(port, wire_version):
+        utils.init_distributedenv(
+            1, port=port, transport="loopback", wire_version=wire_version
+        )
+        recv_features, label, _ = utils.fork_recv(rank=0)  # chunks of 2 sequences
+        assert torch.equal(recv_features, features) and label.size() == (4,)
+        recv_features, _, _ = utils.fork_recv(rank=0)  # chunks of 4 frames
+        assert torch.equal(recv_features, features)
+        recv_features, _, _ = utils.fork_recv(rank=0)  # chunks of 31 valid frames
+        assert torch.equal(recv_features, padded)
+        # the sequences longer than a chunk are split along time
+        recv_features, _, _ = utils.fork_recv(rank=0, packed_sequence=True)
+        unpacked, recv_lengths = torch.nn.utils.rnn.pad_packed_sequence(
+            recv_features, batch_first=True, total_length=30
+        )
+        assert torch.equal(unpacked[:2], padded[:2])
+        assert torch.equal(recv_lengths, torch.tensor([30, 12, 1]))
+        recv_features, _, _ = utils.fork_recv(rank=0)  # fp16 codec
+        assert torch.equal(recv_features, features.half().float())
+        utils.isend(0, -features, chunk_bytes=1000).wait()
+        _, meta_data, _ = utils.fork_recv(rank=0)
+        assert disturb.const.should_stop(meta_data)
+
+    def run(port):
+        utils.init_distributedenv(0, port=port, transport="loopback")
+        task = disturb.DomainTask(
+            name="speaker_identificaion", to_rank=1, fused=True, chunk_bytes=2 * 30 * 8 * 4
+        )
+        task.fork_detach(features, torch.ones(4)).wait()
+        task.chunk_bytes = 4 * 4 * 8 * 4
+        task.fork_detach(features, torch.ones(4)).wait()
+        task.chunk_bytes = 1000
+        task.fork_detach(features, torch.ones(4), lengths=lengths).wait()
+        task.chunk_bytes = 4 * 8 * 4
+        task.fork_detach(features[:3], torch.ones(3), lengths=[30, 12, 1]).wait()
+        task.codec = "fp16"
+        task.fork_detach(features, torch.ones(4)).wait()
+        grad, _ = utils.recv(1)
+        assert torch.equal(grad, -features)
+        disturb.stop()
+
+    # peers older than the version 4 are sent the tensors in one piece
+    for port, wire_version in [(12171, 4), (12173, 3)]:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [
+                executor.submit(run, port),
+                executor.submit(run_branch, port, wire_version),
+            ]
+            for future in futures:
+                future.result(timeout=60)
+
+
+def test_domaintask_grad_deadline():
+    size = (3, 30, 8)
+
+    def run_branch():  # stalls on the forks of odd values
+        utils.init_distributedenv(1, port=12177, transport="loopback")
+        send_back_grad = False
+        for item in utils.ForkReceiver([0]):
+            if isinstance(item, utils.MetaData):
+                send_back_grad = disturb.const.is_wait_backward(item.meta_data)
+            elif send_back_grad:
+                if int(item.features[0, 0, 0]) % 2 == 1:
+                    time.sleep(0.5)
+                utils.isend(0, -item.features).wait()
+
+    def run():
+        utils.init_distributedenv(0, port=12177, transport="loopback")
+        task = disturb.DomainTask(
+            name="speaker_identificaion",
+            to_rank=1,
+            grad_deadline=0.1,
+            grad_fallback="last:0.5",
+        )
+        grad = task.fork_recv_grad(torch.ones(size), torch.ones(size[0]))
+        assert torch.all(torch.eq(grad, torch.zeros(size)))  # no last gradient
+        assert task.grad_deadline_misses == 1
+        # the late gradient is drained first
+        grad = task.fork_recv_grad(torch.ones(size) * 2, torch.ones(size[0]), deadline=5)
+        assert torch.all(torch.eq(grad, torch.zeros(size) - 2))
+        assert task.late_grads == 1
+        grad = task.fork_recv_grad(torch.ones(size) * 3, torch.ones(size[0]))
+        assert torch.all(torch.eq(grad, torch.zeros(size) - 1))
+        assert task.grad_deadline_misses == 2
+        disturb.stop()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run), executor.submit(run_branch)]
+        for future in futures:
+            future.result(timeout=60)
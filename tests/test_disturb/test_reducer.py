@@ -0,0 +1,102 @@
+import concurrent.futures
+
+import pytest
+import torch
+from torch.multiprocessing import Process
+
+from damped import utils
+from damped import disturb
+
+
+def test_reducers():
+    x = torch.arange(2 * 5 * 3, dtype=torch.float32).view(2, 5, 3)
+    lengths = torch.tensor([5, 3])
+
+    y, y_lengths = disturb.get_reducer("subsample:2").reduce(x, lengths)
+    assert torch.equal(y, x[:, [0, 2, 4]])
+    assert y_lengths.tolist() == [3, 2]
+
+    # the padding frames are excluded from the mean
+    y, y_lengths = disturb.get_reducer("meanpool:2").reduce(x, lengths)
+    assert y.size() == (2, 3, 3)
+    assert torch.allclose(y[0, 0], (x[0, 0] + x[0, 1]) / 2)
+    assert torch.allclose(y[0, 2], x[0, 4])
+    assert torch.allclose(y[1, 1], x[1, 2])
+    assert y_lengths.tolist() == [3, 2]
+
+    reducer = disturb.get_reducer("projection:2:7")
+    y, _ = reducer.reduce(x, lengths)
+    assert y.size() == (2, 5, 2)
+    assert torch.equal(reducer.matrix(3), disturb.get_reducer("projection:2:7").matrix(3))
+
+    assert str(disturb.get_reducer(None)) == "none"
+    with pytest.raises(ValueError):
+        disturb.get_reducer("subsample")
+
+
+def test_domaintask_reducer():
+    size = (3, 8, 4)
+
+    def run_branch():
+        utils.init_distributedenv(1, port=12169, transport="loopback")
+        features, _, _ = utils.fork_recv(rank=0)
+        assert features.size() == (3, 4, 4)
+        assert utils.peer_reducer(0) == "subsample:2 (50.0% of the features sent)"
+        _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+        assert is_meta_data and disturb.const.is_wait_backward(meta_data)
+        features, _, _ = utils.fork_recv(rank=0)
+        utils.isend(0, torch.ones(features.size())).wait()
+        _, meta_data, is_meta_data = utils.fork_recv(rank=0)
+        assert is_meta_data and disturb.const.should_stop(meta_data)
+
+    def run():
+        utils.init_distributedenv(0, port=12169, transport="loopback")
+        task = disturb.DomainTask(
+            name="speaker_identificaion", to_rank=1, reducer="subsample:2"
+        )
+        task.fork_detach(torch.zeros(size), torch.ones(size[0])).wait()
+        assert task.reduction_bytes_saved == 3 * 4 * 4 * 4
+        # the gradient of the subsampled frames, mapped back to every frame
+        grad = task.fork_recv_grad(torch.zeros(size), torch.ones(size[0]))
+        assert grad.size() == size
+        assert torch.all(torch.eq(grad[:, ::2], 1)) and torch.all(torch.eq(grad[:, 1::2], 0))
+        disturb.stop()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run), executor.submit(run_branch)]
+        for future in futures:
+            future.result(timeout=60)
+
+
+def test_domaintask_reducer_gloo():
+    size = (3, 8, 4)
+
+    def run(rank):
+        # gloo only sends contiguous tensors, the subsampled features are not
+        if rank == 0:
+            utils.init_distributedenv(0, port=12179, transport="gloo")
+            for reducer in ["subsample:2", "meanpool:3", "projection:2"]:
+                task = disturb.DomainTask(
+                    name="speaker_identificaion", to_rank=1, reducer=reducer
+                )
+                task.fork_detach(torch.rand(size), torch.ones(size[0])).wait()
+            task = disturb.DomainTask(
+                name="speaker_identificaion", to_rank=1, reducer="subsample:2", fused=True
+            )
+            task.fork_detach(torch.rand(size), torch.ones(size[0])).wait()
+            return
+
+        utils.init_distributedenv(1, port=12179, transport="gloo")
+        for expected in [(3, 4, 4), (3, 3, 4), (3, 8, 2), (3, 4, 4)]:
+            features, _, _ = utils.fork_recv(rank=0)
+            assert features.size() == expected
+
+    processes = []
+    for rank in range(2):
+        p = Process(target=run, args=(rank,))
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0  # something went wrong!
@@ -0,0 +1,87 @@
+import json
+
+from damped import disturb
+from damped import utils
+import torch
+from torch.multiprocessing import Process
+import pytest
+
+
+def test_topology_routes():
+    topology = disturb.Topology.from_dict(
+        {
+            "producers": [{"name": "asr", "count": 4}],
+            "consumers": [{"name": "spk", "count": 2}, {"name": "gender", "rank": 0}],
+            "routes": {"asr": ["spk", "gender"]},
+        }
+    )
+    assert topology.world_size == 7
+    assert topology.ranks == {"gender": [0], "asr": [1, 2, 3, 4], "spk": [5, 6]}
+    assert topology.destinations(2) == [6, 0]
+    assert topology.route(3, "spk") == 5
+    assert topology.sources(5) == [1, 3]
+    assert topology.sources(0) == [1, 2, 3, 4]
+    assert topology.node(6) == ("spk", 1)
+    assert topology.is_producer(4) and not topology.is_producer(0)
+
+    replicated = disturb.Topology.from_dict(
+        {
+            "producers": [{"name": "asr", "count": 2}],
+            "consumers": [{"name": "spk", "count": 2, "dispatch": "round_robin"}],
+        }
+    )
+    assert replicated.replicas(1, "spk") == [2, 3]
+    assert replicated.destinations(0) == [2, 3]
+    assert replicated.sources(3) == [0, 1]
+    with pytest.raises(ValueError):
+        replicated.route(0, "spk")
+
+    legacy = disturb.Topology.all_to_one(2)
+    assert legacy.rank("master", 1) == 2 and legacy.destinations(2) == [0]
+    assert disturb.Topology.one_to_all(2).destinations(0) == [1, 2]
+
+    with pytest.raises(ValueError):
+        disturb.Topology.from_dict(
+            {"producers": [{"name": "asr", "rank": 2}], "consumers": [{"name": "spk"}]}
+        )
+    with pytest.raises(ValueError):
+        topology.route(1, "unknown")
+
+
+def test_topology_init(tmp_path):
+    path = str(tmp_path / "topology.json")
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "producers": [{"name": "asr", "count": 2}],
+                "consumers": [{"name": "spk", "rank": 0}],
+            },
+            f,
+        )
+    size = (3, 8)
+
+    def run(index):
+        if index is None:  # domain task
+            topology = disturb.Topology.load(path)
+            utils.init_distributedenv(0, world_size=topology.world_size, port=12151)
+            receiver = utils.ForkReceiver(topology.sources(0))
+            ranks = [i.rank for i in receiver if isinstance(i, utils.Fork)]
+            assert sorted(ranks) == [1, 2]
+            return
+
+        disturb.init(topology=path, index=index, port=12151)
+        topology = disturb.get_topology()
+        assert utils.get_transport(0) is not None
+        task = disturb.DomainTask(name="spk", to_rank=topology.route(1 + index, "spk"))
+        task.fork_detach(torch.zeros(size), torch.ones(size[0])).wait()
+        disturb.stop()
+
+    processes = []
+    for index in [None, 0, 1]:
+        p = Process(target=run, args=(index,))
+        p.start()
+        processes.append(p)
+
+    for p in processes:
+        p.join()
+        assert p.exitcode == 0  # something went wrong!
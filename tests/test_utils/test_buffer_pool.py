@@ -0,0 +1,59 @@
+from damped import utils
+import torch
+
+
+def test_buffer_pool_bucket():
+    pool = utils.BufferPool(buckets_per_octave=4)
+    assert pool.bucket(1) == 1
+    assert pool.bucket(1024) == 1024
+    assert pool.bucket(1025) == 1280
+    assert pool.bucket(1000) == 1024
+
+
+def test_buffer_pool_auto_release():
+    pool = utils.BufferPool()
+
+    a = pool.empty([4, 100, 8], torch.float32)
+    assert a.size() == (4, 100, 8)
+    pool.next_batch()
+    # same bucket, the buffer of the previous batch is reused
+    b = pool.empty([4, 99, 8], torch.float32)
+    assert b.data_ptr() == a.data_ptr()
+    assert pool.hits == 1 and pool.misses == 1
+    assert pool.hit_rate == 0.5
+
+    # not released yet: new buffer
+    c = pool.empty([4, 99, 8], torch.float32)
+    assert c.data_ptr() != b.data_ptr()
+    assert pool.bytes_retained == 2 * pool.bucket(4 * 100 * 8) * 4
+
+    # trainer.py sets requires_grad on the received features
+    c.requires_grad = True
+
+
+def test_buffer_pool_explicit_release():
+    pool = utils.BufferPool(auto_release=False, max_bytes=0)
+    a = pool.empty([10], torch.long)
+    pool.next_batch()
+    assert pool.empty([10], torch.long).data_ptr() != a.data_ptr()
+
+    pool.release(a)
+    # max_bytes=0 nothing is kept
+    assert pool.bytes_free == 0
+    assert pool.bytes_retained == pool.bucket(10) * 8
+
+
+def test_buffer_pool_take_batch():
+    pool = utils.BufferPool()
+
+    a = pool.empty([4, 100, 8], torch.float32)
+    batch = pool.take_batch()
+    pool.next_batch()
+    # detached from the auto release: not reused
+    b = pool.empty([4, 100, 8], torch.float32)
+    assert b.data_ptr() != a.data_ptr()
+
+    pool.release_batch(batch)
+    pool.next_batch()
+    c = pool.empty([4, 100, 8], torch.float32)
+    assert pool.hits == 1 and c.data_ptr() in (a.data_ptr(), b.data_ptr())
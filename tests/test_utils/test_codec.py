@@ -7,3 +7,30 @@ def test_init():
     assert 1952805748 == a
     assert torch.tensor(a).int() == a
     assert utils.str_int_encoder.decode(a) == "test"
+
+
+def test_wire_codec():
+    features = torch.randn(4, 50, 16) * 3
+    for name, atol in [("none", 0), ("fp16", 1e-2), ("bf16", 1e-1), ("int8", 0.1)]:
+        codec = utils.get_wire_codec(name)
+        parts, dtypes = codec.encode(features, torch.float32)
+        parts = [p.to(d) for p, d in zip(parts, dtypes)]
+        decoded = codec.decode(parts, torch.float32)
+        assert decoded.dtype == torch.float32
+        assert decoded.size() == features.size()
+        assert torch.allclose(decoded, features, atol=atol)
+        assert utils.get_wire_codec(codec.code) is codec
+
+
+def test_wire_codec_topk():
+    grad = torch.randn(4, 50, 16)
+    codec = utils.get_wire_codec("topk:0.1")
+    parts, dtypes = codec.encode(grad, torch.float32)
+    parts = [p.to(d) for p, d in zip(parts, dtypes)]
+    decoded = codec.decode(parts, torch.float32)
+    assert decoded.size() == grad.size()
+    assert (decoded != 0).sum() == 320  # 10% of the values
+    # the largest values are kept as is
+    kept = grad.abs() >= grad.abs().flatten().kthvalue(grad.numel() - 319)[0]
+    assert torch.equal(decoded[kept], grad[kept])
+    assert utils.get_wire_codec(codec.code).name == "topk"
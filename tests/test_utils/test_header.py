@@ -0,0 +1,78 @@
+from damped.utils import header
+from damped.disturb import const
+import torch
+
+
+def test_header_pack_unpack():
+    h = header.Header(dtype=torch.float16, shape=[30, 300, 80])
+    buff = h.pack()
+    assert buff.size() == (header.HEADER_LEN,)
+
+    decoded = header.Header.unpack(buff)
+    assert decoded.dtype == torch.float16
+    assert decoded.shape == [30, 300, 80]
+    assert decoded.version == header.WIRE_VERSION
+    assert not decoded.is_meta_data
+
+
+def test_header_meta_data():
+    h = header.Header(flags=header.FLAG_META, dtype=torch.int32, meta_data=const.eval_signal())
+    decoded = header.Header.unpack(h.pack())
+    assert decoded.is_meta_data
+    assert const.is_eval(decoded.meta_data)
+    assert not const.should_stop(decoded.meta_data)
+
+
+def test_header_control():
+    h = header.Header(flags=header.FLAG_CONTROL, dtype=torch.int32, seq=7)
+    decoded = header.Header.unpack(h.pack())
+    assert decoded.is_control and not decoded.is_meta_data
+    assert decoded.seq == 7
+    # a data message carrying the control state switched before it
+    h = header.Header(
+        flags=header.FLAG_MODE, shape=[3, 8], meta_data=const.eval_signal(), seq=2
+    )
+    decoded = header.Header.unpack(h.pack())
+    assert decoded.has_mode and not decoded.is_meta_data
+    assert const.is_eval(decoded.meta_data) and decoded.shape == [3, 8]
+
+
+def test_header_bad_magic():
+    buff = header.Header(shape=[1]).pack()
+    buff[header.H_MAGIC] = 0
+    try:
+        header.Header.unpack(buff)
+    except RuntimeError:
+        return
+    assert False, "corrupted header must be detected"
+
+
+def test_header_parts():
+    label = torch.arange(3)
+    features = torch.rand(3, 7, 5)
+    buff = header.pack_parts([label, features], [torch.int64, torch.float16])
+    assert buff.dtype == torch.uint8
+
+    label_view, features_view = header.unpack_parts(buff)
+    assert torch.equal(label_view, label)
+    assert features_view.dtype == torch.float16
+    assert torch.allclose(features_view.float(), features, atol=1e-2)
+    # views into the received buffer
+    assert features_view.data_ptr() - buff.data_ptr() < buff.numel()
+
+
+def test_header_chunked():
+    h = header.Header(
+        flags=header.FLAG_CHUNKED, shape=[4, 3000, 80], chunk_len=250, chunk_dim=1
+    )
+    decoded = header.Header.unpack(h.pack())
+    assert decoded.is_chunked and not decoded.has_parts
+    assert decoded.chunk_len == 250 and decoded.chunk_dim == 1
+
+
+def test_packed_chunks():
+    lengths = torch.tensor([5, 0, 2])
+    chunks = list(header.packed_chunks(lengths, 3))
+    # the first sequence spans two chunks, the empty one is skipped
+    assert chunks == [[(0, 0, 3)], [(0, 3, 5), (2, 0, 1)], [(2, 1, 2)]]
+    assert list(header.packed_chunks(torch.tensor([0, 0]), 3)) == []
@@ -0,0 +1,19 @@
+import os
+
+from damped import utils
+import torch
+
+
+def test_gender_mapper(tmp_path):
+    os.makedirs(tmp_path / "data")
+    os.makedirs(tmp_path / "exp")
+    with open(tmp_path / "data" / "spk2gender", "w") as f:
+        f.write("1089 m\n121 f\n")
+    mapper = utils.gender_mapper(str(tmp_path / "exp"))
+
+    y_mapper = torch.tensor(
+        [utils.str_int_encoder.encode("1089"), utils.str_int_encoder.encode("121")]
+    )
+    assert mapper(y_mapper).tolist() == [1, 0]
+    # raw speaker ids, used as keys by trainer.py eval_store.scp
+    assert mapper(y_mapper, raw=True) == ["1089", "121"]
@@ -0,0 +1,107 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import pytest
+from damped import utils
+from damped import disturb
+import torch
+
+
+def test_fork_receiver():
+    task = disturb.DomainTask(name="speaker_identificaion", to_rank=1)
+    size = (3, 30, 8)
+
+    def run_branch():
+        utils.init_distributedenv(1, port=12145, transport="loopback", credits=1)
+        pool = utils.BufferPool()
+        receiver = utils.ForkReceiver([0], prefetch=2, pool=pool, credits=True)
+        items = []
+        for item in receiver:
+            if isinstance(item, utils.Fork):
+                assert torch.all(torch.eq(item.features, torch.zeros(size) + len(items)))
+                time.sleep(0.1)  # slow consumer, the sender runs out of credits
+            items.append(item)
+
+        assert [type(i) for i in items] == [utils.Fork] * 3 + [utils.MetaData] * 2
+        assert disturb.const.is_eval(items[3].meta_data)
+        assert disturb.const.should_stop(items[4].meta_data)
+        assert pool.hits > 0
+
+    def run():
+        utils.init_distributedenv(0, port=12145, transport="loopback")
+        for i in range(3):  # 1 credit: waits for the consumption of each fork
+            task.fork_detach(torch.zeros(size) + i, torch.ones(size[0]))
+        disturb.eval()
+        disturb.stop()
+        assert task.delayed_forks > 0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run_branch), executor.submit(run)]
+        for future in futures:
+            future.result(timeout=60)
+
+
+def test_fork_receiver_ready_first():
+    size = (2, 4)
+
+    def run_branch():
+        utils.init_distributedenv(0, world_size=3, port=12149, transport="loopback")
+        receiver = utils.ForkReceiver([1, 2])
+        ranks = [item.rank for item in receiver if isinstance(item, utils.Fork)]
+
+        # the slow producer does not stall the fast one
+        assert ranks[:3] == [1, 1, 1]
+        assert sorted(ranks) == [1] * 3 + [2] * 3
+        assert receiver.stats[1].forks == 3 and receiver.stats[2].forks == 3
+        assert receiver.stats[1].stopped and receiver.stats[2].stopped
+
+    def run(rank, delay):
+        utils.init_distributedenv(rank, world_size=3, port=12149, transport="loopback")
+        task = disturb.DomainTask(name="speaker_identificaion", to_rank=0)
+        for i in range(3):
+            time.sleep(delay)
+            task.fork_detach(torch.zeros(size) + i, torch.ones(size[0]))
+        utils.send_meta_data(0, disturb.const.stop_signal())
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        futures = [
+            executor.submit(run_branch),
+            executor.submit(run, 1, 0.0),
+            executor.submit(run, 2, 0.3),
+        ]
+        for future in futures:
+            future.result(timeout=60)
+
+
+def test_fork_receiver_async_cancel():
+    size = (2, 4)
+    cancelled = threading.Event()
+
+    def run_branch():
+        utils.init_distributedenv(1, port=12191, transport="loopback")
+        receiver = utils.ForkReceiver([0])
+
+        async def consume():
+            items = receiver.__aiter__()
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(items.__anext__(), timeout=0.1)
+            await items.aclose()
+
+        asyncio.run(consume())
+        cancelled.set()
+        # the fork received after the cancellation is not lost
+        item = receiver._queue.get(timeout=10)
+        assert isinstance(item, utils.Fork)
+        assert torch.equal(item.features, torch.ones(size))
+
+    def run():
+        utils.init_distributedenv(0, port=12191, transport="loopback")
+        cancelled.wait()
+        utils.isend_fused(1, torch.ones(size[0]), torch.ones(size)).wait()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run_branch), executor.submit(run)]
+        for future in futures:
+            future.result(timeout=60)
@@ -0,0 +1,97 @@
+import concurrent.futures
+
+from damped import utils
+from damped import disturb
+import pytest
+import torch
+
+
+def test_fork_replay(tmp_path):
+    path = str(tmp_path / "spk.rec")
+    size = (3, 30, 8)
+
+    def run_branch():
+        utils.init_distributedenv(1, port=12161, transport="loopback")
+        for _ in utils.ForkReceiver([0]):
+            pass
+
+    def run():
+        utils.init_distributedenv(0, port=12161, transport="loopback")
+        task = disturb.DomainTask(name="speaker_identificaion", to_rank=1, record=path)
+        for i in range(3):
+            task.fork_detach(torch.zeros(size) + i, torch.ones(size[0]) * i)
+        disturb.eval()
+        # the padding is not recorded either
+        task.fork_detach(torch.ones(size), torch.ones(size[0]), lengths=[30, 10, 5])
+        disturb.stop()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run_branch), executor.submit(run)]
+        for future in futures:
+            future.result(timeout=60)
+
+    items = list(utils.ForkReplay(path, dtype=(torch.float32, torch.long)))
+    assert [type(i) for i in items] == [utils.Fork] * 3 + [utils.MetaData] + [
+        utils.Fork,
+        utils.MetaData,
+    ]
+    for i in range(3):
+        assert items[i].rank == 0
+        assert torch.all(torch.eq(items[i].features, torch.zeros(size) + i))
+        assert torch.all(torch.eq(items[i].label, torch.ones(size[0], dtype=torch.long) * i))
+    assert disturb.const.is_eval(items[3].meta_data)
+    assert items[4].features.size() == size
+    assert int(items[4].features.sum()) == (30 + 10 + 5) * 8
+    assert disturb.const.should_stop(items[5].meta_data)
+
+    # the forks of each phase are shuffled, the stop signal ends the last epoch
+    replay = utils.ForkReplay(path, shuffle=True, epochs=2, seed=1)
+    items = list(replay)
+    assert [type(i) for i in items] == (
+        [utils.Fork] * 3 + [utils.MetaData, utils.Fork]
+    ) * 2 + [utils.MetaData]
+    labels = [int(i.label[0]) for i in items[:3] + items[5:8]]
+    assert sorted(labels) == [0, 0, 1, 1, 2, 2]
+    assert not disturb.const.should_stop(items[3].meta_data)
+    assert replay.stats[0].forks == 8 and replay.stats[0].stopped
+
+
+def test_fork_recorder_shared(tmp_path):
+    path = str(tmp_path / "shared.rec")
+    size = (2, 5, 4)
+
+    def run_branch():
+        utils.init_distributedenv(1, port=12193, transport="loopback")
+        for _ in utils.ForkReceiver([0]):
+            pass
+
+    def run():
+        utils.init_distributedenv(0, port=12193, transport="loopback")
+        # both tasks append to the same recording
+        tasks = [
+            disturb.DomainTask(name=name, to_rank=1, record=path)
+            for name in ("speaker", "gender")
+        ]
+        assert tasks[0]._recorder is tasks[1]._recorder
+        for i in range(4):
+            tasks[i % 2].fork_detach(torch.zeros(size) + i, torch.ones(size[0]) * i)
+        disturb.eval()
+        disturb.stop()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run_branch), executor.submit(run)]
+        for future in futures:
+            future.result(timeout=60)
+
+    items = list(utils.ForkReplay(path))
+    assert [type(i) for i in items] == [utils.Fork] * 4 + [utils.MetaData] * 2
+    for i in range(4):
+        assert torch.all(torch.eq(items[i].features, torch.zeros(size) + i))
+        assert torch.all(torch.eq(items[i].label, torch.ones(size[0]) * i))
+
+    with pytest.raises(ValueError):
+        utils.ForkRecorder(path)  # still open, shared through get_recorder
+    recorder = utils.get_recorder(path)
+    recorder.close()
+    assert utils.get_recorder(path) is not recorder
+    utils.get_recorder(path).close()
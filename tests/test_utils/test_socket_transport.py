@@ -0,0 +1,49 @@
+import socket
+
+import torch
+
+from damped.utils.socket_transport import SocketTransport
+
+
+def _connection(server: socket.socket):
+    client = socket.create_connection(server.getsockname())
+    peer, _ = server.accept()
+    peer.settimeout(1)
+    return client, peer
+
+
+def _recv(peer: socket.socket, n: int) -> torch.Tensor:
+    data = b""
+    while len(data) < n * 4:
+        data += peer.recv(n * 4 - len(data))
+    return torch.frombuffer(bytearray(data), dtype=torch.int32)
+
+
+def test_socket_transport_frame():
+    server = socket.create_server(("127.0.0.1", 0))
+    transport = SocketTransport(rank=1, peer=0)
+    client, old_peer = _connection(server)
+    transport.attach(client)
+
+    header = torch.tensor([1, 2, 3], dtype=torch.int32)
+    payload = torch.tensor([4, 5], dtype=torch.int32)
+    with transport.frame():
+        transport.send(header, 0)
+        # the peer reconnects between the header and its payload
+        client, new_peer = _connection(server)
+        transport.attach(client)
+        transport.send(payload, 0)
+
+    assert torch.equal(_recv(old_peer, 3), header)
+    # the new connection does not get a payload without its header
+    transport.send(header, 0)
+    assert torch.equal(_recv(new_peer, 3), header)
+    new_peer.settimeout(0.1)
+    try:
+        data = new_peer.recv(4)
+    except socket.timeout:
+        data = b""
+    assert data == b""
+
+    for s in (client, old_peer, new_peer, server):
+        s.close()
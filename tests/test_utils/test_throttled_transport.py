@@ -0,0 +1,106 @@
+import concurrent.futures
+import socket
+import time
+
+import pytest
+from damped import utils
+from damped.utils import throttled_transport
+from damped.utils.socket_transport import SocketTransport
+import torch
+
+
+def test_link_spec():
+    link = throttled_transport.get_link_spec("8:20")
+    assert link.latency == 20 and link.jitter == 0
+    assert link.transmission_time(10 ** 6) == 1.0
+    assert str(throttled_transport.get_link_spec("100:5:1")) == "100:5:1"
+    try:
+        throttled_transport.get_link_spec("fast")
+    except ValueError:
+        return
+    assert False, "unknown link must be rejected"
+
+
+def test_throttled_transport():
+    size = (25, 1000)  # 100 KB, 0.1 s on a 8 Mbit/s link
+
+    def run_branch():
+        utils.init_distributedenv(1, port=12175, transport="loopback")
+        features, _ = utils.recv(rank=0)
+        utils.isend(0, features).wait()
+
+    def run():
+        utils.init_distributedenv(0, port=12175, transport="loopback", throttle="8:20")
+        transport = utils.get_transport(1)
+        assert isinstance(transport, utils.ThrottledTransport)
+        start = time.perf_counter()
+        req = utils.isend(1, torch.ones(size))
+        assert not req.is_completed()
+        req.wait()
+        elapsed = time.perf_counter() - start
+        assert elapsed >= 0.1 + 0.02
+        # only the messages sent by the throttled node are delayed
+        features, _ = utils.recv(rank=1)
+        assert torch.equal(features, torch.ones(size))
+        assert transport.bytes_sent > 100000
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        futures = [executor.submit(run), executor.submit(run_branch)]
+        for future in futures:
+            future.result(timeout=60)
+
+
+def test_throttled_transport_error():
+    class BrokenTransport(utils.Transport):
+        def __init__(self):
+            self.sent = 0
+
+        def send(self, tensor, dst):
+            self.sent += 1
+            if self.sent == 2:
+                raise RuntimeError("connection reset")
+
+    broken = BrokenTransport()
+    transport = utils.ThrottledTransport(
+        broken, throttled_transport.get_link_spec("0:1")
+    )
+    reqs = [transport.isend(torch.ones(4), 1) for _ in range(3)]
+    assert reqs[0].wait()
+    # the failed message and the ones queued behind it are not sent
+    for req in reqs[1:]:
+        with pytest.raises(RuntimeError, match="connection reset"):
+            req.wait()
+    assert broken.sent == 2
+    with pytest.raises(ConnectionError):
+        transport.isend(torch.ones(4), 1)
+
+
+def test_throttled_transport_frame():
+    server = socket.create_server(("127.0.0.1", 0))
+    inner = SocketTransport(rank=1, peer=0)
+    client = socket.create_connection(server.getsockname())
+    old_peer, _ = server.accept()
+    inner.attach(client)
+    transport = throttled_transport.throttle_transport(inner, "0:200")
+
+    header = torch.tensor([1, 2, 3], dtype=torch.int32)
+    with transport.frame():
+        transport.isend(header, 0)
+        transport.isend(header, 0)
+    time.sleep(0.05)  # the frame is started on the first connection
+    # the peer reconnects before the frame is delivered
+    client = socket.create_connection(server.getsockname())
+    new_peer, _ = server.accept()
+    inner.attach(client)
+    payload = torch.tensor([4, 5], dtype=torch.int32)
+    transport.isend(payload, 0).wait()
+
+    # the new connection does not get the frame started on the previous one
+    new_peer.settimeout(5)
+    data = b""
+    while len(data) < 8:
+        data += new_peer.recv(8 - len(data))
+    assert torch.equal(torch.frombuffer(bytearray(data), dtype=torch.int32), payload)
+
+    for s in (client, old_peer, new_peer, server):
+        s.close()